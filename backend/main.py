@@ -6,8 +6,11 @@ if sys.platform == "win32":
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from contextlib import asynccontextmanager
 from src.core.config import settings
+from src.core.metrics import render_prometheus
+from src.core.timing import ServerTimingMiddleware
 from src.core.database import engine, Base
 from src.api.endpoints import chat
 from src.api.endpoints import files
@@ -21,11 +24,11 @@ async def lifespan(app: FastAPI):
     loop = asyncio.get_running_loop()
 
     # Inicializar Checkpointer (AsyncPostgresSaver)
-    from src.services.agent_service import initialize_checkpointer
+    from src.services.agent_service import get_agent_graph
     from src.services.semantic_router import SemanticRouter
-    from src.services.rag_service import RAGService
     try:
-        await initialize_checkpointer()
+        # Checkpointer + grafo del agente compilado una sola vez por proceso
+        await get_agent_graph()
     except Exception as e:
         print(f"WARNING: Could not initialize checkpointer: {e}. Check your POSTGRES_SERVER and POSTGRES_DB variables.")
 
@@ -38,22 +41,30 @@ async def lifespan(app: FastAPI):
 
     async def prewarm_models():
         print("Pre-warming AI models in background (this might take a few minutes)...")
-        try:
-            from src.services.semantic_router import SemanticRouter
-            from src.services.rag_service import RAGService
-            if settings.SEMANTIC_ROUTER_MODE == "semantic":
-                SemanticRouter()
-            else:
-                print("Skipping SemanticRouter model loading (Keyword mode enabled).")
-            RAGService()     # Carga Reranker y Sparse embeddings
-            print("AI models loaded successfully in background.")
-        except Exception as e:
-            print(f"WARNING: Could not pre-warm AI models: {e}")
+        from src.core.model_registry import get_model_registry
+        hooks = []
+        if settings.SEMANTIC_ROUTER_MODE in ("semantic", "cascade"):
+            # Matriz de anclas en memoria (sincronizada con Qdrant)
+            hooks.append(lambda: SemanticRouter().initialize())
+        # Reintenta lo que falle hasta que todo esté listo (/health/ready sigue en 503 mientras tanto)
+        await get_model_registry().warm_up(*hooks)
+        print("AI models loaded successfully in background.")
 
-    asyncio.create_task(prewarm_models())
+    warmup = asyncio.create_task(prewarm_models())
 
     yield
 
+    warmup.cancel()
+
+    from src.core.qdrant import close_qdrant_client
+    from src.core.openai_client import close_openai_client
+    from src.core.inference import get_inference_executor
+    from src.services.ingestion_jobs import get_ingestion_jobs
+    get_ingestion_jobs().shutdown()
+    await close_qdrant_client()
+    await close_openai_client()
+    get_inference_executor().shutdown()
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
@@ -64,6 +75,21 @@ app = FastAPI(
 async def health_check():
     return {"status": "ok", "message": "Backend is running"}
 
+@app.get("/health/ready")
+async def readiness_check():
+    """503 hasta que los modelos locales estén cargados y calientes (para el load balancer)."""
+    from src.core.model_registry import get_model_registry
+    registry = get_model_registry()
+    ready = registry.ready()
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "warming", "models": registry.status()}
+    )
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
 # Routers
 app.include_router(chat.router, prefix=settings.API_V1_STR, tags=["chat"])
 app.include_router(ingest.router, prefix=f"{settings.API_V1_STR}/ingest", tags=["ingestion"])
@@ -79,8 +105,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
+# Tiempos por etapa en la cabecera Server-Timing (y en /metrics)
+app.add_middleware(ServerTimingMiddleware)
+
 @app.get("/")
 async def root():
     return {"message": "Insurance Copilot V2 API is running", "docs": "/docs"}
@@ -0,0 +1,466 @@
+import argparse
+import asyncio
+import difflib
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+from src.core.config import settings
+from src.core.qdrant import dense_vector_params, search_params
+from src.services.rag_service import RAGService
+from src.services.chunking import chunk_pages, estimate_tokens, get_text_splitter
+from src.services.document_loader import extract_pages
+from src.services.embedding_cache import get_embedding_cache
+from src.services.keyword_matcher import KeywordMatcher
+from src.services.semantic_router import GREETING_ANCHORS, UNSAFE_ANCHORS, SemanticRouter
+
+# Consultas de ejemplo representativas del tráfico real
+SAMPLE_QUERIES = [
+    "¿Cubre robo de espejos?",
+    "deducible Rimac por choque",
+    "¿Qué pasa si manejo ebrio?",
+    "exclusiones de la póliza vehicular Pacífico",
+    "cobertura de auxilio mecánico",
+    "¿Cubre daños por inundación?",
+]
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[idx]
+
+
+def report(name: str, samples: list[float]):
+    print(
+        f"{name:<28} n={len(samples):<4} "
+        f"p50={percentile(samples, 50) * 1000:8.1f}ms "
+        f"p95={percentile(samples, 95) * 1000:8.1f}ms "
+        f"mean={statistics.mean(samples) * 1000:8.1f}ms"
+    )
+
+
+# --- Retrieval ---
+
+async def retrieve_serial(rag: RAGService, queries: list[str], limit: int = 10) -> list[dict]:
+    """Ruta previa: un embedding, un encode BM42 y un query_points por variante."""
+    results_per_query = []
+    for q in queries:
+        dense_vector = await rag.get_embedding(q)
+        sparse_vector = await rag.get_sparse_vector(q) if settings.ENABLE_HYBRID_SEARCH else None
+        request = rag._build_query_request(dense_vector, sparse_vector, limit)
+        results = (await rag.qdrant.query_points(
+            collection_name=rag.collection_name,
+            prefetch=request.prefetch,
+            query=request.query,
+            using=request.using,
+            limit=request.limit,
+            with_payload=request.with_payload,
+        )).points
+        results_per_query.append(results)
+    return rag._merge_results(results_per_query)
+
+
+async def bench_retrieval(args):
+    if not args.with_cache:
+        # Las dos rutas embeben las mismas consultas: con caché la segunda solo mediría aciertos
+        settings.ENABLE_EMBEDDING_CACHE = False
+    rag = RAGService()
+    serial, batched = [], []
+
+    for i in range(args.iterations):
+        query = SAMPLE_QUERIES[i % len(SAMPLE_QUERIES)]
+        # Variantes fijas para no medir la expansión (LLM) en este benchmark
+        queries = [query] + [f"{query} ({n})" for n in range(args.variants - 1)]
+
+        start = time.perf_counter()
+        serial_docs = await retrieve_serial(rag, queries)
+        serial.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        batched_docs = await rag.retrieve_documents(queries)
+        batched.append(time.perf_counter() - start)
+
+        if {d["id"] for d in serial_docs} != {d["id"] for d in batched_docs}:
+            print(f"WARNING: result mismatch for '{query}'")
+
+    report("retrieval serial", serial)
+    report("retrieval batched", batched)
+    print(f"Embedding cache: {get_embedding_cache().stats()}")
+
+
+# --- Event loop ---
+
+async def monitor_loop_lag(samples: list[float], stop: asyncio.Event, interval: float = 0.01):
+    """Mide cuánto se retrasa un sleep corto: retraso = loop bloqueado."""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - start - interval)
+
+
+async def run_with_lag_monitor(search, vector: list[float], concurrency: int, requests: int) -> list[float]:
+    lag, stop = [], asyncio.Event()
+    monitor = asyncio.create_task(monitor_loop_lag(lag, stop))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await search(vector)
+
+    await asyncio.gather(*(one() for _ in range(requests)))
+    stop.set()
+    await monitor
+    return lag
+
+
+async def bench_event_loop(args):
+    rag = RAGService()
+    vector = await rag.get_embedding(SAMPLE_QUERIES[0])
+    sync_client = QdrantClient(url=settings.QDRANT_URL, api_key=settings.QDRANT_API_KEY)
+
+    async def search_sync(v):
+        # Antes: cliente síncrono llamado dentro de una corrutina
+        sync_client.query_points(collection_name=rag.collection_name, query=v, using="dense", limit=10)
+
+    async def search_async(v):
+        await rag.qdrant.query_points(collection_name=rag.collection_name, query=v, using="dense", limit=10)
+
+    report("loop lag sync QdrantClient", await run_with_lag_monitor(search_sync, vector, args.concurrency, args.requests))
+    report("loop lag AsyncQdrantClient", await run_with_lag_monitor(search_async, vector, args.concurrency, args.requests))
+
+
+# --- Fusion ---
+
+async def ground_truth(rag: RAGService, query: str, k: int) -> set:
+    """Referencia: top-k denso exacto (sin HNSW) unido al top-k disperso."""
+    dense = await rag.get_embedding(query)
+    sparse = await rag.get_sparse_vector(query)
+    exact_dense = await rag.qdrant.query_points(
+        collection_name=rag.collection_name, query=dense, using="dense", limit=k,
+        search_params=models.SearchParams(exact=True)
+    )
+    top_sparse = await rag.qdrant.query_points(
+        collection_name=rag.collection_name, query=sparse, using="sparse", limit=k
+    )
+    return {p.id for p in exact_dense.points} | {p.id for p in top_sparse.points}
+
+
+async def bench_fusion(args):
+    rag = RAGService()
+    modes = ["rescore", "rrf", "dbsf"]
+    latencies = {m: [] for m in modes}
+    recalls = {m: [] for m in modes}
+
+    for i in range(args.iterations):
+        query = SAMPLE_QUERIES[i % len(SAMPLE_QUERIES)]
+        truth = await ground_truth(rag, query, args.k)
+        for mode in modes:
+            start = time.perf_counter()
+            docs = await rag.retrieve_documents([query], limit=args.k, fusion=mode)
+            latencies[mode].append(time.perf_counter() - start)
+            recalls[mode].append(len({d["id"] for d in docs} & truth) / len(truth) if truth else 0.0)
+
+    for mode in modes:
+        report(f"fusion {mode}", latencies[mode])
+        print(f"{'':<28} recall@{args.k}={statistics.mean(recalls[mode]):.3f}")
+
+
+# --- Footprint ---
+
+@dataclass
+class FootprintConfig:
+    name: str
+    dimensions: int
+    quantization: str = "none"
+    on_disk: bool = False
+    m: Optional[int] = None
+    ef_construct: Optional[int] = None
+    ef: Optional[int] = None
+
+
+def footprint_configs(dimensions: int, reduced: int) -> list[FootprintConfig]:
+    # La primera es la referencia (float32, dimensiones completas) para el recall
+    return [
+        FootprintConfig("float32", dimensions),
+        FootprintConfig("int8", dimensions, "scalar"),
+        FootprintConfig("binary", dimensions, "binary"),
+        FootprintConfig("int8 on-disk", dimensions, "scalar", on_disk=True),
+        FootprintConfig(f"float32 d={reduced}", reduced),
+        FootprintConfig(f"int8 d={reduced}", reduced, "scalar"),
+        FootprintConfig("int8 m=8 ef=64", dimensions, "scalar", m=8, ef_construct=64, ef=64),
+    ]
+
+
+def estimate_ram_mb(config: FootprintConfig, points: int, payload_bytes: int, on_disk_payload: bool) -> float:
+    """Estimación de RAM: vectores originales (si no van a disco) + cuantizados + grafo HNSW + payload."""
+    vectors = 0 if config.on_disk else points * config.dimensions * 4
+    quantized = {"scalar": points * config.dimensions, "binary": points * math.ceil(config.dimensions / 8)}.get(config.quantization, 0)
+    graph = points * (config.m or 16) * 2 * 4
+    payload = 0 if on_disk_payload else payload_bytes
+    return (vectors + quantized + graph + payload) / (1024 * 1024)
+
+
+async def wait_indexed(client, collection_name: str, timeout: float = 300.0):
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        info = await client.get_collection(collection_name)
+        if info.status == models.CollectionStatus.GREEN:
+            return
+        await asyncio.sleep(0.5)
+    print(f"WARNING: {collection_name} still optimizing after {timeout:.0f}s")
+
+
+async def bench_footprint(args):
+    rag = RAGService()
+    client = rag.qdrant
+    dimensions = settings.EMBEDDING_DIMENSIONS
+    configs = footprint_configs(dimensions, min(args.reduced_dimensions, dimensions))
+
+    # Muestra de la colección real (vectores densos + payload)
+    records, offset = [], None
+    while len(records) < args.points:
+        batch, offset = await client.scroll(
+            collection_name=rag.collection_name, limit=min(256, args.points - len(records)),
+            offset=offset, with_payload=True, with_vectors=["dense"]
+        )
+        records.extend(batch)
+        if offset is None:
+            break
+    if not records:
+        print("No points in the collection. Run scripts/ingest.py first.")
+        return
+    payload_bytes = sum(len(json.dumps(r.payload, ensure_ascii=False).encode("utf-8")) for r in records)
+    query_vectors = await rag.get_embeddings(SAMPLE_QUERIES)
+    print(f"{len(records)} points, {len(SAMPLE_QUERIES)} queries, k={args.k}")
+
+    truth, created = {}, []
+    try:
+        for n, config in enumerate(configs):
+            name = f"{rag.collection_name}_footprint_{n}"
+            params = dense_vector_params(config.dimensions, config.on_disk, config.quantization, config.m, config.ef_construct)
+            # Forzar HNSW aunque la muestra sea pequeña (si no, Qdrant hace full scan)
+            params.hnsw_config = models.HnswConfigDiff(m=config.m, ef_construct=config.ef_construct, full_scan_threshold=10)
+            if await client.collection_exists(name):
+                await client.delete_collection(name)
+            await client.create_collection(
+                collection_name=name,
+                vectors_config={"dense": params},
+                on_disk_payload=args.on_disk_payload,
+                optimizers_config=models.OptimizersConfigDiff(indexing_threshold=1)
+            )
+            created.append(name)
+            for i in range(0, len(records), 256):
+                await client.upsert(collection_name=name, wait=True, points=[
+                    models.PointStruct(id=r.id, vector={"dense": r.vector["dense"][:config.dimensions]}, payload=r.payload)
+                    for r in records[i:i + 256]
+                ])
+            await wait_indexed(client, name)
+
+            latencies, recalls = [], []
+            for _ in range(args.iterations):
+                for q, vector in enumerate(query_vectors):
+                    if n == 0 and q not in truth:
+                        exact = await client.query_points(
+                            collection_name=name, query=vector, using="dense", limit=args.k,
+                            search_params=models.SearchParams(exact=True)
+                        )
+                        truth[q] = {p.id for p in exact.points}
+                    start = time.perf_counter()
+                    response = await client.query_points(
+                        collection_name=name, query=vector[:config.dimensions], using="dense", limit=args.k,
+                        search_params=search_params(config.quantization, config.ef)
+                    )
+                    latencies.append(time.perf_counter() - start)
+                    found = {p.id for p in response.points}
+                    recalls.append(len(found & truth[q]) / len(truth[q]) if truth[q] else 0.0)
+
+            report(config.name, latencies)
+            print(
+                f"{'':<28} recall@{args.k}={statistics.mean(recalls):.3f} "
+                f"ram~{estimate_ram_mb(config, len(records), payload_bytes, args.on_disk_payload):.1f}MB"
+            )
+    finally:
+        if not args.keep:
+            for name in created:
+                await client.delete_collection(name)
+
+
+# --- Chunking ---
+
+def bench_chunking(args):
+    """Chunks y tokens embebidos por documento: splitter por caracteres vs por cláusulas (sin llamar a la API)."""
+    splitters = {kind: get_text_splitter(kind) for kind in ("recursive", "clause")}
+    totals = {kind: [0, 0] for kind in splitters}
+    source_tokens = 0
+
+    print(f"{'document':<60} {'recursive':>18} {'clause':>18}")
+    for root, _, files in os.walk(args.data_dir):
+        for file in sorted(f for f in files if f.lower().endswith(".pdf")):
+            pages = extract_pages(os.path.join(root, file))
+            if not pages:
+                continue
+            source_tokens += sum(estimate_tokens(text) for _, text in pages)
+            cells = []
+            for kind, splitter in splitters.items():
+                chunks = [chunk for chunk, _, _ in chunk_pages(pages, splitter)]
+                tokens = sum(estimate_tokens(chunk) for chunk in chunks)
+                totals[kind][0] += len(chunks)
+                totals[kind][1] += tokens
+                cells.append(f"{len(chunks):>5} ch {tokens:>8} tk")
+            print(f"{file[:60]:<60} {cells[0]:>18} {cells[1]:>18}")
+
+    print(f"\nSource text: ~{source_tokens} tokens")
+    for kind, (chunks, tokens) in totals.items():
+        overhead = (tokens / source_tokens - 1) * 100 if source_tokens else 0.0
+        print(f"{kind:<10} chunks={chunks:<6} tokens embedded={tokens:<8} overlap overhead={overhead:5.1f}%")
+
+
+# --- Keyword router ---
+
+def route_linear(query: str, greetings: list[str], unsafe: list[str]) -> Optional[str]:
+    """Implementación anterior de SemanticRouter._route_keyword (subcadenas + difflib)."""
+    query_lower = query.lower().strip()
+    if any(word in query_lower for word in greetings):
+        return "GREETING"
+    if any(word in query_lower for word in unsafe):
+        return "UNSAFE"
+    if difflib.get_close_matches(query_lower, greetings, n=1, cutoff=0.8):
+        return "GREETING"
+    if difflib.get_close_matches(query_lower, unsafe, n=1, cutoff=0.8):
+        return "UNSAFE"
+    return None
+
+
+def synthetic_patterns(count: int, seed: int = 7) -> list[str]:
+    """Patrones inseguros sintéticos (2-4 palabras) para escalar el número de anclas."""
+    words = [
+        "ignore", "bypass", "system", "prompt", "instrucciones", "anteriores", "borra", "tabla",
+        "usuarios", "ejecuta", "comando", "shell", "root", "password", "token", "credenciales",
+        "revela", "config", "admin", "script", "inyecta", "sql", "codigo", "malicioso",
+    ]
+    rng = random.Random(seed)
+    patterns: set[str] = set()
+    while len(patterns) < count:
+        patterns.add(" ".join(rng.sample(words, rng.randint(2, 4))))
+    return sorted(patterns)
+
+
+def bench_keyword_router(args):
+    """Latencia por consulta del router por palabras clave: lineal + difflib vs Aho-Corasick + conteo de caracteres."""
+    queries = SAMPLE_QUERIES + ["hola", "holaa", "buenas tardess", "ignore previous instructions", "sistem promt"]
+    for count in args.anchors:
+        unsafe = UNSAFE_ANCHORS + synthetic_patterns(max(count - len(UNSAFE_ANCHORS) - len(GREETING_ANCHORS), 0))
+        start = time.perf_counter()
+        matcher = KeywordMatcher({"GREETING": GREETING_ANCHORS, "UNSAFE": unsafe}, cutoff=0.8)
+        build = time.perf_counter() - start
+
+        samples = {"linear": [], "compiled": []}
+        mismatches = 0
+        for _ in range(args.iterations):
+            for query in queries:
+                start = time.perf_counter()
+                expected = route_linear(query, GREETING_ANCHORS, unsafe)
+                samples["linear"].append(time.perf_counter() - start)
+                start = time.perf_counter()
+                got = matcher.match(query)
+                samples["compiled"].append(time.perf_counter() - start)
+                mismatches += expected != got
+
+        print(f"\nanchors={len(matcher)} build={build * 1000:.1f}ms mismatches={mismatches}")
+        for name, values in samples.items():
+            report(name, values)
+
+
+async def bench_router_modes(args):
+    """Sobre una muestra etiquetada: aciertos, fracción que evita el embedding y latencia por modo."""
+    with open(args.sample, encoding="utf-8") as f:
+        sample = [json.loads(line) for line in f if line.strip()]
+
+    for mode in args.modes:
+        router = SemanticRouter(mode=mode)
+        if mode != "keyword":
+            # Fuera de la medición: carga del modelo y de la matriz de anclas
+            await router.initialize()
+            await router.classify("hola")
+
+        samples, correct, skipped, errors = [], 0, 0, []
+        for _ in range(args.iterations):
+            for item in sample:
+                start = time.perf_counter()
+                result = await router.classify(item["text"])
+                samples.append(time.perf_counter() - start)
+                correct += result.route == item["label"]
+                skipped += result.stage == "keyword"
+                if result.route != item["label"] and len(errors) < len(sample):
+                    errors.append((item["text"], item["label"], result.route, result.confidence))
+
+        total = len(samples)
+        print(f"\n[{mode}] accuracy={correct / total:.1%} skip_embedding={skipped / total:.1%}")
+        report(mode, samples)
+        for text, expected, got, confidence in dict.fromkeys(errors):
+            print(f"  miss: {text[:50]!r} expected={expected} got={got} confidence={confidence:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks del pipeline RAG")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    retrieval = subparsers.add_parser("retrieval", help="Retrieval serial vs batched")
+    retrieval.add_argument("--iterations", type=int, default=30)
+    retrieval.add_argument("--variants", type=int, default=4)
+    retrieval.add_argument("--with-cache", action="store_true", help="Usar el caché de embeddings (por defecto se desactiva)")
+    retrieval.set_defaults(func=bench_retrieval)
+
+    event_loop = subparsers.add_parser("event-loop", help="Lag del event loop: Qdrant síncrono vs asíncrono")
+    event_loop.add_argument("--concurrency", type=int, default=16)
+    event_loop.add_argument("--requests", type=int, default=200)
+    event_loop.set_defaults(func=bench_event_loop)
+
+    fusion = subparsers.add_parser("fusion", help="Recall y latencia: rescore vs RRF vs DBSF")
+    fusion.add_argument("--iterations", type=int, default=30)
+    fusion.add_argument("-k", type=int, default=10)
+    fusion.set_defaults(func=bench_fusion)
+
+    footprint = subparsers.add_parser("footprint", help="RAM estimada, recall y latencia: cuantización, dimensiones, on-disk, HNSW")
+    footprint.add_argument("--points", type=int, default=5000, help="Puntos de la colección real a copiar")
+    footprint.add_argument("--iterations", type=int, default=10)
+    footprint.add_argument("--reduced-dimensions", type=int, default=512)
+    footprint.add_argument("--on-disk-payload", action="store_true")
+    footprint.add_argument("--keep", action="store_true", help="No borrar las colecciones temporales")
+    footprint.add_argument("-k", type=int, default=10)
+    footprint.set_defaults(func=bench_footprint)
+
+    chunking = subparsers.add_parser("chunking", help="Chunks y tokens por documento: splitter recursivo vs por cláusulas")
+    chunking.add_argument("--data-dir", default=os.path.abspath(os.path.join(os.path.dirname(__file__), '../data')))
+    chunking.set_defaults(func=bench_chunking)
+
+    keyword_router = subparsers.add_parser("keyword-router", help="Router por palabras clave: lineal + difflib vs Aho-Corasick + conteo de caracteres")
+    keyword_router.add_argument("--anchors", type=int, nargs="+", default=[22, 100, 1000, 5000])
+    keyword_router.add_argument("--iterations", type=int, default=20)
+    keyword_router.set_defaults(func=bench_keyword_router)
+
+    router_modes = subparsers.add_parser("router-modes", help="Router keyword vs cascade vs semantic sobre una muestra etiquetada")
+    router_modes.add_argument("--sample", default=os.path.join(os.path.dirname(__file__), "router_sample.jsonl"), help="JSONL con text y label (GREETING, UNSAFE o null)")
+    router_modes.add_argument("--modes", nargs="+", default=["keyword", "cascade", "semantic"])
+    router_modes.add_argument("--iterations", type=int, default=5)
+    router_modes.set_defaults(func=bench_router_modes)
+
+    args = parser.parse_args()
+    result = args.func(args)
+    if asyncio.iscoroutine(result):
+        asyncio.run(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,104 +1,359 @@
+import argparse
 import asyncio
+import hashlib
+import json
+import multiprocessing
 import os
 import sys
-from pypdf import PdfReader
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Optional
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
 
-from src.services.ingestion_service import IngestionService
+from src.services.ingestion_service import DocumentChunks, IngestionService
+from src.services.document_loader import build_metadata, extract_pages
+from src.core.qdrant import close_qdrant_client
+from src.services.embedding_cache import get_embedding_cache
+from src.core.config import settings
 
 # Ruta a la carpeta de datos
 DATA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../data'))
 
-async def process_pdf(file_path: str, ingestion_service: IngestionService, insurer_folder: str):
-    filename = os.path.basename(file_path)
-    print(f"Processing ({insurer_folder}): {filename}...")
-    
-    # Extracción de Texto
-    try:
-        reader = PdfReader(file_path)
-        full_text = ""
-        for page in reader.pages:
-            text = page.extract_text()
-            if text:
-                full_text += text + "\n"
-    except Exception as e:
-        print(f"Error reading PDF {filename}: {e}")
-        return
+# Marca de fin de cola
+_DONE = None
 
-    if not full_text.strip():
-        print(f"Warning: No text extracted from {filename}")
-        return
-    
-    # Inferir metadatos del nombre de archivo: [ASEGURADORA]_[RAMO]_[AÑO]_[TIPO_DOC]_[DESCRIPCION].pdf
-    # Ejemplo: Rimac_Vehicular_2026_Clausula Adicional_Auxilio Mecánico para Vehículos.pdf
-    filename_clean = filename.replace(".pdf", "")
-    parts = filename_clean.split("_")
-    
-    # Valores por defecto
-    insurer = insurer_folder.capitalize()
-    insurance_line = "Desconocido"
-    year = "Desconocido"
-    document_type = "Desconocido"
-    description = "Desconocido"
-    
-    if len(parts) >= 5:
-        insurer = parts[0]
-        insurance_line = parts[1]
-        year = parts[2]
-        document_type = parts[3]
-        description = "_".join(parts[4:])
-    elif len(parts) == 4:
-        # Fallback para casos con 4 partes
-        insurer = parts[0]
-        insurance_line = parts[1]
-        year = parts[2]
-        document_type = parts[3]
-        description = "-"
-    else:
-        print(f"Error: Filename {filename} no tiene el formato correcto.")
-        return
-    
-    # Construir metadatos extendidos
-    metadata = {
-        "source_file": filename,
-        "insurer": insurer,
-        "insurance_line": insurance_line,
-        "year": year,
-        "document_type": document_type,
-        "description": description,
-        "file_path": file_path
-    }
-    
-    # Ingestar usando el servicio
-    try:
-        # Nota: process_document ya hace chunking y embedding
-        chunks_indexed = await ingestion_service.process_document(full_text, metadata)
-        print(f"Successfully indexed {chunks_indexed} chunks for {filename}")
-    except Exception as e:
-        print(f"Error indexing {filename}: {e}")
-
-async def main():
-    if not os.path.exists(DATA_DIR):
-        print(f"Directory {DATA_DIR} not found.")
-        return
 
-    print(f"Ingesting from: {DATA_DIR}")
-    
-    ingestion_service = IngestionService()
-    
+def file_sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(path: str) -> dict:
+    """Manifest: {ruta relativa: {"sha256", "source_file", "chunks"}} de la última ingesta."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(path: str, manifest: dict):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def discover_pdfs(data_dir: str) -> list[tuple[str, str]]:
+    found = []
     # Recorrer subcarpetas (rimac, pacifico, etc)
-    for root, dirs, files in os.walk(DATA_DIR):
-        for file in files:
+    for root, dirs, files in os.walk(data_dir):
+        for file in sorted(files):
             if file.lower().endswith(".pdf"):
                 # El nombre de la carpeta padre es la aseguradora
                 insurer_folder = os.path.basename(root)
-                
-                if insurer_folder == "data": 
+
+                if insurer_folder == "data":
                     insurer_folder = "Genérico"
-                
-                file_path = os.path.join(root, file)
-                await process_pdf(file_path, ingestion_service, insurer_folder)
+
+                found.append((os.path.join(root, file), insurer_folder))
+    return found
+
+
+@dataclass
+class FileReport:
+    filename: str
+    status: str = "pending"
+    chunks: int = 0
+    upserted: int = 0
+    deleted: int = 0
+    shared: int = 0
+    sha256: Optional[str] = None
+    extract_seconds: float = 0.0
+    embed_seconds: float = 0.0
+    error: Optional[str] = None
+
+
+@dataclass
+class StageStats:
+    name: str
+    items: int = 0
+    units: int = 0
+    busy_seconds: float = 0.0
+    unit_name: str = "files"
+
+    def line(self, wall_seconds: float) -> str:
+        rate = self.units / wall_seconds if wall_seconds else 0.0
+        return f"  {self.name:<8} {self.items:>5} files  {self.units:>7} {self.unit_name:<7} busy={self.busy_seconds:8.1f}s  {rate:8.1f} {self.unit_name}/s"
+
+
+@dataclass
+class Pipeline:
+    """
+    extracción (procesos) -> chunking + embeddings (workers async) -> upserts por lotes.
+    Las etapas se conectan con colas acotadas para que la memoria no crezca con el corpus:
+    el texto de a lo sumo extract_workers + queue_size + embed_workers documentos, y de
+    cada documento en embedding solo un lote de INGEST_CHUNK_BATCH_SIZE chunks con sus vectores.
+    """
+    ingestion_service: IngestionService
+    extract_workers: int
+    embed_workers: int
+    upsert_batch_size: int
+    queue_size: int
+    data_dir: str = DATA_DIR
+    manifest: dict = field(default_factory=dict)
+    incremental: bool = True
+    reports: dict = field(default_factory=dict)
+    stats: dict = field(default_factory=dict)
+
+    def __post_init__(self):
+        self.stats = {
+            "extract": StageStats("extract", unit_name="files"),
+            "embed": StageStats("embed", unit_name="chunks"),
+            "upsert": StageStats("upsert", unit_name="points"),
+        }
+
+    async def _extract_worker(self, pool: ProcessPoolExecutor, files: asyncio.Queue, out: asyncio.Queue):
+        # Un número fijo de extractores: como mucho extract_workers documentos extraídos esperan lugar en `out`
+        while True:
+            item = await files.get()
+            if item is _DONE:
+                return
+            await self._extract(pool, *item, out)
+
+    async def _extract(self, pool: ProcessPoolExecutor, file_path: str, insurer_folder: str, out: asyncio.Queue):
+        report = self.reports[file_path]
+        # Ruta absoluta en el payload: se puede abrir sin importar desde dónde se corrió el script
+        metadata = build_metadata(os.path.abspath(file_path), insurer_folder)
+        if metadata is None:
+            report.status, report.error = "skipped", "Filename no tiene el formato correcto"
+            return
+
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        try:
+            report.sha256 = await loop.run_in_executor(pool, file_sha256, file_path)
+            previous = self.manifest.get(os.path.relpath(file_path, self.data_dir))
+            if self.incremental and previous and previous["sha256"] == report.sha256:
+                report.status, report.chunks = "unchanged", previous.get("chunks", 0)
+                return
+            pages = await loop.run_in_executor(pool, extract_pages, file_path)
+        except Exception as e:
+            report.status, report.error = "failed", f"Error reading PDF: {e}"
+            return
+        finally:
+            report.extract_seconds = time.perf_counter() - start
+            self.stats["extract"].busy_seconds += report.extract_seconds
+
+        self.stats["extract"].items += 1
+        self.stats["extract"].units += 1
+        if not any(text.strip() for _, text in pages):
+            report.status, report.error = "skipped", "No text extracted"
+            return
+
+        # put() bloquea si los embedders van atrasados (backpressure)
+        await out.put((file_path, pages, metadata))
+
+    async def _embed_worker(self, inp: asyncio.Queue, out: asyncio.Queue):
+        while True:
+            item = await inp.get()
+            if item is _DONE:
+                return
+            file_path, pages, metadata = item
+            report = self.reports[file_path]
+            document = DocumentChunks()
+            busy, start = 0.0, time.perf_counter()
+            try:
+                # Solo se embeben los chunks nuevos; los que ya no existen se borran
+                existing_ids = await self.ingestion_service.get_point_ids(metadata["source_file"])
+                batches = self.ingestion_service.iter_point_batches(
+                    pages, metadata, document, skip_ids=existing_ids if self.incremental else None
+                )
+                # Cada lote pasa al upserter apenas está listo: un documento nunca tiene todos sus vectores en memoria
+                async for points in batches:
+                    busy += time.perf_counter() - start
+                    self.stats["embed"].units += len(points)
+                    await out.put((file_path, points, None, None))
+                    start = time.perf_counter()
+                busy += time.perf_counter() - start
+                report.chunks = len(document.chunk_ids)
+                report.shared = len(document.references)
+            except Exception as e:
+                busy += time.perf_counter() - start
+                report.status, report.error = "failed", f"Error indexing: {e}"
+                continue
+            finally:
+                report.embed_seconds = busy
+                self.stats["embed"].busy_seconds += busy
+            self.stats["embed"].items += 1
+            # Fin del documento: referencias y obsoletos, una vez escritos todos sus lotes
+            await out.put((file_path, [], existing_ids - document.chunk_ids, document.references))
+
+    async def _upsert_worker(self, inp: asyncio.Queue):
+        batch, batch_files = [], {}
+
+        async def flush():
+            if not batch:
+                return
+            start = time.perf_counter()
+            try:
+                await self.ingestion_service.upsert_points(batch)
+                for path, count in batch_files.items():
+                    self.reports[path].upserted += count
+            except Exception as e:
+                for path in batch_files:
+                    self.reports[path].status, self.reports[path].error = "failed", f"Error upserting: {e}"
+            self.stats["upsert"].busy_seconds += time.perf_counter() - start
+            self.stats["upsert"].units += len(batch)
+            batch.clear()
+            batch_files.clear()
+
+        while True:
+            item = await inp.get()
+            if item is _DONE:
+                await flush()
+                return
+            file_path, points, stale_ids, references = item
+            for point in points:
+                batch.append(point)
+                batch_files[file_path] = batch_files.get(file_path, 0) + 1
+                if len(batch) >= self.upsert_batch_size:
+                    await flush()
+            if stale_ids is None:
+                # Quedan lotes del documento
+                continue
+
+            self.stats["upsert"].items += 1
+            if stale_ids or references:
+                # Primero se escriben los chunks nuevos, luego referencias y obsoletos
+                await flush()
+                report = self.reports[file_path]
+                if report.status == "failed":
+                    # Algún upsert del archivo falló: se conservan los chunks anteriores
+                    continue
+                try:
+                    await self.ingestion_service.add_references(references)
+                    await self.ingestion_service.detach_points(report.filename, list(stale_ids))
+                    report.deleted += len(stale_ids)
+                except Exception as e:
+                    report.status, report.error = "failed", f"Error updating shared/stale chunks: {e}"
+
+    async def run(self, files: list[tuple[str, str]]):
+        for file_path, _ in files:
+            self.reports[file_path] = FileReport(os.path.basename(file_path))
+
+        pending: asyncio.Queue = asyncio.Queue()
+        for item in files:
+            pending.put_nowait(item)
+        texts: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        points: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+
+        # spawn: fork copiaría el estado ya cargado (ONNX, clientes httpx) a los procesos hijos
+        with ProcessPoolExecutor(max_workers=self.extract_workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            embedders = [asyncio.create_task(self._embed_worker(texts, points)) for _ in range(self.embed_workers)]
+            upserter = asyncio.create_task(self._upsert_worker(points))
+
+            extractors = [asyncio.create_task(self._extract_worker(pool, pending, texts)) for _ in range(self.extract_workers)]
+            for _ in extractors:
+                pending.put_nowait(_DONE)
+            await asyncio.gather(*extractors)
+            for _ in embedders:
+                await texts.put(_DONE)
+            await asyncio.gather(*embedders)
+            await points.put(_DONE)
+            await upserter
+
+        for file_path, report in self.reports.items():
+            if report.status == "pending":
+                report.status = "indexed"
+            if report.status == "indexed":
+                self.manifest[os.path.relpath(file_path, self.data_dir)] = {
+                    "sha256": report.sha256,
+                    "source_file": report.filename,
+                    "chunks": report.chunks
+                }
+
+    async def remove_deleted(self, files: list[tuple[str, str]]):
+        """Borra de Qdrant los archivos del manifest que ya no están en el corpus."""
+        present = {os.path.relpath(file_path, self.data_dir) for file_path, _ in files}
+        for rel_path in [p for p in self.manifest if p not in present]:
+            entry = self.manifest[rel_path]
+            report = FileReport(entry["source_file"], status="deleted", deleted=entry.get("chunks", 0))
+            try:
+                await self.ingestion_service.delete_document(entry["source_file"])
+                del self.manifest[rel_path]
+            except Exception as e:
+                report.status, report.error = "failed", f"Error deleting document: {e}"
+            self.reports[rel_path] = report
+
+
+def print_summary(pipeline: Pipeline, wall_seconds: float):
+    print("\nPer-file summary:")
+    for report in pipeline.reports.values():
+        line = (
+            f"  [{report.status:<9}] {report.filename}: {report.chunks} chunks, "
+            f"+{report.upserted} / -{report.deleted} / ={report.shared} shared (extract {report.extract_seconds:.1f}s, embed {report.embed_seconds:.1f}s)"
+        )
+        if report.error:
+            line += f" - {report.error}"
+        print(line)
+
+    print(f"\nStage throughput (wall {wall_seconds:.1f}s):")
+    for stats in pipeline.stats.values():
+        print(stats.line(wall_seconds))
+
+    total_chunks = sum(r.upserted for r in pipeline.reports.values())
+    if wall_seconds:
+        print(f"Indexed {total_chunks} chunks in {wall_seconds:.1f}s ({total_chunks / wall_seconds:.1f} chunks/s)")
+
+
+async def main(args):
+    if not os.path.exists(args.data_dir):
+        print(f"Directory {args.data_dir} not found.")
+        return
+
+    print(f"Ingesting from: {args.data_dir}")
+
+    ingestion_service = IngestionService()
+    await ingestion_service.initialize()
+    if args.apply_collection_config:
+        await ingestion_service.apply_collection_config()
+        print("Collection config updated (quantization, HNSW, on-disk storage).")
+
+    files = discover_pdfs(args.data_dir)
+    pipeline = Pipeline(
+        ingestion_service=ingestion_service,
+        extract_workers=args.extract_workers,
+        embed_workers=args.embed_workers,
+        upsert_batch_size=args.upsert_batch_size,
+        queue_size=args.queue_size,
+        data_dir=args.data_dir,
+        manifest=load_manifest(args.manifest),
+        incremental=not args.full
+    )
+
+    start = time.perf_counter()
+    await pipeline.run(files)
+    await pipeline.remove_deleted(files)
+    save_manifest(args.manifest, pipeline.manifest)
+    print_summary(pipeline, time.perf_counter() - start)
+
+    print(f"Embedding cache: {get_embedding_cache().stats()}")
+    await close_qdrant_client()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Ingesta de PDFs de pólizas en Qdrant")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--extract-workers", type=int, default=max(1, (os.cpu_count() or 2) // 2), help="Procesos para extraer texto de los PDFs")
+    parser.add_argument("--embed-workers", type=int, default=4, help="Documentos embebiéndose a la vez")
+    parser.add_argument("--upsert-batch-size", type=int, default=256, help="Puntos por upsert a Qdrant")
+    parser.add_argument("--queue-size", type=int, default=8, help="Documentos (o lotes de puntos) en espera entre etapas")
+    parser.add_argument("--manifest", default=settings.INGEST_MANIFEST_PATH, help="Hashes de los archivos ya ingestados")
+    parser.add_argument("--full", action="store_true", help="Reprocesa todos los archivos aunque no hayan cambiado")
+    parser.add_argument("--apply-collection-config", action="store_true", help="Aplica QDRANT_QUANTIZATION / HNSW / ON_DISK a la colección existente")
+    asyncio.run(main(parser.parse_args()))
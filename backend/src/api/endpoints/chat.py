@@ -1,11 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, Body
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
+import json
 
 from ...core.database import get_db
 from ...domain.schemas import ChatRequest, ChatResponse, QuoteRequest, QuoteResponse, ThreadResponse, ThreadCreate, ThreadUpdate, MessageResponse
 from ...services.agent_service import AgentService, QuoteService
 from ...services.chat_service import ChatService
+from ...core.inference import InferenceQueueFull
 from ..deps import get_current_user
 from ...domain.models import User
 
@@ -25,9 +28,34 @@ async def chat_endpoint(request: ChatRequest, db: AsyncSession = Depends(get_db)
             thread_id=result["thread_id"],
             sources=result.get("sources", [])
         )
+    except InferenceQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@router.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest, db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_user)):
+    """
+    Igual que /chat pero en Server-Sent Events: tool_start, token, sources y done.
+    """
+    agent_service = AgentService(db)
+
+    async def event_stream():
+        try:
+            async for event, data in agent_service.stream_query(request.message, current_user.id, request.thread_id):
+                yield _sse(event, data)
+        except Exception as e:
+            yield _sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # --- Thread Management ---
 
 @router.get("/threads", response_model=List[ThreadResponse])
@@ -0,0 +1,93 @@
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from typing import List, Optional
+import asyncio
+import os
+import uuid
+
+from ...core.config import settings
+from ...domain.schemas import IngestJobResponse
+from ...services.document_loader import build_metadata
+from ...services.ingestion_jobs import get_ingestion_jobs
+from ..deps import get_current_user
+from ...domain.models import User
+
+router = APIRouter()
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+def _save_upload(upload: UploadFile, dest: str):
+    """Copia por bloques el archivo (ya en un SpooledTemporaryFile) al directorio de uploads."""
+    max_bytes = settings.INGEST_MAX_UPLOAD_MB * 1024 * 1024
+    size = 0
+    upload.file.seek(0)
+    with open(dest, "wb") as out:
+        while block := upload.file.read(1024 * 1024):
+            size += len(block)
+            if size > max_bytes:
+                raise UploadTooLarge(f"{upload.filename} exceeds {settings.INGEST_MAX_UPLOAD_MB} MB")
+            out.write(block)
+
+
+@router.post("", response_model=List[IngestJobResponse], status_code=202)
+async def upload_documents(
+    files: List[UploadFile] = File(...),
+    insurer: Optional[str] = Form(None),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Encola la ingesta de uno o varios PDFs y responde de inmediato con los jobs.
+    El nombre de archivo sigue el formato de scripts/ingest.py: [ASEGURADORA]_[RAMO]_[AÑO]_[TIPO_DOC]_[DESCRIPCION].pdf
+    `insurer`, si se envía, reemplaza la aseguradora del nombre de archivo.
+    Si algún archivo no es válido o supera el tamaño máximo no se encola ninguno.
+    """
+    uploads = []
+    for upload in files:
+        filename = os.path.basename(upload.filename or "")
+        metadata = build_metadata(filename, insurer or "Genérico") if filename.lower().endswith(".pdf") else None
+        if metadata is None:
+            raise HTTPException(status_code=400, detail=f"Invalid PDF filename: {filename or '(empty)'}")
+        if insurer:
+            metadata["insurer"] = insurer
+        uploads.append((upload, metadata))
+
+    # Primero se guardan (y se validan) todos los archivos; recién entonces se encolan
+    os.makedirs(settings.INGEST_UPLOAD_DIR, exist_ok=True)
+    saved = []
+    try:
+        for upload, metadata in uploads:
+            # El PDF se conserva después de la ingesta: `file_path` del payload apunta a él
+            dest = os.path.abspath(os.path.join(settings.INGEST_UPLOAD_DIR, f"{uuid.uuid4().hex}_{metadata['source_file']}"))
+            metadata["file_path"] = dest
+            saved.append((dest, metadata))
+            await asyncio.to_thread(_save_upload, upload, dest)
+    except Exception as e:
+        for dest, _ in saved:
+            try:
+                os.remove(dest)
+            except OSError:
+                pass
+        if isinstance(e, UploadTooLarge):
+            raise HTTPException(status_code=413, detail=str(e))
+        raise
+    finally:
+        for upload, _ in uploads:
+            await upload.close()
+
+    jobs = get_ingestion_jobs()
+    return [jobs.submit(dest, metadata).to_dict() for dest, metadata in saved]
+
+
+@router.get("/jobs", response_model=List[IngestJobResponse])
+async def list_jobs(current_user: User = Depends(get_current_user)):
+    return [job.to_dict() for job in get_ingestion_jobs().jobs()]
+
+
+@router.get("/jobs/{job_id}", response_model=IngestJobResponse)
+async def get_job(job_id: str, current_user: User = Depends(get_current_user)):
+    job = get_ingestion_jobs().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
@@ -16,21 +16,105 @@ class Settings(BaseSettings):
     # QDRANT
     QDRANT_URL: str = "http://localhost:6333"
     QDRANT_API_KEY: Optional[str] = None
+    QDRANT_PREFER_GRPC: bool = False # gRPC: payloads más pequeños que REST/JSON
+    QDRANT_GRPC_PORT: int = 6334
+    QDRANT_POOL_SIZE: Optional[int] = None
+    # Footprint de la colección de pólizas (se aplica al crearla o con scripts/ingest.py --apply-collection-config)
+    QDRANT_QUANTIZATION: str = "none" # "none", "scalar" (int8) o "binary"
+    QDRANT_QUANTIZATION_ALWAYS_RAM: bool = True # Vectores cuantizados en RAM aunque los originales estén en disco
+    QDRANT_QUANTIZATION_RESCORE: bool = True # Re-puntúa los candidatos con los vectores originales
+    QDRANT_QUANTIZATION_OVERSAMPLING: float = 2.0
+    QDRANT_ON_DISK_VECTORS: bool = False
+    QDRANT_ON_DISK_PAYLOAD: bool = False
+    QDRANT_HNSW_M: Optional[int] = None # None = default de Qdrant (16)
+    QDRANT_HNSW_EF_CONSTRUCT: Optional[int] = None # None = default de Qdrant (100)
+    QDRANT_HNSW_EF: Optional[int] = None # ef de búsqueda; None = default de Qdrant
     QDRANT_COLLECTION_NAME: str = "policies"
     QDRANT_SEMANTIC_COLLECTION_NAME: str = "semantic_guardrails"
-    SEMANTIC_ROUTER_MODE: str = "keyword" # "semantic" o "keyword"
+    SEMANTIC_ROUTER_MODE: str = "keyword" # "semantic", "keyword" o "cascade" (keyword primero, embeddings solo si es ambiguo)
+    ROUTER_CASCADE_MAX_WORDS: int = 6 # Cascade: mensajes de hasta N palabras sin coincidencia clara se confirman con embeddings
+    ROUTER_CASCADE_FUZZY_FLOOR: float = 0.6 # Cascade: similitud aproximada desde la que un mensaje está "cerca del umbral"
+    ENABLE_INTENT_DISPATCH: bool = True # Consultas con una sola intención clara (cotizar, coberturas, comparar) van directo a la tool, sin el agente
 
     # RAG
     ENABLE_QUERY_EXPANSION: bool = True
+    ENABLE_PIPELINED_EXPANSION: bool = True # Recupera la consulta original mientras se expande
+    QUERY_EXPANSION_TIMEOUT_SECONDS: float = 2.0
+    EXPANSION_MEMO_MAX_ENTRIES: int = 1024
     ENABLE_RERANKING: bool = True
+    ENABLE_METADATA_FILTERS: bool = True # Filtra por aseguradora / tipo de documento mencionados
+    METADATA_FILTER_MIN_RESULTS: int = 5
+    QUERY_CATALOG_TTL_SECONDS: int = 300
+    QUERY_CATALOG_MAX_VALUES: int = 200
     ENABLE_HYBRID_SEARCH: bool = True
+    HYBRID_FUSION_MODE: str = "rescore" # "rescore" (denso sobre candidatos dispersos), "rrf" o "dbsf"
+    HYBRID_DENSE_PREFETCH_LIMIT: Optional[int] = None # None = limit * 2
+    HYBRID_SPARSE_PREFETCH_LIMIT: Optional[int] = None # None = limit * 2
     RERANK_MODEL: str = "ms-marco-MultiBERT-L-12"
 
+    # Caché de respuestas (answer_legal_query)
+    ENABLE_ANSWER_CACHE: bool = True
+    ANSWER_CACHE_MAX_ENTRIES: int = 512
+    ANSWER_CACHE_TTL_SECONDS: int = 3600
+    ANSWER_CACHE_SIMILARITY_THRESHOLD: float = 0.95 # 1.0 = solo coincidencia exacta
+    ANSWER_CACHE_CORPUS_MARKER: str = ".cache/corpus_version" # Lo reescribe cada proceso que cambia la colección (ingest.py, jobs); la API vacía el caché al verlo cambiar
+
+    # Caché de embeddings (memoria + SQLite en disco)
+    ENABLE_EMBEDDING_CACHE: bool = True
+    EMBEDDING_CACHE_PATH: str = ".cache/embeddings.sqlite"
+    EMBEDDING_CACHE_MEMORY_ENTRIES: int = 10000
+
+    # Chunking de documentos
+    CHUNKER: str = "clause" # "clause" (Artículo/Cláusula/secciones/listas) o "recursive" (1000 caracteres, 200 de solapamiento)
+    CHUNK_MAX_TOKENS: int = 350
+    CHUNK_MIN_TOKENS: int = 120 # Por debajo no se corta en un encabezado: se une con la sección siguiente
+    CHUNK_OVERLAP_TOKENS: int = 0 # Solo al partir un párrafo que no entra en un chunk
+
+    # Deduplicación de chunks casi idénticos entre documentos (MinHash + LSH)
+    ENABLE_CHUNK_DEDUP: bool = True
+    DEDUP_THRESHOLD: float = 0.95 # Jaccard mínimo (shingles de palabras) para reutilizar un chunk; además las cifras deben coincidir
+    DEDUP_NUM_PERM: int = 128
+    DEDUP_BANDS: int = 16 # 16 bandas x 8 filas: candidatos desde Jaccard ~0.7
+    DEDUP_SHINGLE_SIZE: int = 5
+    DEDUP_MAX_CANDIDATES: int = 5
+
+    # Ingesta incremental (scripts/ingest.py)
+    INGEST_MANIFEST_PATH: str = ".cache/ingest_manifest.json"
+    INGEST_CHUNK_BATCH_SIZE: int = 256 # Chunks que se embeben y escriben juntos: acota la memoria por documento
+
+    # Ingesta por API (/ingest): jobs en un pool de procesos aparte
+    INGEST_WORKERS: int = 1
+    INGEST_UPLOAD_DIR: str = ".cache/uploads"
+    INGEST_MAX_UPLOAD_MB: int = 50
+    INGEST_JOBS_HISTORY: int = 200 # Jobs terminados que se conservan para consultar su estado
+
+    # Inferencia local (FlashRank, BM42, MiniLM)
+    INFERENCE_WORKERS: int = 2
+    INFERENCE_MAX_QUEUE: int = 32
+    INFERENCE_ONNX_THREADS: Optional[int] = None # None = cores / INFERENCE_WORKERS
+    MODEL_WARMUP_RETRY_SECONDS: float = 5.0 # Espera antes de reintentar un warm-up fallido (se duplica en cada intento)
+    MODEL_WARMUP_RETRY_MAX_SECONDS: float = 300.0
+
     # AI
     OPENAI_API_KEY: str
+    EMBEDDING_MODEL: str = "text-embedding-3-small"
+    EMBEDDING_DIMENSIONS: int = 1536 # text-embedding-3 admite menos (p. ej. 512); cambiarlo exige recrear la colección
+    EMBEDDING_BATCH_MAX_TOKENS: int = 100000 # Presupuesto de tokens por request de embeddings
+    EMBEDDING_BATCH_MAX_INPUTS: int = 2048
+    EMBEDDING_MAX_CONCURRENCY: int = 4 # Requests de embeddings en vuelo por proceso (entre todos los documentos)
+    EMBEDDING_MAX_RETRIES: int = 6
     LLM_MODEL: str = "gpt-4o-mini"
     LLM_TEMPERATURE: float = 0.0
 
+    # Cliente HTTP compartido para OpenAI (embeddings, expansión, respuestas, agente)
+    OPENAI_HTTP2: bool = True
+    OPENAI_MAX_CONNECTIONS: int = 20
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    OPENAI_KEEPALIVE_EXPIRY_SECONDS: float = 120.0
+    OPENAI_MAX_IN_FLIGHT: int = 64 # Requests simultáneas a OpenAI en el proceso (con HTTP/2 varias comparten conexión)
+    OPENAI_TIMEOUT_SECONDS: float = 60.0
+    OPENAI_CONNECT_TIMEOUT_SECONDS: float = 5.0
+
     # Security
     SECRET_KEY: str = "your-super-secret-key-change-it"
     ALGORITHM: str = "HS256"
@@ -0,0 +1,109 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from .config import settings
+from .metrics import Gauge, Histogram
+
+INFERENCE_QUEUE_WAIT = Histogram(
+    "inference_queue_wait_seconds",
+    "Tiempo que una inferencia espera un worker libre",
+)
+INFERENCE_DURATION = Histogram(
+    "inference_duration_seconds",
+    "Duración de la inferencia ONNX (FlashRank, BM42, MiniLM)",
+)
+INFERENCE_IN_FLIGHT = Gauge(
+    "inference_in_flight",
+    "Inferencias en ejecución o en cola",
+)
+
+
+class InferenceQueueFull(RuntimeError):
+    """La cola del executor de inferencia alcanzó INFERENCE_MAX_QUEUE."""
+
+
+class InferenceExecutor:
+    """
+    Pool de threads acotado para la inferencia ONNX (CPU-bound).
+    onnxruntime libera el GIL, así que los threads corren en paralelo sin
+    bloquear el event loop. Si hay más de `max_workers + max_queue` tareas
+    pendientes se rechaza la nueva con InferenceQueueFull.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int):
+        self.max_workers = max_workers
+        self.max_pending = max_workers + max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inference")
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    async def run(self, model: str, func: Callable[..., Any], *args: Any) -> Any:
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise InferenceQueueFull(f"Inference queue is full ({self._pending} pending)")
+            self._pending += 1
+        INFERENCE_IN_FLIGHT.inc()
+
+        submitted = time.perf_counter()
+
+        def job():
+            started = time.perf_counter()
+            INFERENCE_QUEUE_WAIT.observe(started - submitted, model=model)
+            try:
+                return func(*args)
+            finally:
+                INFERENCE_DURATION.observe(time.perf_counter() - started, model=model)
+
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._pool, job)
+        finally:
+            with self._lock:
+                self._pending -= 1
+            INFERENCE_IN_FLIGHT.dec()
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+_executor: Optional[InferenceExecutor] = None
+
+
+def get_inference_executor() -> InferenceExecutor:
+    global _executor
+    if _executor is None:
+        _executor = InferenceExecutor(
+            max_workers=settings.INFERENCE_WORKERS,
+            max_queue=settings.INFERENCE_MAX_QUEUE
+        )
+    return _executor
+
+
+def onnx_threads() -> int:
+    """
+    Threads intra-op por sesión ONNX. Por defecto se reparten los cores entre
+    los workers para no sobresuscribir la CPU.
+    """
+    if settings.INFERENCE_ONNX_THREADS:
+        return settings.INFERENCE_ONNX_THREADS
+    return max(1, (os.cpu_count() or 1) // max(1, settings.INFERENCE_WORKERS))
+
+
+def tune_ranker_session(ranker, model_name: str) -> None:
+    """FlashRank no expone las opciones de sesión: recreamos la sesión ONNX con threads acotados."""
+    import onnxruntime as ort
+    from flashrank.Config import model_file_map
+
+    session = getattr(ranker, "session", None)
+    if session is None:
+        return
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = onnx_threads()
+    options.inter_op_num_threads = 1
+    model_path = ranker.model_dir / model_file_map[model_name]
+    ranker.session = ort.InferenceSession(str(model_path), sess_options=options)
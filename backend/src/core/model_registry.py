@@ -0,0 +1,169 @@
+import asyncio
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Optional
+
+from .config import settings
+from .inference import onnx_threads, tune_ranker_session
+from .metrics import Gauge
+
+MODEL_READY = Gauge(
+    "model_ready",
+    "1 si el modelo local está cargado y con warm-up hecho",
+)
+MODEL_LOAD_SECONDS = Gauge(
+    "model_load_seconds",
+    "Duración de la carga + warm-up de cada modelo local",
+)
+
+# Texto de warm-up: una inferencia real compila los kernels y reserva los buffers de ONNX
+WARMUP_QUERY = "¿La póliza vehicular cubre el robo de espejos?"
+WARMUP_PASSAGE = "Se excluyen los daños y robos de accesorios no declarados en la póliza."
+
+SPARSE_MODEL_NAME = "Qdrant/bm42-all-minilm-l6-v2-attentions"
+ROUTER_MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+
+def _load_ranker():
+    from flashrank import Ranker
+    ranker = Ranker(model_name=settings.RERANK_MODEL, cache_dir="/tmp/flashrank")
+    tune_ranker_session(ranker, settings.RERANK_MODEL)
+    return ranker
+
+
+def _warm_ranker(ranker):
+    from flashrank import RerankRequest
+    ranker.rerank(RerankRequest(query=WARMUP_QUERY, passages=[{"id": 0, "text": WARMUP_PASSAGE}]))
+
+
+def _load_sparse():
+    from fastembed import SparseTextEmbedding
+    return SparseTextEmbedding(model_name=SPARSE_MODEL_NAME, threads=onnx_threads())
+
+
+def _load_router():
+    from fastembed import TextEmbedding
+    return TextEmbedding(model_name=ROUTER_MODEL_NAME, threads=onnx_threads())
+
+
+def _warm_embedding(model):
+    list(model.embed([WARMUP_QUERY]))
+
+
+@dataclass
+class ModelEntry:
+    name: str
+    load: Callable[[], Any]
+    warm: Callable[[Any], None]
+    enabled: bool
+    instance: Any = None
+    status: str = "pending"  # pending, loading, loaded, ready, failed, disabled
+    error: Optional[str] = None
+    seconds: Optional[float] = None
+
+
+class ModelRegistry:
+    """
+    Dueño de los modelos locales (FlashRank, BM42, MiniLM): una instancia por proceso.
+    `get()` carga bajo demanda y `aget()` hace lo mismo desde el event loop sin bloquearlo
+    (la carga, o la espera a la del warm-up, corre en un thread). `warm_up()` los carga y
+    hace una inferencia de prueba al arrancar la API, reintentando con backoff lo que
+    falle, y `ready()` indica si ya están calientes (/health/ready).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._warmed = False
+        self._entries = {
+            entry.name: entry
+            for entry in (
+                ModelEntry("flashrank", _load_ranker, _warm_ranker, settings.ENABLE_RERANKING),
+                ModelEntry("bm42", _load_sparse, _warm_embedding, settings.ENABLE_HYBRID_SEARCH),
+                ModelEntry("minilm", _load_router, _warm_embedding, settings.SEMANTIC_ROUTER_MODE in ("semantic", "cascade")),
+            )
+        }
+        for entry in self._entries.values():
+            if not entry.enabled:
+                entry.status = "disabled"
+            MODEL_READY.set(0, model=entry.name)
+
+    def get(self, name: str) -> Any:
+        entry = self._entries[name]
+        if entry.instance is None:
+            with self._lock:
+                if entry.instance is None:
+                    entry.status = "loading"
+                    try:
+                        entry.instance = entry.load()
+                    except Exception as e:
+                        entry.status, entry.error = "failed", str(e)
+                        raise
+                    entry.status = "loaded"
+        return entry.instance
+
+    async def aget(self, name: str) -> Any:
+        entry = self._entries[name]
+        if entry.instance is not None:
+            return entry.instance
+        return await asyncio.to_thread(self.get, name)
+
+    def _warm(self, entry: ModelEntry):
+        started = time.perf_counter()
+        try:
+            entry.warm(self.get(entry.name))
+        except Exception as e:
+            entry.status, entry.error = "failed", str(e)
+            print(f"WARNING: Could not warm up model {entry.name}: {e}")
+            return
+        entry.status, entry.seconds = "ready", time.perf_counter() - started
+        MODEL_READY.set(1, model=entry.name)
+        MODEL_LOAD_SECONDS.set(entry.seconds, model=entry.name)
+
+    async def warm_up(self, *hooks: Callable[[], Awaitable[Any]]):
+        """
+        Carga y calienta los modelos habilitados (en threads) y luego corre `hooks` (p. ej. la
+        matriz de anclas). Lo que falla se reintenta con backoff exponencial hasta que todo esté listo.
+        """
+        delay = settings.MODEL_WARMUP_RETRY_SECONDS
+        pending_hooks = list(hooks)
+        while True:
+            for entry in self._entries.values():
+                if entry.enabled and entry.status != "ready":
+                    await asyncio.to_thread(self._warm, entry)
+            if all(entry.status == "ready" for entry in self._entries.values() if entry.enabled):
+                failed_hooks = []
+                for hook in pending_hooks:
+                    try:
+                        await hook()
+                    except Exception as e:
+                        print(f"WARNING: Warm-up hook failed: {e}")
+                        failed_hooks.append(hook)
+                pending_hooks = failed_hooks
+                if not pending_hooks:
+                    self._warmed = True
+                    return
+            print(f"WARNING: Warm-up incomplete, retrying in {delay:.0f}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, settings.MODEL_WARMUP_RETRY_MAX_SECONDS)
+
+    def ready(self) -> bool:
+        return self._warmed and all(
+            entry.status == "ready" for entry in self._entries.values() if entry.enabled
+        )
+
+    def status(self) -> dict:
+        return {
+            name: {"status": entry.status, "seconds": entry.seconds, "error": entry.error}
+            for name, entry in self._entries.items()
+        }
+
+
+_registry: Optional[ModelRegistry] = None
+
+
+def get_model_registry() -> ModelRegistry:
+    global _registry
+    if _registry is None:
+        _registry = ModelRegistry()
+    return _registry
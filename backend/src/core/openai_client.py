@@ -0,0 +1,149 @@
+import asyncio
+import time
+from typing import Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+from .config import settings
+from .metrics import Counter, Gauge, Histogram
+
+OPENAI_REQUESTS = Counter(
+    "openai_http_requests_total",
+    "Requests HTTP a OpenAI por conexión (new, reused) y versión HTTP",
+)
+OPENAI_IN_FLIGHT = Gauge(
+    "openai_http_in_flight",
+    "Requests a OpenAI en curso (hasta cerrar la respuesta, incluido el streaming)",
+)
+OPENAI_QUEUE_WAIT = Histogram(
+    "openai_http_queue_wait_seconds",
+    "Espera por un cupo de OPENAI_MAX_IN_FLIGHT",
+)
+
+# Transporte y clientes compartidos por todo el proceso (keep-alive, HTTP/2, límites)
+_http_client: Optional[httpx.AsyncClient] = None
+_openai_client: Optional[AsyncOpenAI] = None
+# Requests de embeddings de ingesta en vuelo en todo el proceso (no por documento)
+_embedding_semaphore: Optional[asyncio.Semaphore] = None
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """Cuerpo de la respuesta que libera el cupo de in-flight al cerrarse."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, release):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            self._release()
+
+
+class InstrumentedTransport(httpx.AsyncBaseTransport):
+    """
+    AsyncHTTPTransport con un tope global de requests simultáneas y métricas de
+    reutilización de conexiones (vía los eventos de trace de httpcore).
+    """
+
+    def __init__(self, transport: httpx.AsyncHTTPTransport, max_in_flight: int):
+        self._transport = transport
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        new_connection = False
+        previous_trace = request.extensions.get("trace")
+
+        async def trace(event_name: str, info: dict):
+            nonlocal new_connection
+            if event_name.startswith("connection.connect_tcp."):
+                new_connection = True
+            if previous_trace is not None:
+                await previous_trace(event_name, info)
+
+        request.extensions["trace"] = trace
+
+        queued = time.perf_counter()
+        await self._semaphore.acquire()
+        OPENAI_QUEUE_WAIT.observe(time.perf_counter() - queued)
+        OPENAI_IN_FLIGHT.inc()
+
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                OPENAI_IN_FLIGHT.dec()
+                self._semaphore.release()
+
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            release()
+            raise
+
+        http_version = response.extensions.get("http_version", b"").decode() or "unknown"
+        OPENAI_REQUESTS.inc(connection="new" if new_connection else "reused", http_version=http_version)
+        response.stream = _ReleasingStream(response.stream, release)
+        return response
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+def openai_timeout() -> httpx.Timeout:
+    return httpx.Timeout(settings.OPENAI_TIMEOUT_SECONDS, connect=settings.OPENAI_CONNECT_TIMEOUT_SECONDS)
+
+
+def get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None:
+        transport = httpx.AsyncHTTPTransport(
+            http2=settings.OPENAI_HTTP2,
+            limits=httpx.Limits(
+                max_connections=settings.OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.OPENAI_KEEPALIVE_EXPIRY_SECONDS
+            )
+        )
+        _http_client = httpx.AsyncClient(
+            transport=InstrumentedTransport(transport, settings.OPENAI_MAX_IN_FLIGHT),
+            timeout=openai_timeout()
+        )
+    return _http_client
+
+
+def get_openai_client() -> AsyncOpenAI:
+    """AsyncOpenAI compartido (RAG, ingesta); ChatOpenAI usa el mismo get_http_client()."""
+    global _openai_client
+    if _openai_client is None:
+        _openai_client = AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            http_client=get_http_client(),
+            timeout=openai_timeout()
+        )
+    return _openai_client
+
+
+def get_embedding_semaphore() -> asyncio.Semaphore:
+    """Tope de EMBEDDING_MAX_CONCURRENCY requests de embeddings compartido por todos los documentos."""
+    global _embedding_semaphore
+    if _embedding_semaphore is None:
+        _embedding_semaphore = asyncio.Semaphore(settings.EMBEDDING_MAX_CONCURRENCY)
+    return _embedding_semaphore
+
+
+async def close_openai_client():
+    global _http_client, _openai_client, _embedding_semaphore
+    if _http_client is not None:
+        await _http_client.aclose()
+    _http_client = None
+    _openai_client = None
+    _embedding_semaphore = None
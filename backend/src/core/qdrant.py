@@ -0,0 +1,85 @@
+from typing import Optional
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.http import models
+from .config import settings
+
+# Cliente compartido por todo el proceso (reutiliza conexiones HTTP/gRPC)
+_qdrant_client: Optional[AsyncQdrantClient] = None
+
+
+def get_qdrant_client() -> AsyncQdrantClient:
+    global _qdrant_client
+    if _qdrant_client is None:
+        _qdrant_client = AsyncQdrantClient(
+            url=settings.QDRANT_URL,
+            api_key=settings.QDRANT_API_KEY,
+            prefer_grpc=settings.QDRANT_PREFER_GRPC,
+            grpc_port=settings.QDRANT_GRPC_PORT,
+            pool_size=settings.QDRANT_POOL_SIZE
+        )
+    return _qdrant_client
+
+
+async def close_qdrant_client():
+    global _qdrant_client
+    if _qdrant_client is not None:
+        await _qdrant_client.close()
+        _qdrant_client = None
+
+
+# --- Configuración del vector denso de la colección de pólizas ---
+# Los parámetros explícitos permiten a scripts/benchmark.py comparar configuraciones;
+# por defecto se usan los de settings.
+
+def quantization_config(mode: Optional[str] = None) -> Optional[models.QuantizationConfig]:
+    mode = mode or settings.QDRANT_QUANTIZATION
+    if mode == "scalar":
+        return models.ScalarQuantization(scalar=models.ScalarQuantizationConfig(
+            type=models.ScalarType.INT8,
+            quantile=0.99,
+            always_ram=settings.QDRANT_QUANTIZATION_ALWAYS_RAM
+        ))
+    if mode == "binary":
+        return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(
+            always_ram=settings.QDRANT_QUANTIZATION_ALWAYS_RAM
+        ))
+    return None
+
+
+def hnsw_config(m: Optional[int] = None, ef_construct: Optional[int] = None) -> Optional[models.HnswConfigDiff]:
+    m = m or settings.QDRANT_HNSW_M
+    ef_construct = ef_construct or settings.QDRANT_HNSW_EF_CONSTRUCT
+    if m is None and ef_construct is None:
+        return None
+    return models.HnswConfigDiff(m=m, ef_construct=ef_construct)
+
+
+def dense_vector_params(
+    dimensions: Optional[int] = None,
+    on_disk: Optional[bool] = None,
+    quantization: Optional[str] = None,
+    m: Optional[int] = None,
+    ef_construct: Optional[int] = None,
+) -> models.VectorParams:
+    return models.VectorParams(
+        size=dimensions or settings.EMBEDDING_DIMENSIONS,
+        distance=models.Distance.COSINE,
+        on_disk=settings.QDRANT_ON_DISK_VECTORS if on_disk is None else on_disk,
+        hnsw_config=hnsw_config(m, ef_construct),
+        quantization_config=quantization_config(quantization)
+    )
+
+
+def search_params(quantization: Optional[str] = None, ef: Optional[int] = None) -> Optional[models.SearchParams]:
+    """Parámetros de búsqueda densa: ef de HNSW y rescoring/oversampling si hay cuantización."""
+    quantization = quantization or settings.QDRANT_QUANTIZATION
+    ef = ef or settings.QDRANT_HNSW_EF
+    quantization_params = None
+    if quantization != "none":
+        quantization_params = models.QuantizationSearchParams(
+            rescore=settings.QDRANT_QUANTIZATION_RESCORE,
+            oversampling=settings.QDRANT_QUANTIZATION_OVERSAMPLING
+        )
+    if ef is None and quantization_params is None:
+        return None
+    return models.SearchParams(hnsw_ef=ef, quantization=quantization_params)
@@ -0,0 +1,109 @@
+import functools
+import time
+from contextvars import ContextVar
+from typing import Any, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import AsyncCallbackHandler
+
+from .metrics import Histogram
+
+STAGE_DURATION = Histogram(
+    "pipeline_stage_duration_seconds",
+    "Duración por etapa del pipeline de chat/RAG",
+)
+
+# Tiempos de la request en curso: [(etapa, segundos)]. None fuera de una request HTTP.
+_request_timings: ContextVar[Optional[list]] = ContextVar("request_timings", default=None)
+
+
+def record_stage(name: str, seconds: float):
+    STAGE_DURATION.observe(seconds, stage=name)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((name, seconds))
+
+
+class stage:
+    """Context manager que mide una etapa: `with stage("qdrant"): ...`"""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record_stage(self.name, time.perf_counter() - self._start)
+        return False
+
+
+def timed(name: str):
+    """Decorador para corrutinas: mide cada llamada como la etapa `name`."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with stage(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class LLMTimingCallback(AsyncCallbackHandler):
+    """Mide cada turno del LLM del agente (LangChain) como la etapa `name`."""
+
+    def __init__(self, name: str = "llm_agent"):
+        self.name = name
+        self._starts: dict[UUID, float] = {}
+
+    async def on_chat_model_start(self, serialized: dict, messages: list, *, run_id: UUID, **kwargs: Any) -> None:
+        self._starts[run_id] = time.perf_counter()
+
+    async def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        start = self._starts.pop(run_id, None)
+        if start is not None:
+            record_stage(self.name, time.perf_counter() - start)
+
+    async def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._starts.pop(run_id, None)
+
+
+def _server_timing_header(timings: list) -> str:
+    totals: dict[str, float] = {}
+    for name, seconds in timings:
+        totals[name] = totals.get(name, 0.0) + seconds
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in totals.items())
+
+
+class ServerTimingMiddleware:
+    """
+    Middleware ASGI: recoge las etapas medidas durante la request y las
+    devuelve en la cabecera Server-Timing (junto al total de la app).
+    En respuestas en streaming solo incluye lo medido antes del primer byte.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings: list = []
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                header = _server_timing_header(timings + [("app", time.perf_counter() - start)])
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", header.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)
@@ -117,6 +117,19 @@ class ChatResponse(BaseModel):
     data_table: Optional[Any] = None
 
 # --- Policy Ingestion ---
+class IngestJobResponse(BaseModel):
+    id: str
+    filename: str
+    status: str
+    chunks: int = 0
+    upserted: int = 0
+    deleted: int = 0
+    shared: int = 0
+    error: Optional[str] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
 class PolicyCreate(BaseModel):
     insurer_name: str
     policy_type: str
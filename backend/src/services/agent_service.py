@@ -1,20 +1,31 @@
-from typing import List, Any, Tuple
+from typing import List, Any, Tuple, AsyncIterator, Optional
+import asyncio
 import uuid
 import json
 from sqlalchemy.ext.asyncio import AsyncSession
 from langchain_core.tools import tool
+from langchain_core.runnables import RunnableConfig
 from langchain_openai import ChatOpenAI
-from langchain_core.messages import ToolMessage 
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
 
 from psycopg_pool import AsyncConnectionPool
 from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
 from langgraph.prebuilt import create_react_agent
 from ..services.quote_service import QuoteService
-from ..services.rag_service import RAGService
+from ..services.rag_service import get_rag_service
 from ..services.chat_service import ChatService
 from ..domain.schemas import QuoteRequest
 from ..core.config import settings
 from ..services.semantic_router import SemanticRouter
+from ..services.query_analyzer import QueryAnalyzer
+from ..core.metrics import Counter
+from ..core.openai_client import get_http_client, openai_timeout
+from ..core.timing import LLMTimingCallback, stage
+
+INTENT_DISPATCH = Counter(
+    "intent_dispatch_total",
+    "Turnos de negocio por intención y camino (direct: tool sin planificación del agente, agent)",
+)
 
 # Global checkpointer variables
 _pool: AsyncConnectionPool = None
@@ -41,89 +52,73 @@ async def initialize_checkpointer():
         
     return _checkpointer
 
-class AgentService:
-    def __init__(self, db: AsyncSession):
-        self.db = db
-        self.llm = ChatOpenAI(
-            model=settings.LLM_MODEL, 
-            temperature=settings.LLM_TEMPERATURE, 
-            api_key=settings.OPENAI_API_KEY
-        )
-        
-        # Instanciar servicios base
-        self.quote_service = QuoteService(db)
-        self.rag_service = RAGService()
-        self.chat_service = ChatService(db)
+def _format_quotes(quotes: list) -> str:
+    # Formatear respuesta para el LLM
+    if not quotes:
+        return "No se encontraron cotizaciones para ese perfil en nuestra base de datos."
 
-    async def get_checkpointer(self):
-        return await initialize_checkpointer()
+    response_str = "Cotizaciones encontradas:\n"
+    for q in quotes:
+        response_str += f"- {q.insurer} ({q.plan_name}): ${q.price} ({q.coverage_summary})\n"
+    return response_str
 
-    async def get_executor(self) -> Any:
-        # 0. Obtener Checkpointer (Persistencia)
-        checkpointer = await self.get_checkpointer()
 
-        # 1. Definir Tools
+# Tools del agente, definidas una vez por proceso. Las dependencias de cada request
+# (sesión de BD) llegan por config["configurable"], no por closures.
+@tool
+async def calculate_insurance_quote(age: int, car_brand: str, car_model: str, car_year: int, config: RunnableConfig, dni: str = None, first_name: str = None, usage: str = "Particular") -> str:
+    """
+    Útil SOLO cuando el usuario quiere saber el PRECIO, costo o cotización de un seguro.
+    Calcula la prima exacta para un auto específico.
+    
+    REQUIERE OBLIGATORIAMENTE:
+    - age (edad del conductor)
+    - car_brand (Marca: Toyota, Nissan, Kia, etc.)
+    - car_model (Modelo: Corolla, Yaris, Rio, etc.)
+    - car_year (Año de fabricación: 2020, 2023, etc.)
+    
+    OPCIONALES:
+    - usage (Uso: 'Particular', 'Taxi', 'Carga', 'Comercial'). Si no se especifica, asumir 'Particular'.
+    - dni y first_name (Datos del cliente).
+    
+    SI FALTAN DATOS (especialmente Marca, Modelo o Año), NO INVENTES. PREGUNTA al usuario por el dato que falta.
+    """
+    try:
+        # Convertir argumentos a esquema Pydantic para el servicio
+        req = QuoteRequest(age=age, car_brand=car_brand, car_model=car_model, car_year=car_year, usage=usage, dni=dni, first_name=first_name)
+        # Llamar al servicio de cotización con la sesión de BD de la request (run config)
+        quotes = await QuoteService(config["configurable"]["db"]).get_quotes(req)
         
-        @tool
-        async def calculate_insurance_quote(age: int, car_brand: str, car_model: str, car_year: int, dni: str = None, first_name: str = None, usage: str = "Particular") -> str:
-            """
-            Útil SOLO cuando el usuario quiere saber el PRECIO, costo o cotización de un seguro.
-            Calcula la prima exacta para un auto específico.
-            
-            REQUIERE OBLIGATORIAMENTE:
-            - age (edad del conductor)
-            - car_brand (Marca: Toyota, Nissan, Kia, etc.)
-            - car_model (Modelo: Corolla, Yaris, Rio, etc.)
-            - car_year (Año de fabricación: 2020, 2023, etc.)
-            
-            OPCIONALES:
-            - usage (Uso: 'Particular', 'Taxi', 'Carga', 'Comercial'). Si no se especifica, asumir 'Particular'.
-            - dni y first_name (Datos del cliente).
-            
-            SI FALTAN DATOS (especialmente Marca, Modelo o Año), NO INVENTES. PREGUNTA al usuario por el dato que falta.
-            """
-            try:
-                # Convertir argumentos a esquema Pydantic para el servicio
-                req = QuoteRequest(age=age, car_brand=car_brand, car_model=car_model, car_year=car_year, usage=usage, dni=dni, first_name=first_name)
-                # Llamar al servicio de cotización
-                quotes = await self.quote_service.get_quotes(req)
-                
-                # Formatear respuesta para el LLM
-                if not quotes:
-                    return "No se encontraron cotizaciones para ese perfil en nuestra base de datos."
-                    
-                response_str = "Cotizaciones encontradas:\n"
-                for q in quotes:
-                    response_str += f"- {q.insurer} ({q.plan_name}): ${q.price} ({q.coverage_summary})\n"
-                return response_str
-            except Exception as e:
-                return f"Error calculando cotización: {str(e)}"
-
-        @tool
-        async def search_legal_conditions(query: str) -> str:
-            """
-            Útil cuando el usuario pregunta sobre COBERTURAS, condiciones, exclusiones, o cláusulas legales.
-            Ejemplo: '¿Cubre robo de espejos?', '¿Qué pasa si manejo ebrio?'.
-            Busca en la documentación legal y pólizas.
-            """
-            result = await self.rag_service.answer_legal_query(query)
-            return json.dumps(result, ensure_ascii=False)
+        return _format_quotes(quotes)
+    except Exception as e:
+        return f"Error calculando cotización: {str(e)}"
 
-        @tool
-        async def compare_insurance_policies(query: str) -> str:
-            """
-            Útil cuando el usuario pide COMPARAR dos o más planes/aseguradoras.
-            También si pide 'coberturas de X, Y y Z'.
-            Ejemplo: 'Diferencia entre Rimac y Pacífico', 'Comparar deducibles', 'Coberturas de Rimac y Mapfre'.
-            Genera una TABLA COMPARATIVA basándose en la documentación legal.
-            """
-            result = await self.rag_service.answer_legal_query(query, force_table=True)
-            return json.dumps(result, ensure_ascii=False)
+@tool
+async def search_legal_conditions(query: str) -> str:
+    """
+    Útil cuando el usuario pregunta sobre COBERTURAS, condiciones, exclusiones, o cláusulas legales.
+    Ejemplo: '¿Cubre robo de espejos?', '¿Qué pasa si manejo ebrio?'.
+    Busca en la documentación legal y pólizas.
+    """
+    result = await get_rag_service().answer_legal_query(query)
+    return json.dumps(result, ensure_ascii=False)
 
-        tools = [calculate_insurance_quote, search_legal_conditions, compare_insurance_policies]
-        
-        # 2. Definir Prompt del Sistema (System Prompt)
-        system_prompt = """Eres el Copiloto de Seguros Inteligente.
+@tool
+async def compare_insurance_policies(query: str) -> str:
+    """
+    Útil cuando el usuario pide COMPARAR dos o más planes/aseguradoras.
+    También si pide 'coberturas de X, Y y Z'.
+    Ejemplo: 'Diferencia entre Rimac y Pacífico', 'Comparar deducibles', 'Coberturas de Rimac y Mapfre'.
+    Genera una TABLA COMPARATIVA basándose en la documentación legal.
+    """
+    result = await get_rag_service().answer_legal_query(query, force_table=True)
+    return json.dumps(result, ensure_ascii=False)
+
+
+AGENT_TOOLS = [calculate_insurance_quote, search_legal_conditions, compare_insurance_policies]
+TOOLS_BY_NAME = {t.name: t for t in AGENT_TOOLS}
+
+SYSTEM_PROMPT = """Eres el Copiloto de Seguros Inteligente.
             Tu misión es ayudar al usuario usando las herramientas disponibles de manera eficiente.
             
             REGLAS:
@@ -134,9 +129,139 @@ class AgentService:
             - Si la pregunta es compleja y requiere ambos (precios y condiciones), puedes usar múltiples herramientas.
             """
 
-        # 3. Crear Agente con LangGraph
-        agent = create_react_agent(self.llm, tools, prompt=system_prompt, checkpointer=checkpointer)
-        return agent
+_agent_graph = None
+# Las primeras requests concurrentes esperan al mismo grafo (y al mismo pool del checkpointer)
+_agent_graph_lock = asyncio.Lock()
+
+
+async def get_agent_graph() -> Any:
+    """Grafo ReAct compilado una sola vez (LLM, tools y checkpointer compartidos)."""
+    global _agent_graph
+    if _agent_graph is not None:
+        return _agent_graph
+
+    async with _agent_graph_lock:
+        if _agent_graph is None:
+            checkpointer = await initialize_checkpointer()
+            llm = ChatOpenAI(
+                model=settings.LLM_MODEL, 
+                temperature=settings.LLM_TEMPERATURE, 
+                api_key=settings.OPENAI_API_KEY,
+                http_async_client=get_http_client(),
+                timeout=openai_timeout()
+            )
+            _agent_graph = create_react_agent(llm, AGENT_TOOLS, prompt=SYSTEM_PROMPT, checkpointer=checkpointer)
+        return _agent_graph
+
+
+class AgentService:
+    """Por request: solo la sesión de BD y los servicios que dependen de ella; el grafo es compartido."""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        self.quote_service = QuoteService(db)
+        self.chat_service = ChatService(db)
+
+    async def get_executor(self) -> Any:
+        return await get_agent_graph()
+
+    def _run_config(self, thread_id: str, user_id: int, **extra) -> dict:
+        # thread_id y user_id (primitivos) quedan además en la metadata del checkpoint; la sesión no
+        return {"configurable": {"thread_id": thread_id, "user_id": user_id, "db": self.db}, **extra}
+
+    UNSAFE_RESPONSE = "Lo siento, no puedo procesar esa solicitud por razones de seguridad."
+    GREETING_RESPONSE = "¡Hola! Soy tu Copiloto de Seguros. ¿En qué te puedo ayudar hoy? Puedo cotizar seguros (necesito datos de tu auto), comparar opciones o resolver dudas sobre coberturas."
+
+    async def _fast_route(self, user_query: str) -> Optional[str]:
+        """Enrutamiento Semántico (Optimización y Seguridad): respuesta directa o None."""
+        router = SemanticRouter()
+        route = await router.route(user_query)
+        
+        # Respuesta rápida para Seguridad
+        if route == "UNSAFE":
+            return self.UNSAFE_RESPONSE
+            
+        # Respuesta rápida para Saludos
+        if route == "GREETING":
+            return self.GREETING_RESPONSE
+
+        return None
+
+    async def _route_intent(self, user_query: str) -> Optional[Tuple[str, dict]]:
+        """
+        (tool, argumentos) para consultas de una sola intención clara (QUOTE, LEGAL, COMPARE),
+        o None si el turno es mixto, ambiguo o le faltan datos: en ese caso decide el agente.
+        """
+        if not settings.ENABLE_INTENT_DISPATCH:
+            return None
+
+        intent = (await SemanticRouter().intent(user_query)).route
+        if intent == "QUOTE":
+            request = await self.quote_service.parse_request(user_query)
+            if request is None:
+                # Faltan datos del auto o la edad: el agente los pide
+                INTENT_DISPATCH.inc(intent=intent, path="agent")
+                return None
+            args = {"age": request.age, "car_brand": request.car_brand, "car_model": request.car_model, "car_year": request.car_year, "usage": request.usage}
+            INTENT_DISPATCH.inc(intent=intent, path="direct")
+            return "calculate_insurance_quote", args
+
+        if intent == "LEGAL":
+            # "Coberturas de Rimac y Mapfre" también es una comparación
+            insurers = (await QueryAnalyzer().analyze(user_query)).get("insurer", [])
+            intent = "COMPARE" if len(insurers) > 1 else intent
+        if intent in ("LEGAL", "COMPARE"):
+            tool_name = "compare_insurance_policies" if intent == "COMPARE" else "search_legal_conditions"
+            INTENT_DISPATCH.inc(intent=intent, path="direct")
+            return tool_name, {"query": user_query}
+
+        INTENT_DISPATCH.inc(intent="none", path="agent")
+        return None
+
+    async def _run_tool_direct(self, thread_id: str, user_id: int, user_query: str, tool_name: str, args: dict) -> Tuple[str, List[dict]]:
+        """
+        Ejecuta la tool sin la llamada de planificación del agente (ni la de redacción:
+        la respuesta de RAG ya viene redactada) y escribe el turno en el checkpoint del
+        thread como si lo hubiera resuelto el agente, para que los turnos siguientes lo vean.
+        """
+        with stage("direct_tool"):
+            output = await TOOLS_BY_NAME[tool_name].ainvoke(args, config=self._run_config(thread_id, user_id))
+
+        if tool_name == "calculate_insurance_quote":
+            answer = (
+                f"Para un {args['car_brand']} {args['car_model']} {args['car_year']} "
+                f"(uso {args['usage']}, conductor de {args['age']} años):\n\n{output}"
+            )
+        else:
+            answer = json.loads(output).get("answer", "")
+
+        call_id = f"call_{uuid.uuid4().hex}"
+        messages = [
+            HumanMessage(content=user_query),
+            AIMessage(content="", tool_calls=[{"name": tool_name, "args": args, "id": call_id}]),
+            ToolMessage(content=output, tool_call_id=call_id, name=tool_name),
+            AIMessage(content=answer),
+        ]
+        executor = await self.get_executor()
+        # as_node="agent": el último mensaje no tiene tool_calls, el grafo queda terminado
+        await executor.aupdate_state(self._run_config(thread_id, user_id), {"messages": messages}, as_node="agent")
+        return answer, self._extract_sources(messages)
+
+    @staticmethod
+    def _extract_sources(messages: list) -> List[dict]:
+        """Extrae las sources (únicas por título) de los ToolMessages."""
+        unique_sources = {}
+        for msg in messages:
+            if isinstance(msg, ToolMessage):
+                try:
+                    data = json.loads(msg.content)
+                    if isinstance(data, dict) and "sources" in data:
+                        for s in data["sources"]:
+                             if isinstance(s, dict) and "title" in s:
+                                unique_sources[s["title"]] = s
+                except:
+                    pass
+        return list(unique_sources.values())
 
     async def process_query(self, user_query: str, user_id: int, thread_id: str = None) -> dict:
         """
@@ -149,56 +274,96 @@ class AgentService:
             thread_id = thread.id
             
         # 2. Enrutamiento Semántico (Optimización y Seguridad)
-        router = SemanticRouter()
-        route = await router.route(user_query)
-        
-        # Respuesta rápida para Seguridad
-        if route == "UNSAFE":
-            response = "Lo siento, no puedo procesar esa solicitud por razones de seguridad."
-            await self._save_interaction(thread_id, user_query, response)
-            return {"answer": response, "thread_id": thread_id}
-            
-        # Respuesta rápida para Saludos
-        if route == "GREETING":
-            response = "¡Hola! Soy tu Copiloto de Seguros. ¿En qué te puedo ayudar hoy? Puedo cotizar seguros (necesito datos de tu auto), comparar opciones o resolver dudas sobre coberturas."
+        response = await self._fast_route(user_query)
+        if response is not None:
             await self._save_interaction(thread_id, user_query, response)
             return {"answer": response, "thread_id": thread_id}
 
-        # 3. Ejecución del Agente para consultas de negocio (Quote, Comparison, Info)
+        # 3. Consultas de una sola intención clara: tool directa, sin planificación del agente
+        direct = await self._route_intent(user_query)
+        if direct is not None:
+            assistant_response, sources_list = await self._run_tool_direct(thread_id, user_id, user_query, *direct)
+            await self._save_interaction(thread_id, user_query, assistant_response, sources_list)
+            return {"answer": assistant_response, "thread_id": thread_id, "sources": sources_list}
+
+        # 4. Ejecución del Agente para consultas mixtas o ambiguas (Quote, Comparison, Info)
         executor = await self.get_executor()
         
         inputs = {"messages": [("user", user_query)]}
-        config = {"configurable": {"thread_id": thread_id}}
+        config = self._run_config(thread_id, user_id, callbacks=[LLMTimingCallback()])
         
         # Invocamos al agente
-        result = await executor.ainvoke(inputs, config=config)
+        with stage("agent"):
+            result = await executor.ainvoke(inputs, config=config)
         
         # Extraemos el último mensaje del asistente
         assistant_response = result["messages"][-1].content
         
         # Extraer sources de los ToolMessages 
-        unique_sources = {}
-        for msg in result["messages"]:
-            if isinstance(msg, ToolMessage):
-                try:
-                    data = json.loads(msg.content)
-                    if isinstance(data, dict) and "sources" in data:
-                        for s in data["sources"]:
-                             if isinstance(s, dict) and "title" in s:
-                                unique_sources[s["title"]] = s
-                except:
-                    pass
+        sources_list = self._extract_sources(result["messages"])
                             
-        # 4. Guardar Interacción
-        sources_list = list(unique_sources.values()) if unique_sources else []
+        # 5. Guardar Interacción
         await self._save_interaction(thread_id, user_query, assistant_response, sources_list)
 
         return {
             "answer": assistant_response,
             "thread_id": thread_id,
-            "sources": list(unique_sources.values()) if unique_sources else []
+            "sources": sources_list
         }
 
+    async def stream_query(self, user_query: str, user_id: int, thread_id: str = None) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Variante en streaming de process_query. Emite tuplas (evento, datos):
+        'thread', 'tool_start', 'token' (fragmentos de la respuesta), 'sources' y 'done'.
+        La interacción se guarda cuando el stream termina.
+        """
+        if not thread_id:
+            thread = await self.chat_service.create_thread(user_id, "Nueva Conversación")
+            thread_id = thread.id
+        yield "thread", {"thread_id": thread_id}
+
+        response = await self._fast_route(user_query)
+        if response is not None:
+            yield "token", {"content": response}
+            await self._save_interaction(thread_id, user_query, response)
+            yield "sources", {"sources": []}
+            yield "done", {"thread_id": thread_id}
+            return
+
+        direct = await self._route_intent(user_query)
+        if direct is not None:
+            yield "tool_start", {"name": direct[0]}
+            assistant_response, sources_list = await self._run_tool_direct(thread_id, user_id, user_query, *direct)
+            yield "token", {"content": assistant_response}
+            await self._save_interaction(thread_id, user_query, assistant_response, sources_list)
+            yield "sources", {"sources": sources_list}
+            yield "done", {"thread_id": thread_id}
+            return
+
+        executor = await self.get_executor()
+        inputs = {"messages": [("user", user_query)]}
+        config = self._run_config(thread_id, user_id, callbacks=[LLMTimingCallback()])
+
+        async for event in executor.astream_events(inputs, config=config, version="v2"):
+            kind = event["event"]
+            if kind == "on_tool_start":
+                yield "tool_start", {"name": event["name"]}
+            elif kind == "on_chat_model_stream":
+                # Los turnos que solo deciden tools no traen contenido de texto
+                content = event["data"]["chunk"].content
+                if content:
+                    yield "token", {"content": content}
+
+        # El estado final (checkpoint) tiene la respuesta completa y los ToolMessages
+        state = await executor.aget_state(config)
+        messages = state.values.get("messages", [])
+        assistant_response = messages[-1].content if messages else ""
+        sources_list = self._extract_sources(messages)
+
+        await self._save_interaction(thread_id, user_query, assistant_response, sources_list)
+        yield "sources", {"sources": sources_list}
+        yield "done", {"thread_id": thread_id}
+
     async def _save_interaction(self, thread_id: str, user_msg: str, assistant_msg: str, sources: List[dict] = None):
         """Método auxiliar para guardar el historial de chat en la base de datos."""
         await self.chat_service.save_message(thread_id, "user", user_msg)
@@ -0,0 +1,197 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from ..core.config import settings
+from ..core.metrics import Counter, Gauge
+from .query_analyzer import normalize
+
+ANSWER_CACHE_REQUESTS = Counter(
+    "answer_cache_requests_total",
+    "Consultas al caché de respuestas por resultado (exact, semantic, miss)",
+)
+
+
+@dataclass
+class _Entry:
+    force_table: bool
+    entities: tuple
+    embedding: Optional[np.ndarray]
+    value: dict
+    created_at: float
+
+
+class AnswerCache:
+    """
+    Caché LRU con TTL para answer_legal_query.
+    - Hit exacto: misma consulta normalizada y mismo force_table.
+    - Hit semántico: coseno entre embeddings de la consulta >= similarity_threshold, solo
+      entre consultas que mencionan las mismas aseguradoras y tipos de documento (QueryAnalyzer).
+    Se vacía entero cuando cambia la colección de pólizas: invalidate() en este proceso y,
+    para los cambios de otros procesos (scripts/ingest.py, jobs de ingesta), cuando cambia
+    el marcador de versión del corpus en `corpus_marker`.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, similarity_threshold: float, corpus_marker: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.corpus_marker = corpus_marker
+        self._entries: "OrderedDict[tuple[str, bool], _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._corpus_version = self._read_corpus_version()
+
+    @property
+    def semantic_enabled(self) -> bool:
+        return self.similarity_threshold < 1.0
+
+    @staticmethod
+    def _entity_key(entities: Optional[dict[str, list[str]]]) -> tuple:
+        return tuple(sorted((field, tuple(sorted(values))) for field, values in (entities or {}).items()))
+
+    def _read_corpus_version(self) -> Optional[str]:
+        if self.corpus_marker is None:
+            return None
+        try:
+            with open(self.corpus_marker) as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _sync_corpus_version(self):
+        """Vacía el caché si el corpus cambió desde otro proceso (una lectura del marcador por consulta)."""
+        version = self._read_corpus_version()
+        if version != self._corpus_version:
+            with self._lock:
+                self._entries.clear()
+                self._corpus_version = version
+
+    def _expired(self, entry: _Entry, now: float) -> bool:
+        return now - entry.created_at > self.ttl_seconds
+
+    def get(self, query: str, force_table: bool) -> Optional[dict]:
+        self._sync_corpus_version()
+        key = (normalize(query), force_table)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not self._expired(entry, now):
+                self._entries.move_to_end(key)
+                ANSWER_CACHE_REQUESTS.inc(result="exact")
+                return entry.value
+            if entry is not None:
+                del self._entries[key]
+        return None
+
+    def get_similar(
+        self,
+        embedding: Optional[list[float]],
+        force_table: bool,
+        entities: Optional[dict[str, list[str]]] = None
+    ) -> Optional[dict]:
+        """`entities`: aseguradoras / tipos de documento de la consulta (QueryAnalyzer.analyze)."""
+        if not self.semantic_enabled or embedding is None:
+            ANSWER_CACHE_REQUESTS.inc(result="miss")
+            return None
+
+        vector = self._unit(embedding)
+        entity_key = self._entity_key(entities)
+        now = time.monotonic()
+        with self._lock:
+            candidates = [
+                (key, entry) for key, entry in self._entries.items()
+                if entry.force_table == force_table
+                and entry.entities == entity_key
+                and entry.embedding is not None
+                and not self._expired(entry, now)
+            ]
+            if candidates:
+                matrix = np.stack([entry.embedding for _, entry in candidates])
+                scores = matrix @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity_threshold:
+                    key, entry = candidates[best]
+                    self._entries.move_to_end(key)
+                    ANSWER_CACHE_REQUESTS.inc(result="semantic")
+                    return entry.value
+
+        ANSWER_CACHE_REQUESTS.inc(result="miss")
+        return None
+
+    def put(
+        self,
+        query: str,
+        force_table: bool,
+        value: dict,
+        embedding: Optional[list[float]] = None,
+        entities: Optional[dict[str, list[str]]] = None
+    ):
+        key = (normalize(query), force_table)
+        entry = _Entry(
+            force_table=force_table,
+            entities=self._entity_key(entities),
+            embedding=self._unit(embedding) if embedding is not None else None,
+            value=value,
+            created_at=time.monotonic()
+        )
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _unit(embedding: list[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+_answer_cache: Optional[AnswerCache] = None
+
+
+def get_answer_cache() -> AnswerCache:
+    global _answer_cache
+    if _answer_cache is None:
+        _answer_cache = AnswerCache(
+            max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+            similarity_threshold=settings.ANSWER_CACHE_SIMILARITY_THRESHOLD,
+            corpus_marker=settings.ANSWER_CACHE_CORPUS_MARKER
+        )
+    return _answer_cache
+
+
+def invalidate_answer_cache():
+    """
+    Llamar cada vez que cambia la colección de pólizas. Además de vaciar el caché de
+    este proceso, actualiza el marcador de versión del corpus para los demás (la API).
+    """
+    if _answer_cache is not None:
+        _answer_cache.invalidate()
+    try:
+        marker = settings.ANSWER_CACHE_CORPUS_MARKER
+        os.makedirs(os.path.dirname(marker) or ".", exist_ok=True)
+        with open(marker, "w") as f:
+            f.write(f"{time.time_ns()}-{os.getpid()}")
+    except OSError as e:
+        print(f"Warning: could not update corpus version marker: {e}")
+
+
+ANSWER_CACHE_SIZE = Gauge(
+    "answer_cache_entries",
+    "Entradas en el caché de respuestas",
+    func=lambda: len(_answer_cache) if _answer_cache is not None else 0,
+)
@@ -5,6 +5,7 @@ from sqlalchemy.orm import selectinload
 
 from ..domain.models import ChatThread, ChatMessage, User
 from ..domain.schemas import ThreadCreate, ThreadUpdate, MessageCreate
+from ..core.timing import timed
 
 class ChatService:
     def __init__(self, db: AsyncSession):
@@ -60,6 +61,7 @@ class ChatService:
             return True
         return False
 
+    @timed("db_save")
     async def save_message(self, thread_id: str, role: str, content: str, metadata: dict = None) -> ChatMessage:
         new_msg = ChatMessage(
             id=str(uuid.uuid4()),
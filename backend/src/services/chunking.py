@@ -0,0 +1,203 @@
+import bisect
+import re
+from typing import Iterable, Iterator, Optional
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from ..core.config import settings
+
+# Texto acumulado (en múltiplos del chunk máximo) antes de partir y emitir chunks
+CHUNK_WINDOW_FACTOR = 4
+
+# Splitter anterior (por caracteres), se mantiene como alternativa y para comparar
+RECURSIVE_CHUNK_SIZE = 1000
+RECURSIVE_CHUNK_OVERLAP = 200
+
+# Encabezados que abren una sección nueva (corte preferente)
+_HEADING = re.compile(
+    r"^\s*(?:"
+    r"(?:CAP[IÍ]TULO|T[IÍ]TULO|SECCI[OÓ]N|ART[IÍ]CULO|CL[AÁ]USULA|ANEXO)\b"
+    r"|(?:Cap[ií]tulo|T[ií]tulo|Secci[oó]n|Art[ií]culo|Art\.|Cl[aá]usula|Anexo)\s+[\dIVXLC]"
+    r"|\d{1,2}(?:\.\d{1,2})*\s*[\.\)-]?\s+[A-ZÁÉÍÓÚÑ]"
+    r")"
+)
+# Ítems de listas (exclusiones, obligaciones, definiciones): corte posible entre ítems
+_LIST_ITEM = re.compile(r"^\s*(?:[a-zñ]{1,2}[\)\.]|[ivxlc]{1,4}\)|\d{1,2}\)|[-•·–])\s+")
+# Fin de oración, para partir párrafos que no entran en un chunk
+_SENTENCE_END = re.compile(r"(?<=[\.;:])\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimación conservadora (~3 caracteres por token en español), sin descargar el tokenizer."""
+    return len(text) // 3 + 1
+
+
+def _is_caps_heading(line: str) -> bool:
+    """Línea corta en mayúsculas: "EXCLUSIONES", "CONDICIONES GENERALES"..."""
+    letters = [c for c in line if c.isalpha()]
+    return 4 <= len(letters) and len(line.strip()) <= 80 and all(c.isupper() for c in letters)
+
+
+class ClauseChunker:
+    """
+    Chunker por estructura para condicionados de pólizas peruanas: corta en
+    Capítulo/Artículo/Cláusula, secciones numeradas y encabezados en mayúsculas,
+    y entre ítems de listas o párrafos. Los chunks son fragmentos contiguos del
+    texto de hasta `max_tokens`, sin solapamiento salvo `overlap_tokens` cuando
+    un párrafo entero no entra en un chunk y hay que partirlo por oraciones.
+    """
+
+    def __init__(self, max_tokens: int, min_tokens: int = 0, overlap_tokens: int = 0):
+        self.max_tokens = max_tokens
+        self.min_tokens = min_tokens
+        self.overlap_tokens = overlap_tokens
+
+    @property
+    def max_chars(self) -> int:
+        return self.max_tokens * 3
+
+    def _segments(self, text: str) -> list[tuple[int, int, bool]]:
+        """(inicio, fin, abre sección) de cada bloque: encabezado, ítem de lista o párrafo."""
+        segments, start, heading = [], None, False
+        offset = 0
+        for line in text.splitlines(keepends=True):
+            stripped = line.strip()
+            is_heading = bool(stripped) and (_HEADING.match(line) is not None or _is_caps_heading(stripped))
+            opens_block = is_heading or (bool(stripped) and _LIST_ITEM.match(line) is not None)
+            if not stripped or opens_block:
+                if start is not None and start < offset:
+                    segments.append((start, offset, heading))
+                start, heading = (offset, is_heading) if stripped else (None, False)
+            elif start is None:
+                start, heading = offset, False
+            offset += len(line)
+        if start is not None and start < offset:
+            segments.append((start, offset, heading))
+        return segments
+
+    def _split_long(self, text: str, start: int, end: int) -> list[tuple[int, int]]:
+        """Parte un bloque demasiado grande por oraciones (y por palabras si hace falta)."""
+        pieces, cursor = [], start
+        for match in _SENTENCE_END.finditer(text, start, end):
+            pieces.append((cursor, match.end()))
+            cursor = match.end()
+        if cursor < end:
+            pieces.append((cursor, end))
+
+        spans: list[tuple[int, int]] = []
+        for piece_start, piece_end in pieces:
+            while estimate_tokens(text[piece_start:piece_end]) > self.max_tokens:
+                cut = text.rfind(" ", piece_start, piece_start + self.max_chars)
+                cut = cut if cut > piece_start else piece_start + self.max_chars
+                spans.append((piece_start, cut))
+                piece_start = cut
+            spans.append((piece_start, piece_end))
+
+        packed: list[tuple[int, int]] = []
+        for span_start, span_end in spans:
+            if packed and estimate_tokens(text[packed[-1][0]:span_end]) <= self.max_tokens:
+                packed[-1] = (packed[-1][0], span_end)
+            else:
+                if packed and self.overlap_tokens:
+                    # Solapamiento mínimo: las últimas palabras del chunk anterior
+                    overlap_start = max(packed[-1][1] - self.overlap_tokens * 3, packed[-1][0])
+                    space = text.find(" ", overlap_start, packed[-1][1])
+                    span_start = space + 1 if space >= 0 else span_start
+                packed.append((span_start, span_end))
+        return packed
+
+    def split_text(self, text: str) -> list[str]:
+        spans: list[tuple[int, int]] = []
+        current: Optional[list[int]] = None
+
+        for seg_start, seg_end, opens_section in self._segments(text):
+            if estimate_tokens(text[seg_start:seg_end]) > self.max_tokens:
+                if current is not None:
+                    spans.append(tuple(current))
+                    current = None
+                spans.extend(self._split_long(text, seg_start, seg_end))
+                continue
+
+            if current is not None:
+                fits = estimate_tokens(text[current[0]:seg_end]) <= self.max_tokens
+                big_enough = estimate_tokens(text[current[0]:current[1]]) >= self.min_tokens
+                if fits and not (opens_section and big_enough):
+                    current[1] = seg_end
+                    continue
+                spans.append(tuple(current))
+            current = [seg_start, seg_end]
+
+        if current is not None:
+            spans.append(tuple(current))
+
+        chunks = [text[start:end].strip() for start, end in spans]
+        return [chunk for chunk in chunks if chunk]
+
+
+def get_text_splitter(kind: Optional[str] = None):
+    """Splitter de ingesta: "clause" (por estructura) o "recursive" (por caracteres, el anterior)."""
+    kind = kind or settings.CHUNKER
+    if kind == "recursive":
+        return RecursiveCharacterTextSplitter(
+            chunk_size=RECURSIVE_CHUNK_SIZE,
+            chunk_overlap=RECURSIVE_CHUNK_OVERLAP,
+            separators=["\n\n", "\n", ".", " ", ""]
+        )
+    return ClauseChunker(
+        max_tokens=settings.CHUNK_MAX_TOKENS,
+        min_tokens=settings.CHUNK_MIN_TOKENS,
+        overlap_tokens=settings.CHUNK_OVERLAP_TOKENS
+    )
+
+
+def chunk_pages(pages: Iterable[tuple[Optional[int], str]], splitter) -> Iterator[tuple[str, Optional[int], Optional[int]]]:
+    """
+    Chunking incremental de un documento página a página: (texto, página inicial, página final).
+    Solo se mantiene en memoria una ventana de unas pocas veces el chunk máximo; los chunks
+    que ya no pueden cambiar con el texto siguiente se emiten y se descartan.
+    """
+    chunk_size = getattr(splitter, "max_chars", RECURSIVE_CHUNK_SIZE)
+    buffer = ""
+    # (offset en buffer, página) de cada página que aporta texto al buffer
+    offsets: list[tuple[int, Optional[int]]] = []
+
+    def page_at(pos: int) -> Optional[int]:
+        return offsets[bisect.bisect_right([o for o, _ in offsets], pos) - 1][1]
+
+    def split(final: bool):
+        nonlocal buffer, offsets
+        chunks, search_from = [], 0
+        for chunk in splitter.split_text(buffer):
+            start = buffer.find(chunk, search_from)
+            if start < 0:
+                start = search_from
+            chunks.append((chunk, start))
+            search_from = start + 1
+
+        # Los últimos chunks pueden crecer con la página siguiente: se re-parten después
+        keep_from = len(buffer) if final else max(len(buffer) - chunk_size, 0)
+        emitted, rest = [], None
+        for chunk, start in chunks:
+            if final or start + len(chunk) <= keep_from:
+                emitted.append((chunk, page_at(start), page_at(start + len(chunk) - 1)))
+            elif rest is None:
+                rest = start
+        if rest is None:
+            rest = len(buffer)
+        if rest:
+            # Se descarta el texto ya emitido y las páginas que quedaron fuera del buffer
+            buffer = buffer[rest:]
+            shifted = [(o - rest, page) for o, page in offsets]
+            first = max(i for i, (o, _) in enumerate(shifted) if o <= 0)
+            offsets = [(0, shifted[first][1])] + shifted[first + 1:]
+        return emitted
+
+    for page_number, text in pages:
+        if not text:
+            continue
+        offsets.append((len(buffer), page_number))
+        buffer += text + "\n"
+        if len(buffer) >= chunk_size * CHUNK_WINDOW_FACTOR:
+            yield from split(final=False)
+    if buffer.strip():
+        yield from split(final=True)
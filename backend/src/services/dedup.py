@@ -0,0 +1,78 @@
+import hashlib
+import zlib
+from typing import Optional
+
+import numpy as np
+
+from ..core.config import settings
+from .query_analyzer import normalize
+
+# Primo de Mersenne 2^61 - 1 para las permutaciones universales (a·x + b) mod p
+_PRIME = np.uint64((1 << 61) - 1)
+
+
+class MinHasher:
+    """
+    MinHash sobre shingles de palabras + LSH por bandas.
+    Dos chunks con Jaccard alto comparten al menos una banda con alta probabilidad;
+    las bandas se guardan en el payload (índice KEYWORD) para buscar candidatos en Qdrant.
+    """
+
+    def __init__(self, num_perm: int, bands: int, shingle_size: int, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        # Semilla fija: las bandas tienen que coincidir entre procesos y corridas
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 2**31 - 1, size=num_perm).astype(np.uint64)
+        self._b = rng.randint(0, 2**31 - 1, size=num_perm).astype(np.uint64)
+
+    def shingles(self, text: str) -> set[int]:
+        words = normalize(text).split()
+        k = min(self.shingle_size, len(words)) or 1
+        return {
+            zlib.crc32(" ".join(words[i:i + k]).encode("utf-8"))
+            for i in range(max(len(words) - k + 1, 1))
+        }
+
+    def signature(self, shingles: set[int]) -> np.ndarray:
+        x = np.fromiter(shingles, dtype=np.uint64, count=len(shingles))
+        # a < 2^31 y x < 2^32: el producto entra en uint64
+        return ((self._a[:, None] * x[None, :] + self._b[:, None]) % _PRIME).min(axis=1)
+
+    def band_keys(self, signature: np.ndarray) -> list[str]:
+        return [
+            f"{band}:{hashlib.blake2b(signature[band * self.rows:(band + 1) * self.rows].tobytes(), digest_size=8).hexdigest()}"
+            for band in range(self.bands)
+        ]
+
+    def keys(self, text: str) -> list[str]:
+        return self.band_keys(self.signature(self.shingles(text)))
+
+    @staticmethod
+    def figures(text: str) -> list[str]:
+        """Tokens normalizados con dígitos (montos, porcentajes, plazos), en orden."""
+        return [word for word in normalize(text).split() if any(c.isdigit() for c in word)]
+
+    @staticmethod
+    def jaccard(a: set[int], b: set[int]) -> float:
+        if not a or not b:
+            return 0.0
+        return len(a & b) / len(a | b)
+
+
+_min_hasher: Optional[MinHasher] = None
+
+
+def get_min_hasher() -> MinHasher:
+    global _min_hasher
+    if _min_hasher is None:
+        _min_hasher = MinHasher(
+            num_perm=settings.DEDUP_NUM_PERM,
+            bands=settings.DEDUP_BANDS,
+            shingle_size=settings.DEDUP_SHINGLE_SIZE
+        )
+    return _min_hasher
@@ -0,0 +1,61 @@
+import os
+from typing import Iterator, Optional
+
+from pypdf import PdfReader
+
+
+def build_metadata(file_path: str, insurer_folder: str) -> Optional[dict]:
+    filename = os.path.basename(file_path)
+
+    # Inferir metadatos del nombre de archivo: [ASEGURADORA]_[RAMO]_[AÑO]_[TIPO_DOC]_[DESCRIPCION].pdf
+    # Ejemplo: Rimac_Vehicular_2026_Clausula Adicional_Auxilio Mecánico para Vehículos.pdf
+    filename_clean = filename.replace(".pdf", "")
+    parts = filename_clean.split("_")
+
+    # Valores por defecto
+    insurer = insurer_folder.capitalize()
+    insurance_line = "Desconocido"
+    year = "Desconocido"
+    document_type = "Desconocido"
+    description = "Desconocido"
+
+    if len(parts) >= 5:
+        insurer = parts[0]
+        insurance_line = parts[1]
+        year = parts[2]
+        document_type = parts[3]
+        description = "_".join(parts[4:])
+    elif len(parts) == 4:
+        # Fallback para casos con 4 partes
+        insurer = parts[0]
+        insurance_line = parts[1]
+        year = parts[2]
+        document_type = parts[3]
+        description = "-"
+    else:
+        return None
+
+    # Construir metadatos extendidos
+    return {
+        "source_file": filename,
+        "insurer": insurer,
+        "insurance_line": insurance_line,
+        "year": year,
+        "document_type": document_type,
+        "description": description,
+        "file_path": file_path
+    }
+
+
+def iter_pages(file_path: str) -> Iterator[tuple[int, str]]:
+    """(número de página, texto) de cada página con texto, leídas una a una."""
+    reader = PdfReader(file_path)
+    for number, page in enumerate(reader.pages, start=1):
+        text = page.extract_text()
+        if text:
+            yield number, text
+
+
+def extract_pages(file_path: str) -> list[tuple[int, str]]:
+    """Extracción de texto (CPU-bound): se ejecuta en el pool de procesos."""
+    return list(iter_pages(file_path))
@@ -0,0 +1,172 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+import numpy as np
+
+from ..core.config import settings
+from ..core.metrics import Counter, Gauge
+
+EMBEDDING_CACHE_LOOKUPS = Counter(
+    "embedding_cache_lookups_total",
+    "Búsquedas en el caché de embeddings por nivel (memory, disk, miss)",
+)
+
+
+class EmbeddingCache:
+    """
+    Caché de embeddings direccionado por contenido: (modelo, dimensiones, sha256(texto)).
+    Nivel 1: LRU en memoria. Nivel 2: SQLite en disco (vectores float32 serializados),
+    compartido entre la API y los scripts de ingesta.
+    """
+
+    def __init__(self, path: Optional[str], max_memory_entries: int):
+        self.max_memory_entries = max_memory_entries
+        self._memory: "OrderedDict[tuple[str, int, str], list[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self.hits = 0
+        self.misses = 0
+
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS embeddings (
+                    model TEXT NOT NULL,
+                    dimensions INTEGER NOT NULL,
+                    text_hash TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    PRIMARY KEY (model, dimensions, text_hash)
+                )"""
+            )
+            self._db.commit()
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _remember(self, key: tuple, vector: list[float]):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _disk_get(self, model: str, dimensions: int, hashes: list[str]) -> dict[str, list[float]]:
+        if self._db is None or not hashes:
+            return {}
+        found = {}
+        with self._lock:
+            # SQLite limita los parámetros por sentencia: consultamos por lotes
+            for i in range(0, len(hashes), 500):
+                batch = hashes[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._db.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND dimensions = ? AND text_hash IN ({placeholders})",
+                    [model, dimensions, *batch]
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def _disk_put(self, model: str, dimensions: int, items: list[tuple[str, list[float]]]):
+        if self._db is None or not items:
+            return
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, dimensions, text_hash, vector) VALUES (?, ?, ?, ?)",
+                [(model, dimensions, h, np.asarray(v, dtype=np.float32).tobytes()) for h, v in items]
+            )
+            self._db.commit()
+
+    async def embed(
+        self,
+        texts: list[str],
+        model: str,
+        dimensions: int,
+        fetch: Callable[[list[str]], Awaitable[list[list[float]]]],
+    ) -> list[list[float]]:
+        """Devuelve los embeddings de `texts`, llamando a `fetch` solo para los que faltan."""
+        hashes = [self.text_hash(t) for t in texts]
+        results: list[Optional[list[float]]] = [None] * len(texts)
+
+        # 1. Memoria
+        pending: dict[str, list[int]] = {}
+        with self._lock:
+            for i, h in enumerate(hashes):
+                key = (model, dimensions, h)
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    results[i] = self._memory[key]
+                    EMBEDDING_CACHE_LOOKUPS.inc(tier="memory")
+                else:
+                    pending.setdefault(h, []).append(i)
+
+        # 2. Disco (fuera del event loop)
+        if pending:
+            found = await asyncio.to_thread(self._disk_get, model, dimensions, list(pending))
+            with self._lock:
+                for h, vector in found.items():
+                    self._remember((model, dimensions, h), vector)
+                    for i in pending.pop(h):
+                        results[i] = vector
+                        EMBEDDING_CACHE_LOOKUPS.inc(tier="disk")
+
+        # 3. API para el resto (un solo texto por hash aunque se repita)
+        if pending:
+            missing_hashes = list(pending)
+            missing_texts = [texts[pending[h][0]] for h in missing_hashes]
+            vectors = await fetch(missing_texts)
+            with self._lock:
+                for h, vector in zip(missing_hashes, vectors):
+                    self._remember((model, dimensions, h), vector)
+                    for i in pending[h]:
+                        results[i] = vector
+                        EMBEDDING_CACHE_LOOKUPS.inc(tier="miss")
+            await asyncio.to_thread(self._disk_put, model, dimensions, list(zip(missing_hashes, vectors)))
+
+        hits = len(texts) - sum(len(idx) for idx in pending.values())
+        self.hits += hits
+        self.misses += len(texts) - hits
+        return results
+
+    def disk_size(self) -> int:
+        if self._db is None:
+            return 0
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "memory_entries": len(self._memory),
+            "disk_entries": self.disk_size(),
+        }
+
+
+_embedding_cache: Optional[EmbeddingCache] = None
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    global _embedding_cache
+    if _embedding_cache is None:
+        _embedding_cache = EmbeddingCache(
+            path=settings.EMBEDDING_CACHE_PATH if settings.ENABLE_EMBEDDING_CACHE else None,
+            max_memory_entries=settings.EMBEDDING_CACHE_MEMORY_ENTRIES if settings.ENABLE_EMBEDDING_CACHE else 0
+        )
+    return _embedding_cache
+
+
+EMBEDDING_CACHE_MEMORY_SIZE = Gauge(
+    "embedding_cache_memory_entries",
+    "Embeddings en el nivel en memoria",
+    func=lambda: len(_embedding_cache._memory) if _embedding_cache is not None else 0,
+)
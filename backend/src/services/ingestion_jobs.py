@@ -0,0 +1,187 @@
+import asyncio
+import multiprocessing
+import os
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, asdict
+from typing import Optional
+
+from ..core.config import settings
+from ..core.metrics import Counter, Gauge
+from .answer_cache import invalidate_answer_cache
+from .query_analyzer import invalidate_query_catalog
+
+INGEST_JOBS = Counter(
+    "ingest_jobs_total",
+    "Jobs de ingesta terminados por estado (done, failed)",
+)
+
+
+# Estado de cada proceso worker: un event loop propio y un IngestionService
+# (modelo BM42 y clientes) que se reutilizan entre jobs
+_worker_loop: Optional[asyncio.AbstractEventLoop] = None
+_worker_service = None
+
+
+def run_ingestion_job(file_path: str, metadata: dict) -> dict:
+    """Punto de entrada en el proceso worker."""
+    global _worker_loop
+    if _worker_loop is None:
+        _worker_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_worker_loop)
+    return _worker_loop.run_until_complete(_ingest(file_path, metadata))
+
+
+async def _ingest(file_path: str, metadata: dict) -> dict:
+    from .document_loader import iter_pages
+    from .ingestion_service import DocumentChunks, IngestionService
+
+    global _worker_service
+    if _worker_service is None:
+        _worker_service = IngestionService()
+    service = _worker_service
+
+    await service.initialize()
+
+    # Igual que scripts/ingest.py: solo chunks nuevos, y se borran los obsoletos.
+    # Las páginas se leen del PDF a medida que se necesitan chunks, lote a lote.
+    existing_ids = await service.get_point_ids(metadata["source_file"])
+    document = DocumentChunks()
+    upserted = 0
+    async for points in service.iter_point_batches(iter_pages(file_path), metadata, document, skip_ids=existing_ids):
+        await service.upsert_points(points)
+        upserted += len(points)
+    if not document.chunks:
+        raise ValueError("No text extracted")
+
+    # Solo con todos los lotes escritos se tocan los chunks compartidos y los obsoletos
+    await service.add_references(document.references)
+    stale_ids = existing_ids - document.chunk_ids
+    await service.detach_points(metadata["source_file"], list(stale_ids))
+    return {"chunks": len(document.chunk_ids), "upserted": upserted, "deleted": len(stale_ids), "shared": len(document.references)}
+
+
+@dataclass
+class IngestionJob:
+    id: str
+    filename: str
+    status: str = "queued"  # queued, running, done, failed
+    chunks: int = 0
+    upserted: int = 0
+    deleted: int = 0
+    shared: int = 0
+    error: Optional[str] = None
+    created_at: float = 0.0
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class IngestionJobManager:
+    """
+    Cola de jobs de ingesta. Cada job (un PDF ya guardado en disco) corre en un
+    pool de procesos con IngestionService, así la extracción, el chunking y la
+    serialización de los upserts no compiten con el chat por el event loop.
+    Al terminar cada job se invalidan los cachés de este proceso.
+    """
+
+    def __init__(self, workers: int, history: int):
+        self.workers = workers
+        self.history = history
+        self._jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._tasks: list[asyncio.Task] = []
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        # spawn: el proceso padre tiene threads y un event loop corriendo
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def _start(self):
+        if self._tasks:
+            return
+        self._pool = self._new_pool()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def submit(self, file_path: str, metadata: dict) -> IngestionJob:
+        self._start()
+        job = IngestionJob(id=str(uuid.uuid4()), filename=metadata["source_file"], created_at=time.time())
+        self._jobs[job.id] = job
+        self._queue.put_nowait((job, file_path, metadata))
+        self._prune()
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        return self._jobs.get(job_id)
+
+    def jobs(self) -> list[IngestionJob]:
+        return list(reversed(self._jobs.values()))
+
+    def pending(self) -> int:
+        return sum(1 for job in self._jobs.values() if job.status in ("queued", "running"))
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in ("done", "failed")]
+        for job_id in finished[:max(len(finished) - self.history, 0)]:
+            del self._jobs[job_id]
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job, file_path, metadata = await self._queue.get()
+            job.status, job.started_at = "running", time.time()
+            try:
+                result = await loop.run_in_executor(self._pool, run_ingestion_job, file_path, metadata)
+                job.chunks, job.upserted, job.deleted, job.shared = result["chunks"], result["upserted"], result["deleted"], result["shared"]
+                job.status = "done"
+            except BrokenProcessPool as e:
+                # Un worker murió (p. ej. sin memoria): se recrea el pool para los siguientes jobs
+                job.status, job.error = "failed", f"Worker crashed: {e}"
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = self._new_pool()
+            except Exception as e:
+                job.status, job.error = "failed", str(e)
+            finally:
+                job.finished_at = time.time()
+                INGEST_JOBS.inc(status=job.status)
+                # El worker invalidó los cachés de su proceso, no los de la API
+                invalidate_answer_cache()
+                invalidate_query_catalog()
+                if job.status == "failed":
+                    # Solo se conserva el PDF de los documentos indexados (su `file_path`)
+                    try:
+                        os.remove(file_path)
+                    except OSError:
+                        pass
+                self._prune()
+
+    def shutdown(self):
+        for task in self._tasks:
+            task.cancel()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+_job_manager: Optional[IngestionJobManager] = None
+
+
+def get_ingestion_jobs() -> IngestionJobManager:
+    global _job_manager
+    if _job_manager is None:
+        _job_manager = IngestionJobManager(
+            workers=settings.INGEST_WORKERS,
+            history=settings.INGEST_JOBS_HISTORY
+        )
+    return _job_manager
+
+
+INGEST_JOBS_PENDING = Gauge(
+    "ingest_jobs_pending",
+    "Jobs de ingesta en cola o en ejecución",
+    func=lambda: _job_manager.pending() if _job_manager is not None else 0,
+)
@@ -1,131 +1,542 @@
-from qdrant_client import QdrantClient
 from qdrant_client.http import models
-from qdrant_client.http.models import Distance, VectorParams, SparseVectorParams
-from openai import AsyncOpenAI
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from fastembed import SparseTextEmbedding
+from qdrant_client.http.models import SparseVectorParams
+from openai import RateLimitError
+from tenacity import AsyncRetrying, retry_if_exception_type, stop_after_attempt, wait_random_exponential
 from ..core.config import settings
+from ..core.qdrant import get_qdrant_client, dense_vector_params, hnsw_config, quantization_config
+from .answer_cache import invalidate_answer_cache
+from .query_analyzer import invalidate_query_catalog, normalize
+from .embedding_cache import get_embedding_cache
+from .chunking import chunk_pages, estimate_tokens, get_text_splitter
+from .dedup import get_min_hasher
+from ..core.inference import get_inference_executor
+from ..core.model_registry import get_model_registry
+from ..core.openai_client import get_embedding_semaphore, get_openai_client
+import asyncio
+import hashlib
 import uuid
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Iterable, Iterator, Optional
+
+# Espacio de nombres para IDs deterministas de puntos (uuid5)
+POINT_ID_NAMESPACE = uuid.UUID("6f1c2a4e-3b7d-5e8f-9a0b-1c2d3e4f5a6b")
+
+# Campos de cada documento que referencia un chunk compartido (payload "references")
+REFERENCE_FIELDS = ("source_file", "insurer", "insurance_line", "year", "document_type", "description", "page_start", "page_end")
+
+@dataclass
+class SharedChunk:
+    """Chunk resuelto al punto canónico (casi idéntico) de otro documento."""
+    reference: dict
+    # ID y payload propios, por si el canónico ya no existe al agregar la referencia
+    point_id: str
+    payload: dict
+
+
+@dataclass
+class DocumentChunks:
+    """Lo que queda de un documento entre lotes de iter_point_batches."""
+    chunks: int = 0
+    # IDs de todos sus chunks (propios o canónicos de otro documento)
+    chunk_ids: set[str] = field(default_factory=set)
+    # {ID canónico: chunk compartido} nuevos, a agregar con add_references
+    references: dict[str, SharedChunk] = field(default_factory=dict)
+
 
 class IngestionService:
     def __init__(self):
-        self.qdrant = QdrantClient(
-            url=settings.QDRANT_URL,
-            api_key=settings.QDRANT_API_KEY
-        )
-        self.openai = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+        self.qdrant = get_qdrant_client()
+        self.openai = get_openai_client()
         self.collection_name = settings.QDRANT_COLLECTION_NAME
-        
-        if settings.ENABLE_HYBRID_SEARCH:
-            self.sparse_model = SparseTextEmbedding(model_name="Qdrant/bm42-all-minilm-l6-v2-attentions")
-            
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            separators=["\n\n", "\n", ".", " ", ""]
-        )
+
+        self.text_splitter = get_text_splitter()
+        self._collection_ready = False
+
+    async def initialize(self):
+        """Verifica (una sola vez) que la colección y sus índices existan."""
+        if self._collection_ready:
+            return
         try:
-            self._ensure_collection()
+            await self._ensure_collection()
+            self._collection_ready = True
         except Exception as e:
             print(f"ERROR: Could not connect to Qdrant at startup: {e}")
 
-    def _ensure_collection(self):
+    async def _ensure_collection(self):
         try:
-            self.qdrant.get_collection(self.collection_name)
+            info = await self.qdrant.get_collection(self.collection_name)
+            dense = info.config.params.vectors.get("dense") if isinstance(info.config.params.vectors, dict) else None
+            if dense is not None and dense.size != settings.EMBEDDING_DIMENSIONS:
+                print(
+                    f"WARNING: collection {self.collection_name} has {dense.size}-dim dense vectors but "
+                    f"EMBEDDING_DIMENSIONS={settings.EMBEDDING_DIMENSIONS}. Recreate it and re-ingest with --full."
+                )
         except Exception:
             print(f"Creating collection {self.collection_name} with Hybrid Config...")
             
             vectors_config = {
-                "dense": VectorParams(size=1536, distance=Distance.COSINE)
+                "dense": dense_vector_params()
             }
             sparse_vectors_config = None
             
             if settings.ENABLE_HYBRID_SEARCH:
                 sparse_vectors_config = {
                     "sparse": SparseVectorParams(
-                        index=models.SparseIndexParams(on_disk=False)
+                        index=models.SparseIndexParams(on_disk=settings.QDRANT_ON_DISK_VECTORS)
                     )
                 }
             
-            self.qdrant.create_collection(
+            await self.qdrant.create_collection(
                 collection_name=self.collection_name,
                 vectors_config=vectors_config,
-                sparse_vectors_config=sparse_vectors_config
+                sparse_vectors_config=sparse_vectors_config,
+                on_disk_payload=settings.QDRANT_ON_DISK_PAYLOAD
             )
 
         # Crear índices de payload para optimizar filtros
         try:
-            self.qdrant.create_payload_index(
+            await self.qdrant.create_payload_index(
                 collection_name=self.collection_name,
                 field_name="insurer",
                 field_schema=models.PayloadSchemaType.KEYWORD
             )
-            self.qdrant.create_payload_index(
+            await self.qdrant.create_payload_index(
                 collection_name=self.collection_name,
                 field_name="document_type",
                 field_schema=models.PayloadSchemaType.KEYWORD
             )
-            self.qdrant.create_payload_index(
+            await self.qdrant.create_payload_index(
+                collection_name=self.collection_name,
+                field_name="source_file",
+                field_schema=models.PayloadSchemaType.KEYWORD
+            )
+            await self.qdrant.create_payload_index(
                 collection_name=self.collection_name,
                 field_name="description",
                 field_schema=models.PayloadSchemaType.TEXT
             )
+            # Chunks compartidos entre documentos (deduplicación)
+            for field_name in ("referenced_by", "minhash_bands", "references[].insurer", "references[].document_type"):
+                await self.qdrant.create_payload_index(
+                    collection_name=self.collection_name,
+                    field_name=field_name,
+                    field_schema=models.PayloadSchemaType.KEYWORD
+                )
             print("Índices de payload verificados/creados exitosamente.")
         except Exception as e:
             print(f"Advertencia al crear índices: {e}")
 
+    async def apply_collection_config(self):
+        """
+        Aplica a la colección existente la cuantización, HNSW y almacenamiento en disco de settings.
+        Qdrant re-optimiza los segmentos en segundo plano; las dimensiones no se pueden cambiar así.
+        """
+        await self.initialize()
+        quantization = quantization_config()
+        await self.qdrant.update_collection(
+            collection_name=self.collection_name,
+            vectors_config={"dense": models.VectorParamsDiff(
+                on_disk=settings.QDRANT_ON_DISK_VECTORS,
+                hnsw_config=hnsw_config(),
+                quantization_config=quantization if quantization is not None else models.Disabled.DISABLED
+            )},
+            collection_params=models.CollectionParamsDiff(on_disk_payload=settings.QDRANT_ON_DISK_PAYLOAD)
+        )
+
     async def get_embedding(self, text: str) -> list[float]:
-        text = text.replace("\n", " ")
+        return (await self.get_embeddings([text]))[0]
+
+    async def get_embeddings(self, texts: list[str]) -> list[list[float]]:
+        """Embeddings densos de varios textos (caché + requests agrupados), en el mismo orden."""
+        texts = [t.replace("\n", " ") for t in texts]
+        return await get_embedding_cache().embed(
+            texts, settings.EMBEDDING_MODEL, settings.EMBEDDING_DIMENSIONS, self._embed_batched
+        )
+
+    def _pack_batches(self, texts: list[str]) -> list[list[int]]:
+        """
+        Agrupa índices de textos en requests que no superan el presupuesto de tokens
+        (estimado, ver chunking.estimate_tokens).
+        """
+        batches, current, current_tokens = [], [], 0
+        for i, text in enumerate(texts):
+            tokens = estimate_tokens(text)
+            if current and (
+                current_tokens + tokens > settings.EMBEDDING_BATCH_MAX_TOKENS
+                or len(current) >= settings.EMBEDDING_BATCH_MAX_INPUTS
+            ):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(i)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    async def _embed_batched(self, texts: list[str]) -> list[list[float]]:
+        """Varias requests en vuelo (hasta EMBEDDING_MAX_CONCURRENCY en todo el proceso), con backoff ante 429."""
+        semaphore = get_embedding_semaphore()
+        results: list = [None] * len(texts)
+
+        async def run_batch(indices: list[int]):
+            async with semaphore:
+                async for attempt in AsyncRetrying(
+                    retry=retry_if_exception_type(RateLimitError),
+                    wait=wait_random_exponential(multiplier=1, max=60),
+                    stop=stop_after_attempt(settings.EMBEDDING_MAX_RETRIES),
+                    reraise=True
+                ):
+                    with attempt:
+                        vectors = await self._create_embeddings([texts[i] for i in indices])
+            for i, vector in zip(indices, vectors):
+                results[i] = vector
+
+        await asyncio.gather(*(run_batch(batch) for batch in self._pack_batches(texts)))
+        return results
+
+    async def _create_embeddings(self, texts: list[str]) -> list[list[float]]:
         response = await self.openai.embeddings.create(
-            input=[text],
-            model="text-embedding-3-small"
+            input=texts,
+            model=settings.EMBEDDING_MODEL,
+            dimensions=settings.EMBEDDING_DIMENSIONS
         )
-        return response.data[0].embedding
-
-    def get_sparse_vector(self, text: str) -> models.SparseVector:
-        # Generate sparse vector
-        sparse_embedding = list(self.sparse_model.embed([text]))[0] 
-        return models.SparseVector(
-            indices=sparse_embedding.indices.tolist(),
-            values=sparse_embedding.values.tolist()
+        return [d.embedding for d in sorted(response.data, key=lambda d: d.index)]
+
+    async def get_sparse_vector(self, text: str) -> models.SparseVector:
+        return (await self.get_sparse_vectors([text]))[0]
+
+    async def get_sparse_vectors(self, texts: list[str]) -> list[models.SparseVector]:
+        # Generate sparse vectors en un solo batch (fuera del event loop)
+        sparse_model = await get_model_registry().aget("bm42")
+        sparse_embeddings = await get_inference_executor().run(
+            "bm42", lambda: list(sparse_model.embed(texts))
         )
+        return [
+            models.SparseVector(
+                indices=sparse_embedding.indices.tolist(),
+                values=sparse_embedding.values.tolist()
+            )
+            for sparse_embedding in sparse_embeddings
+        ]
+
+    def chunk_pages(self, pages: Iterable[tuple[Optional[int], str]]) -> Iterator[tuple[str, Optional[int], Optional[int]]]:
+        """Chunks (texto, página inicial, página final) de un documento, página a página."""
+        return chunk_pages(pages, self.text_splitter)
 
     async def process_document(self, content: str, metadata: dict) -> int:
         """
         Process a document: chunk, embed, and index in Qdrant.
         Returns number of chunks indexed.
         """
-        chunks = self.text_splitter.split_text(content)
+        document = DocumentChunks()
+        indexed = 0
+        async for points in self.iter_point_batches(content, metadata, document):
+            await self.upsert_points(points)
+            indexed += len(points)
+        await self.add_references(document.references)
+        return indexed
+
+    @staticmethod
+    def point_id(source_file: str, chunk: str) -> str:
+        """ID determinista: el mismo chunk del mismo archivo siempre cae en el mismo punto."""
+        content_hash = hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+        return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{source_file}:{content_hash}"))
+
+    @staticmethod
+    def _reference(metadata: dict, page_start: Optional[int] = None, page_end: Optional[int] = None) -> dict:
+        reference = {field: metadata.get(field) for field in REFERENCE_FIELDS}
+        reference["page_start"], reference["page_end"] = page_start, page_end
+        return reference
+
+    async def _find_duplicates(self, chunks: list[str], band_keys: list[list[str]], source_file: str, known_ids: set) -> dict[int, str]:
+        """
+        {índice del chunk: ID del punto canónico} para los chunks casi idénticos a uno
+        ya indexado de OTRO documento. Candidatos por bandas LSH (una sola consulta
+        en batch a Qdrant) y verificación: mismo texto normalizado, o Jaccard exacto de
+        los shingles >= DEDUP_THRESHOLD con exactamente las mismas cifras.
+        """
+        if not chunks:
+            return {}
+        hasher = get_min_hasher()
+        responses = await self.qdrant.query_batch_points(
+            collection_name=self.collection_name,
+            requests=[
+                models.QueryRequest(
+                    filter=models.Filter(must=[
+                        models.FieldCondition(key="minhash_bands", match=models.MatchAny(any=keys))
+                    ]),
+                    limit=settings.DEDUP_MAX_CANDIDATES,
+                    with_payload=["content", "source_file"]
+                )
+                for keys in band_keys
+            ]
+        )
+
+        duplicates = {}
+        for i, (chunk, response) in enumerate(zip(chunks, responses)):
+            shingles = None
+            for candidate in response.points:
+                if candidate.payload.get("source_file") == source_file:
+                    # Un chunk heredado de otro documento (su ID no deriva de este) solo si es idéntico
+                    if str(candidate.id) in known_ids and candidate.payload.get("content") == chunk:
+                        duplicates[i] = str(candidate.id)
+                        break
+                    continue
+                content = candidate.payload.get("content", "")
+                if normalize(content) != normalize(chunk):
+                    # Cláusulas que difieren en un monto o porcentaje no son el mismo chunk
+                    if hasher.figures(content) != hasher.figures(chunk):
+                        continue
+                    shingles = shingles or hasher.shingles(chunk)
+                    if hasher.jaccard(shingles, hasher.shingles(content)) < settings.DEDUP_THRESHOLD:
+                        continue
+                duplicates[i] = str(candidate.id)
+                break
+        return duplicates
+
+    async def iter_point_batches(
+        self,
+        content: str | Iterable[tuple[Optional[int], str]],
+        metadata: dict,
+        document: "DocumentChunks",
+        skip_ids: set | None = None,
+        batch_size: int | None = None
+    ) -> AsyncIterator[list[models.PointStruct]]:
+        """
+        Chunking + embeddings (denso y disperso) de un documento en lotes de hasta
+        `batch_size` chunks (INGEST_CHUNK_BATCH_SIZE), sin escribir en Qdrant.
+        `content` es el texto completo o un iterable de (número de página, texto), que se
+        consume a medida que se necesitan chunks: solo un lote de chunks y sus vectores
+        está en memoria a la vez. Devuelve los puntos a escribir de cada lote.
+        Los chunks cuyo ID está en `skip_ids` (ya indexados) no se vuelven a embeber, y
+        los casi idénticos a un chunk de otro documento se resuelven a ese punto canónico.
+        `document` acumula los IDs de todos los chunks y las referencias a agregar con
+        add_references cuando todos los lotes estén escritos.
+        """
+        await self.initialize()
+        batch_size = batch_size or settings.INGEST_CHUNK_BATCH_SIZE
+        pages = [(None, content)] if isinstance(content, str) else content
+        skip_ids = skip_ids or set()
+
+        batch = []
+        for chunk in self.chunk_pages(pages):
+            batch.append(chunk)
+            if len(batch) >= batch_size:
+                points = await self._prepare_batch(batch, metadata, document, skip_ids)
+                batch = []
+                if points:
+                    yield points
+        if batch:
+            points = await self._prepare_batch(batch, metadata, document, skip_ids)
+            if points:
+                yield points
+
+    async def _prepare_batch(
+        self,
+        batch: list[tuple[str, Optional[int], Optional[int]]],
+        metadata: dict,
+        document: "DocumentChunks",
+        skip_ids: set
+    ) -> list[models.PointStruct]:
+        first_index = document.chunks
+        document.chunks += len(batch)
+        all_chunks = [chunk for chunk, _, _ in batch]
+        source_file = metadata.get("source_file", "")
+        chunk_ids = [self.point_id(source_file, chunk) for chunk in all_chunks]
+
+        # Índices de los chunks que hay que embeber e indexar (un punto por ID, también entre lotes)
+        pending = []
+        for i, point_id in enumerate(chunk_ids):
+            if point_id not in document.chunk_ids and point_id not in skip_ids:
+                pending.append(i)
+            document.chunk_ids.add(point_id)
+        # Deduplicación entre documentos (boilerplate SBS, definiciones...)
+        band_keys = {}
+        if settings.ENABLE_CHUNK_DEDUP and pending:
+            hasher = get_min_hasher()
+            band_keys = {i: hasher.keys(all_chunks[i]) for i in pending}
+            duplicates = await self._find_duplicates(
+                [all_chunks[i] for i in pending], [band_keys[i] for i in pending], source_file, skip_ids
+            )
+            for n, canonical_id in duplicates.items():
+                i = pending[n]
+                document.chunk_ids.discard(chunk_ids[i])
+                document.chunk_ids.add(canonical_id)
+                if canonical_id not in document.references and canonical_id not in skip_ids:
+                    chunk, page_start, page_end = batch[i]
+                    document.references[canonical_id] = SharedChunk(
+                        reference=self._reference(metadata, page_start, page_end),
+                        point_id=chunk_ids[i],
+                        payload=self._payload(metadata, chunk, first_index + i, page_start, page_end, band_keys[i])
+                    )
+            pending = [i for n, i in enumerate(pending) if n not in duplicates]
+
+        chunks = [all_chunks[i] for i in pending]
         points = []
-        
-        for i, chunk in enumerate(chunks):
-            # Dense Vector
-            dense_embedding = await self.get_embedding(chunk)
-            
-            vector_struct = {"dense": dense_embedding}
-            
-            # Sparse Vector (Optional)
-            if settings.ENABLE_HYBRID_SEARCH:
-                sparse_vector = self.get_sparse_vector(chunk)
-                vector_struct["sparse"] = sparse_vector
-            
-            # Enrich metadata
-            payload = metadata.copy()
-            payload["content"] = chunk
-            payload["chunk_index"] = i
-            payload["total_chunks"] = len(chunks)
-            
+        if not chunks:
+            return points
+
+        vectors = await self._vectors(chunks)
+        for n, (i, chunk) in enumerate(zip(pending, chunks)):
             points.append(models.PointStruct(
-                id=str(uuid.uuid4()),
-                vector=vector_struct,
-                payload=payload
+                id=chunk_ids[i],
+                vector=vectors[n],
+                payload=self._payload(metadata, chunk, first_index + i, batch[i][1], batch[i][2], band_keys.get(i))
             ))
             
-        if points:
-            # Batch upsert
-            self.qdrant.upsert(
+        return points
+
+    async def _vectors(self, chunks: list[str]) -> list[dict]:
+        """Vectores de cada chunk: denso y, con búsqueda híbrida, disperso."""
+        # Dense (API, agrupado) y Sparse (ONNX local) en paralelo
+        if settings.ENABLE_HYBRID_SEARCH:
+            dense_embeddings, sparse_vectors = await asyncio.gather(
+                self.get_embeddings(chunks),
+                self.get_sparse_vectors(chunks)
+            )
+        else:
+            dense_embeddings = await self.get_embeddings(chunks)
+            sparse_vectors = [None] * len(chunks)
+
+        vectors = []
+        for dense, sparse in zip(dense_embeddings, sparse_vectors):
+            vector_struct = {"dense": dense}
+            # Sparse Vector (Optional)
+            if sparse is not None:
+                vector_struct["sparse"] = sparse
+            vectors.append(vector_struct)
+        return vectors
+
+    def _payload(
+        self,
+        metadata: dict,
+        chunk: str,
+        chunk_index: int,
+        page_start: Optional[int],
+        page_end: Optional[int],
+        band_keys: Optional[list[str]]
+    ) -> dict:
+        # Enrich metadata
+        payload = metadata.copy()
+        payload["content"] = chunk
+        payload["chunk_index"] = chunk_index
+        if page_start is not None:
+            payload["page_start"] = page_start
+            payload["page_end"] = page_end
+        payload["referenced_by"] = [metadata.get("source_file", "")]
+        payload["references"] = [self._reference(metadata, page_start, page_end)]
+        if band_keys is not None:
+            payload["minhash_bands"] = band_keys
+        return payload
+
+    async def get_point_ids(self, source_file: str) -> set[str]:
+        """IDs ya indexados que pertenecen a un archivo o que este referencia (scroll sin payload ni vectores)."""
+        await self.initialize()
+        ids, offset = set(), None
+        while True:
+            records, offset = await self.qdrant.scroll(
                 collection_name=self.collection_name,
-                points=points
+                scroll_filter=models.Filter(should=[
+                    models.FieldCondition(key="source_file", match=models.MatchValue(value=source_file)),
+                    models.FieldCondition(key="referenced_by", match=models.MatchValue(value=source_file))
+                ]),
+                limit=1000,
+                offset=offset,
+                with_payload=False,
+                with_vectors=False
             )
-            
-        return len(points)
+            ids.update(str(r.id) for r in records)
+            if offset is None:
+                return ids
+
+    async def add_references(self, references: dict[str, SharedChunk]):
+        """
+        Agrega documentos a la lista de referencias de chunks canónicos ya indexados.
+        Si un canónico se borró mientras tanto (p. ej. se eliminó su documento), el chunk
+        se indexa con su propio ID y pasa a ser el canónico.
+        """
+        if not references:
+            return
+        records = await self.qdrant.retrieve(
+            collection_name=self.collection_name,
+            ids=list(references),
+            with_payload=True
+        )
+        current = {str(r.id): r.payload for r in records}
+        operations = []
+        for point_id, shared in references.items():
+            if point_id not in current:
+                continue
+            refs = current[point_id].get("references") or [self._reference(current[point_id])]
+            refs = [r for r in refs if r["source_file"] != shared.reference["source_file"]] + [shared.reference]
+            operations.append(models.SetPayloadOperation(set_payload=models.SetPayload(
+                payload={"references": refs, "referenced_by": [r["source_file"] for r in refs]},
+                points=[point_id]
+            )))
+        if operations:
+            await self.qdrant.batch_update_points(collection_name=self.collection_name, update_operations=operations)
+
+        orphans = [shared for point_id, shared in references.items() if point_id not in current]
+        if orphans:
+            print(
+                f"WARNING: {len(orphans)} canonical chunks referenced by {orphans[0].reference['source_file']} "
+                f"no longer exist, indexing them as canonical"
+            )
+            vectors = await self._vectors([shared.payload["content"] for shared in orphans])
+            await self.upsert_points([
+                models.PointStruct(id=shared.point_id, vector=vector, payload=shared.payload)
+                for shared, vector in zip(orphans, vectors)
+            ])
+        invalidate_answer_cache()
+
+    async def detach_points(self, source_file: str, point_ids: list[str]):
+        """
+        Quita `source_file` de los puntos indicados: se borran los que ya no referencia
+        ningún documento y, si el dueño era `source_file`, el chunk pasa a la siguiente referencia.
+        """
+        if not point_ids:
+            return
+        records = await self.qdrant.retrieve(
+            collection_name=self.collection_name,
+            ids=list(point_ids),
+            with_payload=True
+        )
+        to_delete, operations = [], []
+        for record in records:
+            refs = [r for r in record.payload.get("references", []) if r["source_file"] != source_file]
+            if not refs:
+                to_delete.append(str(record.id))
+                continue
+            payload = {"references": refs, "referenced_by": [r["source_file"] for r in refs]}
+            if record.payload.get("source_file") == source_file:
+                payload.update(refs[0])
+            operations.append(models.SetPayloadOperation(
+                set_payload=models.SetPayload(payload=payload, points=[record.id])
+            ))
+
+        if operations:
+            await self.qdrant.batch_update_points(collection_name=self.collection_name, update_operations=operations)
+        if to_delete:
+            await self.qdrant.delete(
+                collection_name=self.collection_name,
+                points_selector=models.PointIdsList(points=to_delete)
+            )
+        invalidate_answer_cache()
+        invalidate_query_catalog()
+
+    async def delete_document(self, source_file: str):
+        """Elimina un archivo (p. ej. si se borró del corpus), conservando los chunks que comparte con otros."""
+        await self.detach_points(source_file, list(await self.get_point_ids(source_file)))
+
+    async def upsert_points(self, points: list[models.PointStruct]):
+        if not points:
+            return
+        await self.initialize()
+        # Batch upsert
+        await self.qdrant.upsert(
+            collection_name=self.collection_name,
+            points=points
+        )
+        # Las respuestas cacheadas pueden haber quedado obsoletas
+        invalidate_answer_cache()
+        invalidate_query_catalog()
@@ -0,0 +1,158 @@
+from collections import deque
+from difflib import SequenceMatcher
+from typing import Optional
+
+import numpy as np
+
+
+class KeywordMatcher:
+    """
+    Anclas por ruta compiladas una vez:
+    - Aho-Corasick para coincidencias exactas (subcadena): una pasada por la consulta,
+      sin importar cuántas anclas haya.
+    - Matriz de conteo de caracteres por ancla para coincidencias aproximadas (equivalente a
+      difflib.get_close_matches con `cutoff`): la cota de quick_ratio de todas las anclas se
+      calcula vectorizada y solo las que pueden llegar al cutoff pasan por SequenceMatcher.
+    Las rutas se evalúan en el orden de `anchors` (la primera que coincide gana).
+    """
+
+    def __init__(self, anchors: dict[str, list[str]], cutoff: float = 0.8):
+        self.routes = list(anchors)
+        self.cutoff = cutoff
+        self._texts: list[str] = []
+        self._labels: list[int] = []
+        for label, texts in enumerate(anchors.values()):
+            for text in dict.fromkeys(t.lower().strip() for t in texts if t.strip()):
+                self._texts.append(text)
+                self._labels.append(label)
+        self._build_automaton()
+        self._build_char_index()
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+    # --- Exacto: Aho-Corasick ---
+
+    def _build_automaton(self):
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        # (label, largo) de las anclas que terminan en cada estado, incluidas las heredadas por fail,
+        # y la máscara de labels equivalente para el camino rápido
+        self._out: list[tuple[tuple[int, int], ...]] = [()]
+        self._out_mask: list[int] = [0]
+
+        for text, label in zip(self._texts, self._labels):
+            state = 0
+            for char in text:
+                nxt = self._goto[state].get(char)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][char] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                    self._out_mask.append(0)
+                state = nxt
+            self._out[state] += ((label, len(text)),)
+            self._out_mask[state] |= 1 << label
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(char, 0)
+                self._out[nxt] += self._out[self._fail[nxt]]
+                self._out_mask[nxt] |= self._out_mask[self._fail[nxt]]
+
+    @staticmethod
+    def _is_whole_word(text: str, start: int, end: int) -> bool:
+        """El ancla no empieza ni termina en medio de una palabra ("hi" no cuenta dentro de "vehiculo")."""
+        if start > 0 and text[start].isalnum() and text[start - 1].isalnum():
+            return False
+        return not (end < len(text) and text[end - 1].isalnum() and text[end].isalnum())
+
+    def _scan(self, text: str, whole_words: bool, first_only: bool) -> int:
+        """Máscara de rutas con alguna ancla en el texto; con `first_only` corta al encontrar la de mayor prioridad."""
+        goto, fail, out, out_mask = self._goto, self._fail, self._out, self._out_mask
+        found, state = 0, 0
+        for pos, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out_mask[state]:
+                if whole_words:
+                    for label, length in out[state]:
+                        if self._is_whole_word(text, pos - length + 1, pos + 1):
+                            found |= 1 << label
+                else:
+                    found |= out_mask[state]
+                if first_only and found & 1:
+                    break
+        return found
+
+    def exact(self, text: str, whole_words: bool = False) -> Optional[str]:
+        """Ruta de mayor prioridad con alguna ancla contenida en el texto (como palabras completas si `whole_words`)."""
+        found = self._scan(text, whole_words, first_only=True)
+        if not found:
+            return None
+        # Bit menos significativo = ruta de mayor prioridad
+        return self.routes[(found & -found).bit_length() - 1]
+
+    def matches(self, text: str, whole_words: bool = False) -> list[str]:
+        """Todas las rutas con alguna ancla en el texto, en orden de prioridad."""
+        found = self._scan(text, whole_words, first_only=False)
+        return [route for label, route in enumerate(self.routes) if found >> label & 1]
+
+    # --- Aproximado: conteo de caracteres ---
+
+    def _build_char_index(self):
+        alphabet = sorted({char for text in self._texts for char in text})
+        self._char_ids = {char: i for i, char in enumerate(alphabet)}
+        self._char_counts = np.zeros((len(self._texts), len(alphabet)), dtype=np.int32)
+        for i, text in enumerate(self._texts):
+            for char in text:
+                self._char_counts[i, self._char_ids[char]] += 1
+        self._lengths = np.asarray([len(text) for text in self._texts], dtype=np.float64)
+
+    def fuzzy(self, text: str, floor: Optional[float] = None) -> tuple[Optional[str], float]:
+        """
+        (ruta, ratio) del ancla más parecida al texto completo con ratio >= cutoff,
+        respetando la prioridad de rutas; (None, mejor ratio) si ninguna llega.
+        Con `floor` < cutoff el mejor ratio también se calcula para anclas entre floor y cutoff.
+        """
+        threshold = min(floor, self.cutoff) if floor is not None else self.cutoff
+        if not text or not self._texts:
+            return None, 0.0
+        query_counts = np.zeros(len(self._char_ids), dtype=np.int32)
+        for char in text:
+            i = self._char_ids.get(char)
+            if i is not None:
+                query_counts[i] += 1
+
+        # quick_ratio de cada ancla (caracteres en común sin importar el orden): cota superior
+        # del ratio, con la misma fórmula que difflib; las que no llegan al umbral se descartan todas
+        common = np.minimum(self._char_counts, query_counts).sum(axis=1)
+        bound = 2.0 * common / (len(text) + self._lengths)
+        ids = np.flatnonzero(bound >= threshold)
+        candidates = ids[np.argsort(-bound[ids], kind="stable")].tolist()
+
+        best_label, best_ratio = None, 0.0
+        matcher = SequenceMatcher()
+        matcher.set_seq2(text)
+        for i in candidates:
+            matcher.set_seq1(self._texts[i])
+            ratio = matcher.ratio()
+            label = self._labels[i]
+            if ratio >= self.cutoff and (best_label is None or label < best_label or (label == best_label and ratio > best_ratio)):
+                best_label, best_ratio = label, ratio
+            elif best_label is None:
+                best_ratio = max(best_ratio, ratio)
+        return (self.routes[best_label] if best_label is not None else None), best_ratio
+
+    def match(self, text: str) -> Optional[str]:
+        text = text.lower().strip()
+        return self.exact(text) or self.fuzzy(text)[0]
@@ -0,0 +1,107 @@
+import re
+import time
+import unicodedata
+from typing import Optional
+
+from qdrant_client.http import models
+from ..core.config import settings
+from ..core.qdrant import get_qdrant_client
+
+# Palabras que no identifican por sí solas a una aseguradora ("Pacífico Seguros" -> "pacifico")
+_GENERIC_TOKENS = {"seguros", "seguro", "compania", "cia", "peru", "sa", "eps", "del", "de", "la", "el", "los", "las"}
+
+# Catálogo compartido: {campo: {valor original: patrón compilado}}
+_catalog: Optional[dict] = None
+_catalog_loaded_at = 0.0
+
+
+def normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[^\w\s]", " ", text).split())
+
+
+def invalidate_query_catalog():
+    """Llamar cuando cambian los documentos indexados (nuevas aseguradoras o tipos)."""
+    global _catalog
+    _catalog = None
+
+
+class QueryAnalyzer:
+    """
+    Extrae aseguradoras y tipos de documento de la consulta comparándola con
+    los valores reales del payload (facets de Qdrant sobre los índices KEYWORD)
+    y los convierte en un filtro de Qdrant.
+    """
+    FIELDS = ("insurer", "document_type")
+
+    def __init__(self):
+        self.qdrant = get_qdrant_client()
+        self.collection_name = settings.QDRANT_COLLECTION_NAME
+
+    @staticmethod
+    def _compile(field: str, value: str) -> Optional[re.Pattern]:
+        value_norm = normalize(value)
+        if not value_norm or value_norm == "desconocido":
+            return None
+
+        alternatives = [re.escape(value_norm)]
+        if field == "insurer":
+            # "Pacífico Seguros" también se reconoce como "pacifico"
+            alternatives += [
+                re.escape(token) for token in value_norm.split()
+                if len(token) >= 4 and token not in _GENERIC_TOKENS
+            ]
+        return re.compile(r"\b(?:" + "|".join(alternatives) + r")\b")
+
+    async def _load_catalog(self) -> dict:
+        global _catalog, _catalog_loaded_at
+        if _catalog is not None and time.monotonic() - _catalog_loaded_at < settings.QUERY_CATALOG_TTL_SECONDS:
+            return _catalog
+
+        catalog = {}
+        for field in self.FIELDS:
+            response = await self.qdrant.facet(
+                collection_name=self.collection_name,
+                key=field,
+                limit=settings.QUERY_CATALOG_MAX_VALUES
+            )
+            patterns = {}
+            for hit in response.hits:
+                pattern = self._compile(field, str(hit.value))
+                if pattern is not None:
+                    patterns[str(hit.value)] = pattern
+            catalog[field] = patterns
+
+        _catalog = catalog
+        _catalog_loaded_at = time.monotonic()
+        return catalog
+
+    async def analyze(self, query: str) -> dict[str, list[str]]:
+        """Devuelve {campo: [valores mencionados]} solo para los campos detectados."""
+        try:
+            catalog = await self._load_catalog()
+        except Exception as e:
+            print(f"Warning: could not load query catalog: {e}")
+            return {}
+
+        query_norm = normalize(query)
+        found = {}
+        for field, patterns in catalog.items():
+            values = [value for value, pattern in patterns.items() if pattern.search(query_norm)]
+            if values:
+                found[field] = values
+        return found
+
+    async def build_filter(self, query: str) -> Optional[models.Filter]:
+        found = await self.analyze(query)
+        if not found:
+            return None
+        # Un chunk compartido (deduplicado) coincide si cualquiera de sus documentos coincide
+        return models.Filter(must=[
+            models.Filter(should=[
+                models.FieldCondition(key=field, match=models.MatchAny(any=values)),
+                models.FieldCondition(key=f"references[].{field}", match=models.MatchAny(any=values))
+            ])
+            for field, values in found.items()
+        ])
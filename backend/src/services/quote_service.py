@@ -1,7 +1,35 @@
+import re
+from typing import Optional
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from ..domain.models import Policy, Rate, Quote, Customer
 from ..domain.schemas import QuoteRequest, QuoteResponse
+from .query_analyzer import normalize
+
+# (marca, modelo) del tarifario, cargado una vez por proceso
+_vehicle_catalog: Optional[list[tuple[str, str]]] = None
+
+_YEAR = re.compile(r"\b(19[89]\d|20[0-4]\d)\b")
+# Edad del conductor solo en expresiones que la atan a él ("tengo 30", "conductor de 30 años", "mi edad es 30");
+# un "NN años" suelto puede ser la antigüedad del auto o la experiencia manejando
+_DRIVER_WORDS = r"(?:conductor|conductora|chofer|asegurado|asegurada|titular|contratante)"
+_AGE_PATTERNS = (
+    re.compile(r"\btengo\s+(\d{2})\b(?!\s+anos\s+(?:de\s+experiencia|de\s+licencia|manejando|conduciendo))"),
+    re.compile(rf"\b{_DRIVER_WORDS}\s+(?:de\s+|tiene\s+)?(\d{{2}})\s+anos\b"),
+    re.compile(r"\bedad\s+(?:es\s+(?:de\s+)?|de\s+)?(\d{2})\b"),
+)
+_MIN_AGE, _MAX_AGE = 18, 99
+_USAGES = {"taxi": "Taxi", "carga": "Carga", "comercial": "Comercial"}
+
+
+def _driver_age(text_norm: str) -> Optional[int]:
+    """Edad del conductor entre 18 y 99; None si no hay, si está fuera de rango o si hay varias distintas."""
+    ages = {int(age) for pattern in _AGE_PATTERNS for age in pattern.findall(text_norm)}
+    if len(ages) != 1:
+        return None
+    age = ages.pop()
+    return age if _MIN_AGE <= age <= _MAX_AGE else None
+
 
 class QuoteService:
     def __init__(self, db: AsyncSession):
@@ -100,5 +128,41 @@ class QuoteService:
             
         return quotes
 
+    async def vehicle_catalog(self) -> list[tuple[str, str]]:
+        global _vehicle_catalog
+        if _vehicle_catalog is None:
+            result = await self.db.execute(select(Rate.brand, Rate.model).distinct())
+            _vehicle_catalog = [(brand, model) for brand, model in result.all() if brand and model]
+        return _vehicle_catalog
+
+    async def parse_request(self, text: str) -> Optional[QuoteRequest]:
+        """
+        QuoteRequest a partir de un mensaje libre ("Toyota Yaris 2020, tengo 30 años") si trae
+        modelo del tarifario, año y edad; None si falta algo (el agente pide los datos).
+        """
+        text_norm = normalize(text)
+        vehicles = [
+            (brand, model) for brand, model in await self.vehicle_catalog()
+            if re.search(rf"\b{re.escape(normalize(model))}\b", text_norm)
+        ]
+        # Mismo modelo con otra marca (o ninguno): ambiguo
+        if len(vehicles) != 1:
+            return None
+
+        year = _YEAR.search(text_norm)
+        age = _driver_age(text_norm)
+        if year is None or age is None:
+            return None
+
+        brand, model = vehicles[0]
+        usage = next((value for word, value in _USAGES.items() if re.search(rf"\b{word}\b", text_norm)), "Particular")
+        return QuoteRequest(
+            age=age,
+            car_brand=brand,
+            car_model=model,
+            car_year=int(year.group(1)),
+            usage=usage
+        )
+
     def normalize_text(self, text: str) -> str:
         return text.strip().title() if text else ""
@@ -1,60 +1,79 @@
-from qdrant_client import QdrantClient
 from qdrant_client.http import models
-from openai import AsyncOpenAI
-from flashrank import Ranker, RerankRequest
-from fastembed import SparseTextEmbedding
+from flashrank import RerankRequest
 from ..core.config import settings
+from ..core.qdrant import get_qdrant_client, search_params
+from .answer_cache import get_answer_cache
+from .embedding_cache import get_embedding_cache
+from .query_analyzer import QueryAnalyzer, normalize
+from ..core.inference import get_inference_executor, InferenceQueueFull
+from ..core.model_registry import get_model_registry
+from ..core.openai_client import get_openai_client
+from ..core.timing import stage, timed
+from collections import OrderedDict
 import asyncio
+from typing import Optional
 
 
-_qdrant_client = None
-_ranker = None
-_sparse_model = None
+# Memo de expansiones: consulta normalizada -> variantes (LRU)
+_expansion_memo: "OrderedDict[str, list[str]]" = OrderedDict()
 
 class RAGService:
     def __init__(self):
-        global _qdrant_client, _ranker, _sparse_model
-        
-        # Inicializar Qdrant
-        if _qdrant_client is None:
-            _qdrant_client = QdrantClient(
-                url=settings.QDRANT_URL,
-                api_key=settings.QDRANT_API_KEY
-            )
-        self.qdrant = _qdrant_client
+        # Cliente Qdrant asíncrono compartido
+        self.qdrant = get_qdrant_client()
         self.collection_name = settings.QDRANT_COLLECTION_NAME
         
-        # Inicializar LLM
-        self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+        # Inicializar LLM (cliente y pool HTTP compartidos)
+        self.client = get_openai_client()
         
-        # Inicializar Reranker (Once)
-        if settings.ENABLE_RERANKING and _ranker is None:
-            _ranker = Ranker(model_name=settings.RERANK_MODEL, cache_dir="/tmp/flashrank")
-        self.ranker = _ranker
-            
-        # Inicializar Sparse Model (Once)
-        if settings.ENABLE_HYBRID_SEARCH and _sparse_model is None:
-            _sparse_model = SparseTextEmbedding(model_name="Qdrant/bm42-all-minilm-l6-v2-attentions")
-        self.sparse_model = _sparse_model
+        self.query_analyzer = QueryAnalyzer()
 
     async def get_embedding(self, text: str) -> list[float]:
-        text = text.replace("\n", " ")
+        return (await self.get_embeddings([text]))[0]
+
+    @timed("embeddings")
+    async def get_embeddings(self, texts: list[str]) -> list[list[float]]:
+        """Embebe varias consultas en una sola llamada a la API (el orden se conserva)."""
+        texts = [t.replace("\n", " ") for t in texts]
+        return await get_embedding_cache().embed(
+            texts, settings.EMBEDDING_MODEL, settings.EMBEDDING_DIMENSIONS, self._create_embeddings
+        )
+
+    async def _create_embeddings(self, texts: list[str]) -> list[list[float]]:
         response = await self.client.embeddings.create(
-            input=[text],
-            model="text-embedding-3-small"
+            input=texts,
+            model=settings.EMBEDDING_MODEL,
+            dimensions=settings.EMBEDDING_DIMENSIONS
         )
-        return response.data[0].embedding
+        return [d.embedding for d in sorted(response.data, key=lambda d: d.index)]
         
-    def get_sparse_vector(self, text: str) -> models.SparseVector:
-        sparse_embedding = list(self.sparse_model.embed([text]))[0]
-        return models.SparseVector(
-            indices=sparse_embedding.indices.tolist(),
-            values=sparse_embedding.values.tolist()
+    async def get_sparse_vector(self, text: str) -> models.SparseVector:
+        return (await self.get_sparse_vectors([text]))[0]
+
+    @timed("sparse")
+    async def get_sparse_vectors(self, texts: list[str]) -> list[models.SparseVector]:
+        # BM42 corre en el executor de inferencia, fuera del event loop (y su carga en un thread)
+        sparse_model = await get_model_registry().aget("bm42")
+        embeddings = await get_inference_executor().run(
+            "bm42", lambda: list(sparse_model.embed(texts))
         )
+        return [
+            models.SparseVector(
+                indices=sparse_embedding.indices.tolist(),
+                values=sparse_embedding.values.tolist()
+            )
+            for sparse_embedding in embeddings
+        ]
 
+    @timed("expand_query")
     async def expand_query(self, query: str) -> list[str]:
         if not settings.ENABLE_QUERY_EXPANSION:
             return [query]
+
+        memo_key = normalize(query)
+        if memo_key in _expansion_memo:
+            _expansion_memo.move_to_end(memo_key)
+            return [query] + _expansion_memo[memo_key]
             
         system_prompt = """Eres un experto en seguros. Genera 3 variantes de búsqueda (sinónimos, términos técnicos) para la consulta del usuario.
         Responde SOLO con las variantes separadas por '||'. Ejemplo: 'Robo espejo||Hurto parcial||Cobertura accesorios'"""
@@ -70,41 +89,149 @@ class RAGService:
             )
             content = response.choices[0].message.content
             variants = [v.strip() for v in content.split("||")]
+            _expansion_memo[memo_key] = variants
+            while len(_expansion_memo) > settings.EXPANSION_MEMO_MAX_ENTRIES:
+                _expansion_memo.popitem(last=False)
             return [query] + variants
         except Exception:
             return [query]
 
-    async def retrieve_documents(self, queries: list[str], limit: int = 10) -> list[dict]:
+    def _build_query_request(self, dense_vector: list[float], sparse_vector: models.SparseVector | None, limit: int, query_filter: models.Filter | None = None) -> models.QueryRequest:
+        if sparse_vector is not None:
+            return models.QueryRequest(
+                prefetch=[
+                    models.Prefetch(
+                        query=sparse_vector,
+                        using="sparse",
+                        filter=query_filter,
+                        limit=settings.HYBRID_SPARSE_PREFETCH_LIMIT or limit * 2, 
+                    )
+                ],
+                query=dense_vector,
+                using="dense",
+                filter=query_filter,
+                params=search_params(),
+                limit=limit,
+                with_payload=True
+            )
+
+        return models.QueryRequest(
+            query=dense_vector,
+            using="dense",
+            filter=query_filter,
+            params=search_params(),
+            limit=limit,
+            with_payload=True
+        )
+
+    def _build_fusion_request(self, dense_vectors: list[list[float]], sparse_vectors: list[models.SparseVector], limit: int, fusion: str, query_filter: models.Filter | None = None) -> models.QueryRequest:
+        """Una sola consulta: prefetch denso + disperso de todas las variantes, fusionados en el servidor."""
+        prefetch = []
+        for dense, sparse in zip(dense_vectors, sparse_vectors):
+            prefetch.append(models.Prefetch(
+                query=dense,
+                using="dense",
+                filter=query_filter,
+                params=search_params(),
+                limit=settings.HYBRID_DENSE_PREFETCH_LIMIT or limit * 2
+            ))
+            prefetch.append(models.Prefetch(
+                query=sparse,
+                using="sparse",
+                filter=query_filter,
+                limit=settings.HYBRID_SPARSE_PREFETCH_LIMIT or limit * 2
+            ))
+
+        return models.QueryRequest(
+            prefetch=prefetch,
+            query=models.FusionQuery(
+                fusion=models.Fusion.DBSF if fusion == "dbsf" else models.Fusion.RRF
+            ),
+            # Mismo tamaño de candidatos para el reranker que la ruta por variante
+            limit=limit * len(dense_vectors),
+            with_payload=True
+        )
+
+    async def retrieve_documents(self, queries: list[str], limit: int = 10, fusion: str | None = None, query_filter: models.Filter | None = None) -> list[dict]:
+        """
+        Recupera documentos para todas las variantes de la consulta en bloque:
+        un solo request de embeddings, un solo batch de BM42 y una sola ida a
+        Qdrant (con fusión RRF/DBSF, una única consulta con todos los prefetch).
+        """
+        if not queries:
+            return []
+
+        fusion = fusion or settings.HYBRID_FUSION_MODE
+        dense_vectors = await self.get_embeddings(queries)
+
+        hybrid = settings.ENABLE_HYBRID_SEARCH
+        sparse_vectors = [None] * len(queries)
+        if hybrid:
+            try:
+                sparse_vectors = await self.get_sparse_vectors(queries)
+            except InferenceQueueFull:
+                # Bajo saturación degradamos a búsqueda solo densa, como el rerank
+                print("WARNING: Inference queue full, skipping sparse vectors.")
+                hybrid = False
+
+        if hybrid and fusion in ("rrf", "dbsf"):
+            requests = [self._build_fusion_request(dense_vectors, sparse_vectors, limit, fusion, query_filter)]
+        else:
+            requests = [
+                self._build_query_request(dense, sparse, limit, query_filter)
+                for dense, sparse in zip(dense_vectors, sparse_vectors)
+            ]
+        with stage("qdrant"):
+            responses = await self.qdrant.query_batch_points(
+                collection_name=self.collection_name,
+                requests=requests
+            )
+
+        return self._merge_results([r.points for r in responses])
+
+    async def retrieve_pipelined(
+        self,
+        query: str,
+        limit: int = 10,
+        query_filter: models.Filter | None = None,
+        expansion: asyncio.Task | None = None,
+        deadline: float | None = None
+    ) -> list[dict]:
+        """
+        Lanza la expansión (LLM) y la recuperación de la consulta original a la vez.
+        Las variantes se recuperan en cuanto llega la expansión, sin esperar a la primera
+        pasada; si no responde antes de QUERY_EXPANSION_TIMEOUT_SECONDS (o de `deadline`,
+        en tiempo del loop) se continúa solo con la consulta original.
+        `expansion` permite reutilizar una expansión ya lanzada.
+        """
+        loop = asyncio.get_running_loop()
+        if deadline is None:
+            deadline = loop.time() + settings.QUERY_EXPANSION_TIMEOUT_SECONDS
+        if expansion is None:
+            expansion = asyncio.create_task(self.expand_query(query))
+
+        async def retrieve_variants() -> list[dict]:
+            try:
+                # shield: si vence el plazo la expansión sigue y queda memoizada para la próxima vez
+                queries = await asyncio.wait_for(asyncio.shield(expansion), timeout=max(0.0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                print(f"Query expansion missed its deadline, continuing without variants: '{query}'")
+                return []
+            variants = [q for q in queries if q and q != query]
+            if not variants:
+                return []
+            return await self.retrieve_documents(variants, limit=limit, query_filter=query_filter)
+
+        docs, variant_docs = await asyncio.gather(
+            self.retrieve_documents([query], limit=limit, query_filter=query_filter),
+            retrieve_variants()
+        )
+        return self._merge_docs(docs, variant_docs)
+
+    def _merge_results(self, results_per_query: list[list]) -> list[dict]:
         all_docs = {}
         
-        for q in queries:
-            dense_vector = await self.get_embedding(q)
-            
-            if settings.ENABLE_HYBRID_SEARCH:
-                sparse_vector = self.get_sparse_vector(q)
-                
-                results = self.qdrant.query_points(
-                    collection_name=self.collection_name,
-                    prefetch=[
-                        models.Prefetch(
-                            query=sparse_vector,
-                            using="sparse",
-                            limit=limit * 2, 
-                        )
-                    ],
-                    query=dense_vector,
-                    using="dense",
-                    limit=limit,
-                    with_payload=True
-                ).points
-                
-            else:
-                results = self.qdrant.query_points(
-                    collection_name=self.collection_name,
-                    query=dense_vector,
-                    limit=limit
-                ).points
-
+        for results in results_per_query:
             for res in results:
                 if res.payload:
                      doc_id = res.id 
@@ -118,6 +245,14 @@ class RAGService:
         
         return list(all_docs.values())
 
+    def _merge_docs(self, *doc_lists: list[dict]) -> list[dict]:
+        all_docs = {}
+        for docs in doc_lists:
+            for doc in docs:
+                if doc["id"] not in all_docs or doc["score"] > all_docs[doc["id"]]["score"]:
+                    all_docs[doc["id"]] = doc
+        return list(all_docs.values())
+
     async def rerank_documents(self, query: str, docs: list[dict]) -> list[dict]:
         if not settings.ENABLE_RERANKING or not docs:
             return docs
@@ -128,7 +263,14 @@ class RAGService:
         ]
         
         rerank_request = RerankRequest(query=query, passages=passages)
-        results = self.ranker.rerank(rerank_request)
+        ranker = await get_model_registry().aget("flashrank")
+        try:
+            with stage("rerank"):
+                results = await get_inference_executor().run("flashrank", ranker.rerank, rerank_request)
+        except InferenceQueueFull:
+            # Bajo saturación degradamos al orden de Qdrant en vez de encolar sin límite
+            print("WARNING: Inference queue full, skipping rerank.")
+            return sorted(docs, key=lambda d: d["score"], reverse=True)
         
         reranked_docs = []
         for res in results:
@@ -142,9 +284,70 @@ class RAGService:
         return reranked_docs
 
     async def answer_legal_query(self, query: str, force_table: bool = False) -> dict:
+        if not settings.ENABLE_ANSWER_CACHE:
+            return await self._answer_legal_query(query, force_table)
+
+        cache = get_answer_cache()
+        cached = cache.get(query, force_table)
+        if cached is not None:
+            return cached
+
+        # Near-duplicates: comparar el embedding de la consulta con los ya respondidos que
+        # mencionan las mismas aseguradoras / tipos de documento
+        query_embedding, entities = None, None
+        if cache.semantic_enabled:
+            query_embedding, entities = await asyncio.gather(
+                self.get_embedding(query),
+                self.query_analyzer.analyze(query)
+            )
+        cached = cache.get_similar(query_embedding, force_table, entities)
+        if cached is not None:
+            return cached
+
+        result = await self._answer_legal_query(query, force_table)
+        cache.put(query, force_table, result, query_embedding, entities)
+        return result
+
+    async def _retrieve_for_answer(self, query: str, expansion: asyncio.Task, deadline: float, query_filter: models.Filter | None = None) -> list[dict]:
+        if settings.ENABLE_QUERY_EXPANSION and settings.ENABLE_PIPELINED_EXPANSION:
+            return await self.retrieve_pipelined(query, query_filter=query_filter, expansion=expansion, deadline=deadline)
+        return await self.retrieve_documents(await expansion, query_filter=query_filter)
+
+    @staticmethod
+    def _page_label(metadata: dict) -> Optional[str]:
+        """"4" o "4-5" según el rango de páginas del chunk (None en chunks sin páginas)."""
+        start, end = metadata.get("page_start"), metadata.get("page_end")
+        if start is None:
+            return None
+        return str(start) if end in (None, start) else f"{start}-{end}"
+
+    @staticmethod
+    def _references(metadata: dict) -> list[dict]:
+        """Documentos que contienen el chunk (varios si se deduplicó entre documentos)."""
+        return metadata.get("references") or [metadata]
+
+    def _cite(self, metadata: dict) -> str:
+        citations = []
+        for reference in self._references(metadata):
+            pages = self._page_label(reference)
+            source = reference.get("source_file")
+            citations.append(f"{source} (pág. {pages})" if pages else f"{source}")
+        return "; ".join(citations)
+
+    async def _answer_legal_query(self, query: str, force_table: bool = False) -> dict:
         # Pipeline ejecución
-        queries = await self.expand_query(query)
-        docs = await self.retrieve_documents(queries)
+        query_filter = None
+        if settings.ENABLE_METADATA_FILTERS:
+            query_filter = await self.query_analyzer.build_filter(query)
+
+        # Una sola expansión (y un solo plazo) para la búsqueda filtrada y la de respaldo
+        expansion = asyncio.create_task(self.expand_query(query))
+        deadline = asyncio.get_running_loop().time() + settings.QUERY_EXPANSION_TIMEOUT_SECONDS
+
+        docs = await self._retrieve_for_answer(query, expansion, deadline, query_filter)
+        if query_filter is not None and len(docs) < settings.METADATA_FILTER_MIN_RESULTS:
+            # Muy pocos resultados con el filtro: completar con búsqueda sin filtrar
+            docs = self._merge_docs(docs, await self._retrieve_for_answer(query, expansion, deadline))
         
         if settings.ENABLE_RERANKING:
             docs = await self.rerank_documents(query, docs)
@@ -154,26 +357,33 @@ class RAGService:
             return {"answer": "No encontré información relevante en las pólizas cargadas.", "sources": []}
 
         context = "\n\n".join([
-            f"--- Doc: {d.get('metadata', {}).get('source_file')} ---\n{d['content']}" 
+            f"--- Doc: {self._cite(d.get('metadata', {}))} ---\n{d['content']}" 
             for d in docs
         ])
         
         unique_sources_map = {}
+        source_pages = {}
         for d in docs:
-            fname = d.get('metadata', {}).get('source_file', 'Unknown')
-            if fname not in unique_sources_map:
-                unique_sources_map[fname] = {
-                    "title": fname,
-                    "content": d['content'],
-                    "id": str(d.get("id", "")),
-                    "score": float(d.get("score")) if d.get("score") is not None else None
-                }
+            for reference in self._references(d.get('metadata', {})):
+                fname = reference.get('source_file') or 'Unknown'
+                pages = self._page_label(reference)
+                if pages and pages not in source_pages.setdefault(fname, []):
+                    source_pages[fname].append(pages)
+                if fname not in unique_sources_map:
+                    unique_sources_map[fname] = {
+                        "title": fname,
+                        "content": d['content'],
+                        "id": str(d.get("id", "")),
+                        "score": float(d.get("score")) if d.get("score") is not None else None
+                    }
+        for fname, pages in source_pages.items():
+            unique_sources_map[fname]["pages"] = ", ".join(pages)
         
         rich_sources = list(unique_sources_map.values())
 
         system_prompt = """Eres un experto en seguros. Responde usando SOLO el contexto proporcionado.
         - Resalta montos, porcentajes y monedas (USD, Soles).
-        - Cita la fuente del documento (ej: "Según Plan Km...").
+        - Cita la fuente del documento y su página si está disponible (ej: "Según Plan Km..., pág. 4").
         """
 
         if force_table:
@@ -189,16 +399,28 @@ class RAGService:
         if force_table:
             user_content += "\n\nGENERAR TABLA COMPARATIVA MARKDOWN DETALLADA."
 
-        response = await self.client.chat.completions.create(
-            model=settings.LLM_MODEL,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_content}
-            ],
-            temperature=settings.LLM_TEMPERATURE
-        )
+        with stage("llm_answer"):
+            response = await self.client.chat.completions.create(
+                model=settings.LLM_MODEL,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_content}
+                ],
+                temperature=settings.LLM_TEMPERATURE
+            )
         
         return {
             "answer": response.choices[0].message.content,
             "sources": rich_sources
         }
+
+
+_rag_service: Optional[RAGService] = None
+
+
+def get_rag_service() -> RAGService:
+    """Instancia compartida por proceso (cliente OpenAI, modelos locales y analizador de consultas)."""
+    global _rag_service
+    if _rag_service is None:
+        _rag_service = RAGService()
+    return _rag_service
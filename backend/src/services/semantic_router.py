@@ -1,179 +1,307 @@
-from qdrant_client import QdrantClient
 from qdrant_client.http import models
 from ..core.config import settings
+from ..core.qdrant import get_qdrant_client
+from ..core.inference import get_inference_executor, InferenceQueueFull
+from ..core.model_registry import get_model_registry
+from ..core.metrics import Counter
+from ..core.timing import timed
+from dataclasses import dataclass
 from typing import List, Optional
+import asyncio
 import uuid
-from fastembed import TextEmbedding
-import difflib
+import numpy as np
+from .keyword_matcher import KeywordMatcher
+from .query_analyzer import normalize
 
 # Global instances for pre-warming and sharing
-_embedding_model = None
-_qdrant_client = None
+_anchor_index: Optional["AnchorIndex"] = None
+_anchor_lock = asyncio.Lock()
+_keyword_matcher: Optional[KeywordMatcher] = None
+_intent_matcher: Optional[KeywordMatcher] = None
+
+# Espacio de nombres para IDs deterministas de anclas en Qdrant (uuid5 de "tipo:texto")
+ANCHOR_ID_NAMESPACE = uuid.UUID("3a9f6c1e-8d2b-4f7a-b5e4-0c1d2e3f4a5b")
+
+GREETING_ANCHORS = [
+    "hola", "buenos dias", "buenas tardes", "buenas noches", 
+    "hey", "hello", "hi", "que tal", "como estas", "saludos"
+]
+
+UNSAFE_ANCHORS = [
+    "ignore previous instructions", "system prompt", "delete database", 
+    "drop table", "exec(", "eval(", "import os", "rm -rf", 
+    "write python code", "generame codigo", "hackear", "bypass security",
+]
+
+# Intenciones de negocio (texto normalizado, sin tildes) que se despachan directo a una tool.
+# FOLLOW_UP marca turnos que dependen del anterior: esos los resuelve el agente con el historial.
+INTENT_ANCHORS = {
+    "FOLLOW_UP": [
+        "eso", "esa", "ese", "esos", "esas", "esto", "lo mismo", "tambien", "anterior",
+        "mencionaste", "dijiste", "me dijiste", "lo de antes",
+    ],
+    "QUOTE": [
+        "cotiza", "cotizar", "cotizame", "cotizacion", "cotizaciones", "precio", "precios",
+        "cuanto cuesta", "cuanto sale", "cuanto costaria", "cuanto pagaria", "cuanto me cobran",
+        "prima", "tarifa", "tarifas", "costo",
+    ],
+    "COMPARE": [
+        "compara", "comparar", "comparame", "comparacion", "comparativa", "comparativo",
+        "diferencia entre", "diferencias entre", "versus", "vs", "cual es mejor", "cual conviene",
+    ],
+    "LEGAL": [
+        "cubre", "cubren", "cubierto", "cubierta", "cobertura", "coberturas", "exclusion",
+        "exclusiones", "excluye", "excluido", "deducible", "deducibles", "clausula", "clausulas",
+        "condiciones", "condicionado", "siniestro", "indemnizacion", "poliza",
+    ],
+}
+
+# Similitud coseno mínima para aceptar cada ruta en modo semántico
+SEMANTIC_THRESHOLDS = {"UNSAFE": 0.60, "GREETING": 0.65}
+
+# Similitud mínima (ratio de difflib) para una coincidencia aproximada por palabras clave
+KEYWORD_CUTOFF = 0.8
+
+ROUTER_DECISIONS = Counter(
+    "router_decisions_total",
+    "Mensajes enrutados por modo y etapa que decidió (keyword, embedding)",
+)
+
+
+@dataclass
+class RouteResult:
+    route: Optional[str]  # "GREETING", "UNSAFE" o None
+    # Similitud con el ancla más cercana: 1.0 coincidencia exacta, ratio de difflib o coseno de MiniLM
+    confidence: float
+    stage: str  # "keyword" o "embedding"
+
+
+class AnchorIndex:
+    """Embeddings de las anclas como matriz normalizada en memoria: una ruta = un producto matriz-vector."""
+
+    def __init__(self, labels: List[str], texts: List[str], vectors: List[List[float]]):
+        self.labels = labels
+        self.texts = texts
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        self.matrix = matrix / np.where(norms == 0, 1, norms)
+
+    def match(self, vector: List[float]) -> tuple[Optional[str], float]:
+        if not self.labels:
+            return None, 0.0
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        scores = self.matrix @ (query / norm if norm else query)
+        best = int(np.argmax(scores))
+        return self.labels[best], float(scores[best])
+
+
+def get_keyword_matcher() -> KeywordMatcher:
+    global _keyword_matcher
+    if _keyword_matcher is None:
+        # Mismo orden que antes: un saludo gana sobre un patrón inseguro
+        _keyword_matcher = KeywordMatcher({"GREETING": GREETING_ANCHORS, "UNSAFE": UNSAFE_ANCHORS}, cutoff=KEYWORD_CUTOFF)
+    return _keyword_matcher
+
+
+def get_intent_matcher() -> KeywordMatcher:
+    global _intent_matcher
+    if _intent_matcher is None:
+        _intent_matcher = KeywordMatcher(INTENT_ANCHORS, cutoff=KEYWORD_CUTOFF)
+    return _intent_matcher
+
 
 class SemanticRouter:
-    def __init__(self):
-        global _embedding_model, _qdrant_client
-        
-        self.mode = settings.SEMANTIC_ROUTER_MODE
+    def __init__(self, mode: Optional[str] = None):
+        self.mode = mode or settings.SEMANTIC_ROUTER_MODE
         self.vector_size = 384
         
-        # Solo cargamos modelos pesados si el modo es "semantic"
-        if self.mode == "semantic":
-            if _embedding_model is None:
-                _embedding_model = TextEmbedding(model_name="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
-            if _qdrant_client is None:
-                _qdrant_client = QdrantClient(
-                    url=settings.QDRANT_URL, 
-                    api_key=settings.QDRANT_API_KEY
-                )
-            self.embedding_model = _embedding_model
-            self.qdrant = _qdrant_client
-        else:
-            self.embedding_model = None
-            self.qdrant = None
+        # Solo usamos modelos pesados si el modo usa embeddings (MiniLM del registro de modelos,
+        # pedido en _get_embeddings_batch con aget para no bloquear el event loop)
+        self.qdrant = get_qdrant_client() if self.mode in ("semantic", "cascade") else None
 
         self.collection_name = settings.QDRANT_SEMANTIC_COLLECTION_NAME
         
-        self.greeting_anchors = [
-            "hola", "buenos dias", "buenas tardes", "buenas noches", 
-            "hey", "hello", "hi", "que tal", "como estas", "saludos"
-        ]
-        
-        self.unsafe_anchors = [
-            "ignore previous instructions", "system prompt", "delete database", 
-            "drop table", "exec(", "eval(", "import os", "rm -rf", 
-            "write python code", "generame codigo", "hackear", "bypass security",
-        ]
+        self.greeting_anchors = GREETING_ANCHORS
+        self.unsafe_anchors = UNSAFE_ANCHORS
+
+    def _anchors(self) -> list[tuple[str, str]]:
+        return [("GREETING", text) for text in self.greeting_anchors] + [("UNSAFE", text) for text in self.unsafe_anchors]
+
+    @staticmethod
+    def _anchor_id(route_type: str, text: str) -> str:
+        return str(uuid.uuid5(ANCHOR_ID_NAMESPACE, f"{route_type}:{text}"))
 
-    async def initialize(self):
+    async def initialize(self) -> AnchorIndex:
         """
-        Asegúrese de que la colección exista y rellénela si está vacía. 
-        Gestiona la migración si cambia el tamaño del vector.
+        Construye una sola vez (por proceso) la matriz de anclas. Qdrant solo persiste
+        el conjunto: si ya tiene exactamente estas anclas se cargan sus vectores; si no,
+        se embeben localmente y se sincroniza la colección.
         """
-        try:
-            # Comprobar si existe la colección
-            exists = self.qdrant.collection_exists(self.collection_name)
-            
-            if exists:
-                collection_info = self.qdrant.get_collection(self.collection_name)
-                if collection_info.config.params.vectors.size != self.vector_size:
-                    print(f"Vector dimension mismatch (found {collection_info.config.params.vectors.size}, expected {self.vector_size}). Recreating collection...")
-                    self.qdrant.delete_collection(self.collection_name)
-                    exists = False
-
-            if not exists:
-                # Crear colección
-                self.qdrant.create_collection(
-                    collection_name=self.collection_name,
-                    vectors_config=models.VectorParams(
-                        size=self.vector_size,
-                        distance=models.Distance.COSINE
-                    )
-                )
-                
-                await self._populate_initial_anchors()
-            else:
-                count = self.qdrant.count(self.collection_name).count
-                if count == 0:
-                     await self._populate_initial_anchors()
-                     
-        except Exception as e:
-            print(f"Error al inicializar SemanticRouter (Qdrant): {e}")
-
-    async def _populate_initial_anchors(self):        
-        # Saludos / despedidas
-        greeting_embs = await self._get_embeddings_batch(self.greeting_anchors)
-        points = []
-        for i, text in enumerate(self.greeting_anchors):
-            points.append(models.PointStruct(
-                id=str(uuid.uuid4()),
-                vector=greeting_embs[i],
-                payload={"type": "GREETING", "text": text}
-            ))
-            
-        # Mensajes potencialmente peligrosos
-        unsafe_embs = await self._get_embeddings_batch(self.unsafe_anchors)
-        for i, text in enumerate(self.unsafe_anchors):
-            points.append(models.PointStruct(
-                id=str(uuid.uuid4()),
-                vector=unsafe_embs[i],
-                payload={"type": "UNSAFE", "text": text}
-            ))
-            
-        if points:
-            self.qdrant.upsert(
-                collection_name=self.collection_name,
-                points=points
+        global _anchor_index
+        if _anchor_index is not None:
+            return _anchor_index
+
+        async with _anchor_lock:
+            if _anchor_index is not None:
+                return _anchor_index
+
+            anchors = self._anchors()
+            vectors = None
+            try:
+                vectors = await self._load_persisted(anchors)
+            except Exception as e:
+                print(f"Error al leer anclas de SemanticRouter (Qdrant): {e}")
+
+            if vectors is None:
+                vectors = await self._get_embeddings_batch([text for _, text in anchors])
+                try:
+                    await self._sync_anchors(anchors, vectors)
+                except Exception as e:
+                    print(f"Error al sincronizar anclas de SemanticRouter (Qdrant): {e}")
+
+            _anchor_index = AnchorIndex([t for t, _ in anchors], [text for _, text in anchors], vectors)
+            return _anchor_index
+
+    async def _load_persisted(self, anchors: list[tuple[str, str]]) -> Optional[List[List[float]]]:
+        """Vectores guardados en Qdrant, o None si la colección no coincide con las anclas actuales."""
+        if not await self.qdrant.collection_exists(self.collection_name):
+            return None
+        collection_info = await self.qdrant.get_collection(self.collection_name)
+        if collection_info.config.params.vectors.size != self.vector_size:
+            return None
+
+        records = (await self.qdrant.retrieve(
+            collection_name=self.collection_name,
+            ids=[self._anchor_id(t, text) for t, text in anchors],
+            with_vectors=True
+        ))
+        by_id = {str(r.id): r.vector for r in records}
+        if len(by_id) != len(anchors) or (await self.qdrant.count(self.collection_name)).count != len(anchors):
+            return None
+        return [by_id[self._anchor_id(t, text)] for t, text in anchors]
+
+    async def _sync_anchors(self, anchors: list[tuple[str, str]], vectors: List[List[float]]):
+        """Re-crea la colección de anclas con el conjunto actual (IDs deterministas)."""
+        if await self.qdrant.collection_exists(self.collection_name):
+            await self.qdrant.delete_collection(self.collection_name)
+        await self.qdrant.create_collection(
+            collection_name=self.collection_name,
+            vectors_config=models.VectorParams(
+                size=self.vector_size,
+                distance=models.Distance.COSINE
             )
+        )
+        await self.qdrant.upsert(
+            collection_name=self.collection_name,
+            points=[
+                models.PointStruct(
+                    id=self._anchor_id(route_type, text),
+                    vector=vector,
+                    payload={"type": route_type, "text": text}
+                )
+                for (route_type, text), vector in zip(anchors, vectors)
+            ]
+        )
 
     async def _get_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
-        # FastEmbed es sincrono
-        embeddings = list(self.embedding_model.embed(texts))
+        # FastEmbed es sincrono: se ejecuta en el executor de inferencia
+        embedding_model = await get_model_registry().aget("minilm")
+        embeddings = await get_inference_executor().run(
+            "minilm", lambda: list(embedding_model.embed(texts))
+        )
         return [e.tolist() for e in embeddings]
 
     async def get_embedding(self, text: str) -> List[float]:
         text = text.replace("\n", " ")
-        embeddings = list(self.embedding_model.embed([text]))
-        return embeddings[0].tolist()
+        return (await self._get_embeddings_batch([text]))[0]
 
+    @timed("router")
     async def route(self, query: str) -> Optional[str]:
         """
         Returns 'GREETING', 'UNSAFE', or None.
         """
+        return (await self.classify(query)).route
+
+    async def classify(self, query: str) -> RouteResult:
         if self.mode == "keyword":
+            result = await self._route_keyword(query)
+        elif self.mode == "cascade":
+            result = await self._route_cascade(query)
+        else:
+            result = await self._route_semantic(query)
+        ROUTER_DECISIONS.inc(mode=self.mode, stage=result.stage)
+        return result
+
+    async def _route_semantic(self, query: str) -> RouteResult:
+        # Modo Semántico: sin Qdrant en el camino crítico
+        try:
+            index = await self.initialize()
+            query_vector = await self.get_embedding(query)
+        except InferenceQueueFull:
+            # Bajo saturación degradamos al router por palabras clave en vez de rechazar el mensaje
+            print("WARNING: Inference queue full, routing by keywords.")
             return await self._route_keyword(query)
-        
-        # Modo Semántico (Original)
-        await self.initialize()
+        route_type, score = index.match(query_vector)
 
-        query_vector = await self.get_embedding(query)
-        
-        results = self.qdrant.query_points(
-            collection_name=self.collection_name,
-            query=query_vector,
-            limit=1,
-            with_payload=True
-        ).points
-        
-        if not results:
-            return None
-            
-        top_match = results[0]
-        score = top_match.score
-        route_type = top_match.payload.get("type")
-        
-        # Thresholds
-        unsafe_threshold = 0.60 
-        greeting_threshold = 0.65
-        
-        if route_type == "UNSAFE" and score > unsafe_threshold:
-            return "UNSAFE"
-            
-        if route_type == "GREETING" and score > greeting_threshold:
-            return "GREETING"
-            
-        return None
-
-    async def _route_keyword(self, query: str) -> Optional[str]:
+        if route_type is not None and score > SEMANTIC_THRESHOLDS.get(route_type, 1.0):
+            return RouteResult(route_type, score, "embedding")
+        return RouteResult(None, score, "embedding")
+
+    async def _route_keyword(self, query: str) -> RouteResult:
         """
-        Versión ultra-ligera usando difflib.
+        Versión ultra-ligera: Aho-Corasick (exacto) + conteo de caracteres (aproximado), compilados una vez.
         """
-        query_lower = query.lower().strip()
-        
-        # 1. Búsqueda exacta rápida
-        if any(word in query_lower for word in self.greeting_anchors):
-            return "GREETING"
-        
-        if any(word in query_lower for word in self.unsafe_anchors):
-            return "UNSAFE"
-            
-        # 2. Búsqueda por similitud (difflib) para capturar tipos
-        close_greetings = difflib.get_close_matches(query_lower, self.greeting_anchors, n=1, cutoff=0.8)
-        if close_greetings:
-            return "GREETING"
-            
-        close_unsafe = difflib.get_close_matches(query_lower, self.unsafe_anchors, n=1, cutoff=0.8)
-        if close_unsafe:
-            return "UNSAFE"
-            
-        return None
+        matcher = get_keyword_matcher()
+        text = query.lower().strip()
+        route = matcher.exact(text)
+        if route:
+            return RouteResult(route, 1.0, "keyword")
+        route, ratio = matcher.fuzzy(text)
+        return RouteResult(route, ratio, "keyword")
+
+    async def _route_cascade(self, query: str) -> RouteResult:
+        """
+        Keyword primero; el embedding solo se paga si el mensaje es ambiguo:
+        - Ancla exacta como palabras completas o aproximada >= cutoff: se responde ya.
+        - Mensaje corto, ancla dentro de otra palabra ("hi" en "vehiculo") o similitud
+          entre ROUTER_CASCADE_FUZZY_FLOOR y el cutoff: decide MiniLM.
+        - El resto (consultas largas sin señal) pasa directo al agente.
+        """
+        matcher = get_keyword_matcher()
+        text = query.lower().strip()
+        route = matcher.exact(text, whole_words=True)
+        if route:
+            return RouteResult(route, 1.0, "keyword")
+
+        floor = settings.ROUTER_CASCADE_FUZZY_FLOOR
+        route, ratio = matcher.fuzzy(text, floor=floor)
+        if route:
+            return RouteResult(route, ratio, "keyword")
+
+        ambiguous = (
+            len(text.split()) <= settings.ROUTER_CASCADE_MAX_WORDS
+            or ratio >= floor
+            or matcher.exact(text) is not None
+        )
+        if not ambiguous:
+            return RouteResult(None, ratio, "keyword")
+        return await self._route_semantic(query)
+
+    async def intent(self, query: str) -> RouteResult:
+        """
+        Intención de negocio por anclas exactas (palabras completas): QUOTE, COMPARE o LEGAL.
+        None si no hay ninguna, si mezcla cotización con condiciones o si el turno depende
+        del anterior ("¿y eso?"): esos casos quedan para el agente.
+        """
+        text = normalize(query)
+        intents = get_intent_matcher().matches(text, whole_words=True)
+        if not intents or "FOLLOW_UP" in intents or text.startswith("y "):
+            return RouteResult(None, 0.0, "keyword")
+
+        if "QUOTE" in intents:
+            route = "QUOTE" if len(intents) == 1 else None
+        else:
+            # Una comparación casi siempre menciona coberturas o deducibles: COMPARE gana sobre LEGAL
+            route = "COMPARE" if "COMPARE" in intents else "LEGAL"
+        return RouteResult(route, 1.0 if route else 0.0, "keyword")
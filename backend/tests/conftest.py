@@ -0,0 +1,19 @@
+import os
+import tempfile
+
+# Settings obligatorios sin servicios reales: los tests no se conectan a Postgres ni a OpenAI
+for name, value in {
+    "POSTGRES_USER": "test",
+    "POSTGRES_PASSWORD": "test",
+    "POSTGRES_SERVER": "localhost",
+    "POSTGRES_PORT": "5432",
+    "POSTGRES_DB": "test",
+    "OPENAI_API_KEY": "sk-test",
+}.items():
+    os.environ.setdefault(name, value)
+
+# Sin modelos locales (BM42) ni caché en disco
+os.environ["ENABLE_HYBRID_SEARCH"] = "false"
+os.environ["ENABLE_EMBEDDING_CACHE"] = "false"
+# Marcador de versión del corpus fuera del repo
+os.environ["ANSWER_CACHE_CORPUS_MARKER"] = os.path.join(tempfile.mkdtemp(), "corpus_version")
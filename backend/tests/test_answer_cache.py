@@ -0,0 +1,36 @@
+from src.services import answer_cache
+from src.services.answer_cache import AnswerCache
+
+
+def make_cache(marker: str) -> AnswerCache:
+    return AnswerCache(max_entries=16, ttl_seconds=60, similarity_threshold=0.9, corpus_marker=marker)
+
+
+def test_similar_queries_about_another_insurer_miss(tmp_path):
+    cache = make_cache(str(tmp_path / "corpus_version"))
+    embedding = [1.0, 0.0, 0.2]
+    cache.put("¿Pacífico cubre robo de autopartes?", False, {"answer": "pacifico"}, embedding, {"insurer": ["Pacifico"]})
+
+    assert cache.get_similar(embedding, False, {"insurer": ["Rimac"]}) is None
+    assert cache.get_similar(embedding, False, {}) is None
+    assert cache.get_similar([1.0, 0.01, 0.2], False, {"insurer": ["Pacifico"]}) == {"answer": "pacifico"}
+
+
+def test_exact_hits_ignore_accents_and_punctuation(tmp_path):
+    cache = make_cache(str(tmp_path / "corpus_version"))
+    cache.put("¿Pacífico cubre robo?", False, {"answer": "pacifico"})
+    assert cache.get("pacifico cubre robo", False) == {"answer": "pacifico"}
+    assert cache.get("pacifico cubre robo", True) is None
+
+
+def test_ingestion_in_another_process_invalidates_the_cache(tmp_path, monkeypatch):
+    marker = str(tmp_path / "corpus_version")
+    monkeypatch.setattr(answer_cache.settings, "ANSWER_CACHE_CORPUS_MARKER", marker)
+    api_cache = make_cache(marker)
+    api_cache.put("¿Rimac cubre robo?", False, {"answer": "old"})
+    assert api_cache.get("¿Rimac cubre robo?", False) == {"answer": "old"}
+
+    # scripts/ingest.py no tiene el caché de la API: solo reescribe el marcador
+    monkeypatch.setattr(answer_cache, "_answer_cache", None)
+    answer_cache.invalidate_answer_cache()
+    assert api_cache.get("¿Rimac cubre robo?", False) is None
@@ -0,0 +1,81 @@
+import asyncio
+import threading
+
+import pytest
+from qdrant_client import AsyncQdrantClient
+
+from src.core import inference
+from src.core.config import settings
+from src.core.inference import InferenceExecutor
+from src.services import query_analyzer, rag_service, semantic_router
+from src.services.rag_service import RAGService
+from src.services.semantic_router import SemanticRouter
+
+
+class FakeModel:
+    def embed(self, texts):
+        raise AssertionError("the inference queue is full: the model must not run")
+
+
+@pytest.fixture
+def full_queue(monkeypatch):
+    """Executor de inferencia con su único lugar ocupado por una tarea que no termina hasta el final del test."""
+    executor = InferenceExecutor(max_workers=1, max_queue=0)
+    monkeypatch.setattr(inference, "_executor", executor)
+    release = threading.Event()
+
+    async def fill():
+        asyncio.create_task(executor.run("bm42", release.wait))
+        await asyncio.sleep(0.05)
+
+    class Registry:
+        async def aget(self, name):
+            return FakeModel()
+
+    monkeypatch.setattr(rag_service, "get_model_registry", lambda: Registry())
+    monkeypatch.setattr(semantic_router, "get_model_registry", lambda: Registry())
+    yield fill
+    release.set()
+    executor.shutdown()
+
+
+def test_retrieval_falls_back_to_dense_when_the_queue_is_full(full_queue, monkeypatch):
+    monkeypatch.setattr(settings, "ENABLE_HYBRID_SEARCH", True)
+    monkeypatch.setattr(settings, "EMBEDDING_DIMENSIONS", 4)
+    client = AsyncQdrantClient(location=":memory:")
+    monkeypatch.setattr(rag_service, "get_qdrant_client", lambda: client)
+    monkeypatch.setattr(query_analyzer, "get_qdrant_client", lambda: client)
+
+    async def scenario():
+        await client.create_collection(
+            settings.QDRANT_COLLECTION_NAME,
+            vectors_config={"dense": rag_service.models.VectorParams(size=4, distance=rag_service.models.Distance.COSINE)}
+        )
+        await client.upsert(settings.QDRANT_COLLECTION_NAME, points=[
+            rag_service.models.PointStruct(id=1, vector={"dense": [1.0, 0.0, 0.0, 0.0]}, payload={"content": "robo de autopartes"})
+        ])
+        service = RAGService()
+
+        async def dense(texts):
+            return [[1.0, 0.0, 0.0, 0.0] for _ in texts]
+
+        service.get_embeddings = dense
+        await full_queue()
+        return await service.retrieve_documents(["¿cubre robo de autopartes?"], fusion="rrf")
+
+    docs = asyncio.run(scenario())
+    assert [doc["content"] for doc in docs] == ["robo de autopartes"]
+
+
+def test_router_falls_back_to_keywords_when_the_queue_is_full(full_queue, monkeypatch):
+    monkeypatch.setattr(semantic_router, "_anchor_index", None)
+    monkeypatch.setattr(semantic_router, "get_qdrant_client", lambda: AsyncQdrantClient(location=":memory:"))
+
+    async def scenario():
+        await full_queue()
+        router = SemanticRouter(mode="semantic")
+        return await router.classify("holaa"), await router.classify("¿Cubre robo de espejos?")
+
+    greeting, question = asyncio.run(scenario())
+    assert (greeting.route, greeting.stage) == ("GREETING", "keyword")
+    assert (question.route, question.stage) == (None, "keyword")
@@ -0,0 +1,170 @@
+import asyncio
+import hashlib
+import os
+
+import pytest
+from pypdf import PdfWriter
+from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+from qdrant_client import AsyncQdrantClient
+
+import ingest
+from src.core.config import settings
+from src.services import ingestion_service
+from src.services.ingestion_service import IngestionService
+
+
+def write_pdf(path: str, pages: list[str]):
+    """PDF mínimo con una línea de texto (Helvetica) por página."""
+    writer = PdfWriter()
+    font = writer._add_object(DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+    }))
+    for text in pages:
+        page = writer.add_blank_page(612, 792)
+        page[NameObject("/Resources")] = DictionaryObject({
+            NameObject("/Font"): DictionaryObject({NameObject("/F1"): font})
+        })
+        content = DecodedStreamObject()
+        content.set_data(f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode("latin-1"))
+        page[NameObject("/Contents")] = writer._add_object(content)
+    with open(path, "wb") as f:
+        writer.write(f)
+
+
+class FakeEmbeddingsService(IngestionService):
+    """IngestionService sobre Qdrant en memoria y embeddings deterministas (sin OpenAI)."""
+
+    def __init__(self):
+        super().__init__()
+        self.fail_upserts = False
+
+    async def _create_embeddings(self, texts: list[str]) -> list[list[float]]:
+        vectors = []
+        for text in texts:
+            digest = hashlib.sha256(text.encode("utf-8")).digest()
+            vectors.append([b / 255 + 0.01 for b in digest] * (settings.EMBEDDING_DIMENSIONS // len(digest)))
+        return vectors
+
+    async def upsert_points(self, points):
+        if self.fail_upserts:
+            raise RuntimeError("qdrant unavailable")
+        await super().upsert_points(points)
+
+    async def stored_ids(self) -> set[str]:
+        records, _ = await self.qdrant.scroll(self.collection_name, limit=1000, with_payload=False)
+        return {str(r.id) for r in records}
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    folder = tmp_path / "rimac"
+    folder.mkdir()
+    return tmp_path, str(folder / "Rimac_Vehicular_2026_Condicionado_Plan Auto.pdf")
+
+
+async def run_pipeline(service: IngestionService, data_dir: str, manifest: dict) -> ingest.Pipeline:
+    pipeline = ingest.Pipeline(
+        ingestion_service=service,
+        extract_workers=1,
+        embed_workers=1,
+        upsert_batch_size=2,
+        queue_size=1,
+        data_dir=data_dir,
+        manifest=manifest
+    )
+    await pipeline.run(ingest.discover_pdfs(data_dir))
+    return pipeline
+
+
+def test_failed_upsert_keeps_previous_chunks(corpus, monkeypatch):
+    monkeypatch.setattr(settings, "EMBEDDING_DIMENSIONS", 64)
+    monkeypatch.setattr(ingestion_service, "get_qdrant_client", lambda: AsyncQdrantClient(location=":memory:"))
+    data_dir, pdf_path = corpus
+    rel_path = os.path.relpath(pdf_path, data_dir)
+
+    async def scenario():
+        service = FakeEmbeddingsService()
+
+        write_pdf(pdf_path, ["ARTICULO 1. Se cubre el robo total del vehiculo.", "ARTICULO 2. Se excluye la conduccion en estado de ebriedad."])
+        first = await run_pipeline(service, str(data_dir), {})
+        assert first.reports[pdf_path].status == "indexed"
+        old_ids = await service.stored_ids()
+        assert old_ids
+
+        # Nueva versión: ninguno de sus chunks coincide con los anteriores y los upserts fallan
+        write_pdf(pdf_path, ["ARTICULO 1. Se cubre el robo parcial de accesorios.", "ARTICULO 2. Se excluyen los danos por guerra."])
+        service.fail_upserts = True
+        second = await run_pipeline(service, str(data_dir), dict(first.manifest))
+        report = second.reports[pdf_path]
+
+        assert report.status == "failed"
+        assert report.deleted == 0
+        assert await service.stored_ids() == old_ids
+        # El manifest no avanza: la próxima corrida vuelve a procesar el archivo
+        assert second.manifest[rel_path]["sha256"] == first.manifest[rel_path]["sha256"]
+
+    asyncio.run(scenario())
+
+
+def test_point_batches_consume_pages_lazily(monkeypatch):
+    monkeypatch.setattr(settings, "EMBEDDING_DIMENSIONS", 64)
+    monkeypatch.setattr(ingestion_service, "get_qdrant_client", lambda: AsyncQdrantClient(location=":memory:"))
+    read = []
+
+    def pages():
+        for number in range(1, 201):
+            read.append(number)
+            yield number, f"ARTICULO {number}. Condicion particular numero {number} de la poliza.\n" * 20
+
+    async def scenario():
+        service = FakeEmbeddingsService()
+        document = ingestion_service.DocumentChunks()
+        metadata = {"source_file": "Rimac_Vehicular_2026_Condicionado_Grande.pdf", "insurer": "Rimac"}
+        sizes, pages_at_first_batch = [], None
+        async for points in service.iter_point_batches(pages(), metadata, document, batch_size=8):
+            sizes.append(len(points))
+            pages_at_first_batch = pages_at_first_batch or len(read)
+        return document, sizes, pages_at_first_batch
+
+    document, sizes, pages_at_first_batch = asyncio.run(scenario())
+    assert max(sizes) <= 8
+    assert sum(sizes) == len(document.chunk_ids)
+    # El primer lote sale antes de leer todo el documento
+    assert pages_at_first_batch < 200
+
+
+def test_clauses_differing_only_in_an_amount_are_both_indexed(monkeypatch):
+    monkeypatch.setattr(settings, "EMBEDDING_DIMENSIONS", 64)
+    monkeypatch.setattr(ingestion_service, "get_qdrant_client", lambda: AsyncQdrantClient(location=":memory:"))
+    clause = (
+        "ARTICULO 8. DEDUCIBLES. En caso de siniestro por robo total o parcial del vehiculo asegurado, "
+        "el asegurado asumira un deducible equivalente al {rate} del monto indemnizable, con un minimo "
+        "establecido en las condiciones particulares de la poliza. El deducible se aplicara a cada "
+        "reclamo presentado y no sera reembolsable bajo ninguna circunstancia. Para los vehiculos que "
+        "cuenten con dispositivo de rastreo vehicular instalado y operativo al momento del siniestro, "
+        "el deducible se aplicara conforme a lo indicado en el cuadro de deducibles vigente. La "
+        "compania no sera responsable por los danos causados cuando el conductor no cuente con licencia "
+        "de conducir vigente y de la categoria correspondiente al vehiculo asegurado."
+    )
+
+    async def scenario():
+        service = FakeEmbeddingsService()
+        stored = {}
+        for source_file, rate in (("Rimac_Vehicular_2026_Condicionado.pdf", "10%"), ("Pacifico_Vehicular_2026_Condicionado.pdf", "25%")):
+            document = ingestion_service.DocumentChunks()
+            metadata = {"source_file": source_file, "insurer": source_file.split("_")[0]}
+            async for points in service.iter_point_batches(clause.format(rate=rate), metadata, document):
+                await service.upsert_points(points)
+            await service.add_references(document.references)
+            stored[source_file] = document
+        records, _ = await service.qdrant.scroll(service.collection_name, limit=100, with_payload=True)
+        return stored, records
+
+    stored, records = asyncio.run(scenario())
+    assert not any(document.references for document in stored.values())
+    # Cada aseguradora tiene su propio punto, citado solo por ella
+    assert len(records) == 2
+    assert {r.payload["insurer"] for r in records} == {"Rimac", "Pacifico"}
+    assert all(len(r.payload["referenced_by"]) == 1 for r in records)
@@ -0,0 +1,51 @@
+import random
+import string
+
+import pytest
+
+from benchmark import route_linear, synthetic_patterns
+from src.services.keyword_matcher import KeywordMatcher
+from src.services.semantic_router import GREETING_ANCHORS, UNSAFE_ANCHORS
+
+
+def typo(rng: random.Random, text: str) -> str:
+    """Una o dos ediciones de un carácter (borrar, insertar, reemplazar o trasponer)."""
+    chars = list(text)
+    for _ in range(rng.randint(1, 2)):
+        pos = rng.randrange(len(chars))
+        edit = rng.choice(("delete", "insert", "replace", "swap"))
+        if edit == "delete" and len(chars) > 1:
+            del chars[pos]
+        elif edit == "insert":
+            chars.insert(pos, rng.choice(string.ascii_lowercase))
+        elif edit == "replace":
+            chars[pos] = rng.choice(string.ascii_lowercase)
+        elif pos + 1 < len(chars):
+            chars[pos], chars[pos + 1] = chars[pos + 1], chars[pos]
+    return "".join(chars)
+
+
+@pytest.mark.parametrize("extra_anchors", [0, 1000])
+def test_fuzzy_matches_the_linear_difflib_router(extra_anchors):
+    rng = random.Random(extra_anchors + 13)
+    unsafe = UNSAFE_ANCHORS + synthetic_patterns(extra_anchors)
+    matcher = KeywordMatcher({"GREETING": GREETING_ANCHORS, "UNSAFE": unsafe}, cutoff=0.8)
+    anchors = GREETING_ANCHORS + unsafe
+    words = " ".join(anchors).split()
+
+    queries = []
+    for _ in range(1500):
+        kind = rng.random()
+        if kind < 0.6:
+            queries.append(typo(rng, rng.choice(anchors)))
+        elif kind < 0.8:
+            # Fragmentos de anclas: comparten palabras pero no son ninguna
+            queries.append(" ".join(rng.sample(words, rng.randint(1, 3))))
+        else:
+            queries.append(typo(rng, rng.choice(words)))
+
+    mismatches = [
+        (query, expected, got) for query in queries
+        if (expected := route_linear(query, GREETING_ANCHORS, unsafe)) != (got := matcher.match(query))
+    ]
+    assert mismatches == []
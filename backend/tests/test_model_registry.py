@@ -0,0 +1,59 @@
+import asyncio
+import time
+
+from src.core import model_registry
+from src.core.model_registry import ModelEntry, ModelRegistry
+
+
+def registry_with(entry: ModelEntry) -> ModelRegistry:
+    registry = ModelRegistry()
+    registry._entries = {entry.name: entry}
+    return registry
+
+
+def test_aget_waits_for_a_load_in_progress_without_blocking_the_loop():
+    def slow_load():
+        time.sleep(0.3)
+        return "model"
+
+    registry = registry_with(ModelEntry("slow", slow_load, lambda model: None, True))
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticking = asyncio.create_task(ticker())
+        # Un warm-up carga el modelo en un thread y una request lo pide mientras tanto
+        warm_up = asyncio.create_task(registry.warm_up())
+        await asyncio.sleep(0.05)
+        model = await registry.aget("slow")
+        await warm_up
+        ticking.cancel()
+        return model, ticks
+
+    model, ticks = asyncio.run(scenario())
+    assert model == "model"
+    assert ticks >= 10
+    assert registry.ready()
+
+
+def test_warm_up_retries_failed_models(monkeypatch):
+    monkeypatch.setattr(model_registry.settings, "MODEL_WARMUP_RETRY_SECONDS", 0.01)
+    attempts = []
+
+    def flaky_load():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise OSError("model download failed")
+        return "model"
+
+    registry = registry_with(ModelEntry("flaky", flaky_load, lambda model: None, True))
+    asyncio.run(asyncio.wait_for(registry.warm_up(), timeout=5))
+    assert len(attempts) == 3
+    assert registry.ready()
+    assert registry.status()["flaky"]["status"] == "ready"
@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+
+from src.services import quote_service
+from src.services.quote_service import QuoteService
+
+
+@pytest.fixture(autouse=True)
+def catalog(monkeypatch):
+    monkeypatch.setattr(quote_service, "_vehicle_catalog", [("Toyota", "Yaris"), ("Kia", "Rio")])
+
+
+def parse(text: str):
+    return asyncio.run(QuoteService(db=None).parse_request(text))
+
+
+def test_parse_request_reads_driver_age():
+    request = parse("Cotiza un Toyota Yaris 2020, tengo 30 años")
+    assert (request.car_brand, request.car_model, request.car_year, request.age) == ("Toyota", "Yaris", 2020, 30)
+
+
+def test_parse_request_ignores_vehicle_age_next_to_driver_age():
+    request = parse("Quiero cotizar mi Yaris 2015, mi auto tiene 10 años y tengo 35")
+    assert request.age == 35
+
+
+def test_parse_request_falls_back_to_agent_on_conflicting_ages():
+    assert parse("Yaris 2015: mi auto tiene 10 años y mi hijo 19 años") is None
+    assert parse("Yaris 2015, tengo 35 o tengo 40") is None
+
+
+def test_parse_request_reads_age_tied_to_the_driver():
+    assert parse("Cotiza un Kia Rio 2019 para un conductor de 42 años").age == 42
+    assert parse("Kia Rio 2019, mi edad es 27").age == 27
+
+
+def test_parse_request_does_not_read_vehicle_age_as_driver_age():
+    assert parse("Cotiza mi Yaris 2014, el auto ya tiene 10 años") is None
+    assert parse("Cotiza mi Yaris 2014, tiene 12 años de uso") is None
+    assert parse("Yaris 2018, tengo 15 años manejando") is None
+
+
+def test_parse_request_rejects_out_of_range_ages():
+    assert parse("Cotiza un Yaris 2020, tengo 16 años") is None
+    assert parse("Cotiza un Yaris 2020, conductor de 10 años") is None
@@ -55,6 +55,7 @@ import { ChatService } from '@/app/services/chat.service';
                 <div class="source-tooltip invisible opacity-0 transition-all duration-200 absolute bottom-full left-0 mb-1 w-72 p-0 bg-popover text-popover-foreground text-[10px] rounded-md shadow-xl border border-border z-50 pointer-events-auto flex flex-col overflow-hidden">
                    <div class="p-2 border-b border-border/10 bg-muted/20">
                      <div class="font-semibold truncate text-primary">{{ source.title }}</div>
+                     <div *ngIf="source.pages" class="text-muted-foreground">Págs. {{ source.pages }}</div>
                    </div>
                    <div class="p-2 max-h-48 overflow-y-auto custom-scrollbar bg-card/50">
                      <p class="text-muted-foreground leading-relaxed whitespace-pre-wrap">{{ source.content }}</p>
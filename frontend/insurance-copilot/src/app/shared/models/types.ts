@@ -39,7 +39,7 @@ export interface Message {
     type?: 'text' | 'table' | 'quote' | 'analysis';
     data?: unknown;
   };
-  sources?: { title: string; content: string; score?: number }[];
+  sources?: { title: string; content: string; score?: number; pages?: string }[];
 }
 
 export interface ChatSession {
@@ -63,7 +63,7 @@ export interface ChatMessageResponse {
   timestamp: Date;
   analysisResult?: QueryAnalysis;
   comparisonResult?: ComparisonResult;
-  sources?: { title: string; content: string; score?: number }[];
+  sources?: { title: string; content: string; score?: number; pages?: string }[];
 }
 
 // ============ ANÁLISIS DE QUERY ============